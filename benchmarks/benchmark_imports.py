@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+# Import time budgets in seconds (best of several runs, without the start of the interpreter), about 1.5 times
+# the times measured when they were set; use --scale on slower machines. Every worker process and every short
+# run pays this time.
+IMPORT_BUDGETS = {
+    # The entry point only needs pandas, the plotting libraries are imported when plots are created
+    'main': 0.4,
+    'questionnaire_evaluation': 0.4,
+    'visualization': 0.8,
+    'pdf_generator': 0.8,
+}
+
+# Libraries that a run with --scores-only must not import
+PLOTTING_MODULES = ['matplotlib', 'networkx', 'fpdf']
+
+def import_seconds(module: str, repeat: int = 5) -> float:
+    """
+    Measures the time a fresh interpreter needs to start and import a module, minus the start of an empty interpreter.
+
+    Parameters:
+    - module (str): The module in src.
+    - repeat (int): Number of runs, the fastest run counts.
+
+    Returns:
+    - float: The import time in seconds.
+    """
+    def best(code):
+        times = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], check=True, cwd=SRC_DIR)
+            times.append(time.perf_counter() - start_time)
+        return min(times)
+
+    return max(best(f'import {module}') - best('pass'), 0.0)
+
+def scores_only_modules(work_dir: str) -> list:
+    """
+    Runs main.py --scores-only on a small synthetic export and returns the plotting libraries it imported.
+
+    Parameters:
+    - work_dir (str): Directory for the export and the outputs.
+
+    Returns:
+    - list: The names of the imported plotting libraries, empty if none was imported.
+    """
+    input_path = os.path.join(work_dir, 'export.csv')
+    subprocess.run(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generate_data.py'), input_path, '--participants', '10'],
+        check=True, stdout=subprocess.DEVNULL
+    )
+    code = (
+        "import sys, main\n"
+        f"sys.argv = ['main.py', '--input', {input_path!r}, '--output', {os.path.join(work_dir, 'outputs')!r}, '--scores-only', '--no-snapshot']\n"
+        "main.main()\n"
+        f"print('Imported:', *[name for name in {PLOTTING_MODULES!r} if name in sys.modules])\n"
+    )
+    result = subprocess.run([sys.executable, '-c', code], check=True, cwd=SRC_DIR, capture_output=True, text=True)
+    return result.stdout.strip().splitlines()[-1].split()[1:]
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures the import time of the pipeline modules and checks it against the budgets.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs per module, the fastest counts (default: 5)')
+    parser.add_argument('--scale', type=float, default=1.0, help='Factor for the budgets on slower or faster machines (default: 1)')
+    parser.add_argument('--output', help='Optional path of a JSON file for the results')
+    args = parser.parse_args()
+
+    results = {}
+    over_budget = []
+    print(f"{'Module':<26} {'Import (s)':>10} {'Budget (s)':>10}")
+    for module, budget in IMPORT_BUDGETS.items():
+        seconds = import_seconds(module, args.repeat)
+        results[module] = {'seconds': seconds, 'budget': budget * args.scale}
+        marker = '' if seconds <= budget * args.scale else '  over budget'
+        if marker:
+            over_budget.append(module)
+        print(f"{module:<26} {seconds:>10.3f} {budget * args.scale:>10.3f}{marker}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        loaded = scores_only_modules(work_dir)
+    results['scores_only_plotting_modules'] = loaded
+    print(f"Plotting libraries imported by --scores-only: {', '.join(loaded) if loaded else 'none'}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to: {args.output}")
+
+    if over_budget or loaded:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import argparse
+
+# The modules of the pipeline are imported from src, like in main.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from data_loader import load_data, default_engine
+
+def time_loader(filepath: str, repeat: int, **kwargs):
+    """
+    Loads a file several times and measures the fastest run.
+
+    Parameters:
+    - filepath (str): The path to the data file.
+    - repeat (int): Number of runs.
+    - kwargs: Arguments of load_data.
+
+    Returns:
+    - tuple: The fastest time in seconds and the loaded data.
+    """
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        data = load_data(filepath, **kwargs)
+        seconds = time.perf_counter() - start_time
+        best = seconds if best is None else min(best, seconds)
+    return best, data
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares the default and the fast mode of load_data.')
+    parser.add_argument('filepath', help='SoSci Survey export (;-delimited, ISO-8859-1)')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per loader, the fastest counts (default: 3)')
+    args = parser.parse_args()
+
+    size = os.path.getsize(args.filepath) / 1e6
+    print(f"{args.filepath}: {size:.1f} MB")
+
+    loaders = [('default', {'fast': False}), ('fast', {'fast': True})]
+    # Also measure the fast mode with the C engine if pyarrow is used by default
+    if default_engine() == 'pyarrow':
+        loaders.append(('fast (C engine)', {'fast': True, 'engine': 'c'}))
+
+    baseline = None
+    for name, kwargs in loaders:
+        seconds, data = time_loader(args.filepath, args.repeat, **kwargs)
+        memory = data.memory_usage(deep=True).sum() / 1e6
+        baseline = seconds if baseline is None else baseline
+        print(f"{name:<16} {seconds:8.3f} s  {size / seconds:8.1f} MB/s  {baseline / seconds:5.1f}x  {len(data)} rows, {len(data.columns)} columns, {memory:.1f} MB in memory")
+
+if __name__ == '__main__':
+    main()
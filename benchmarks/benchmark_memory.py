@@ -0,0 +1,170 @@
+import os
+import io
+import sys
+import json
+import tempfile
+import argparse
+import tracemalloc
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# The modules of the pipeline are imported from src, like in main.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import matplotlib
+matplotlib.use('Agg')
+
+from generate_data import generate_export, write_export
+from data_loader import load_data
+from preprocessing import preprocess_data, TOPIC_FLAG_COLUMNS
+from questionnaire_evaluation import evaluation
+from visualization import ParticipantIndex, render_participant, DEFAULT_CHARTS
+from image_writer import ImageWriter
+
+# Allowed growth of the resident memory in MB after the warm-up; about 25 MB were measured when it was set
+# (fonts, templates and layouts are cached during the warm-up, afterwards the memory should stay flat
+# apart from the larger figures of the longer spans)
+MEMORY_BUDGET_MB = 50
+
+# Range of the diary days and share of the missed days of the synthetic participants; the spans vary,
+# because the charts keep per-span state (e.g. a template per number of study days) that must stay bounded
+MIN_DIARY_DAYS = 7
+MAX_DIARY_DAYS = 42
+SKIP_RATE = 0.2
+
+def current_memory_mb(traced: bool) -> float:
+    """
+    Returns the memory currently used by the process.
+
+    Parameters:
+    - traced (bool): Return the memory allocated by Python and NumPy (tracemalloc has to be running)
+      instead of the resident memory.
+
+    Returns:
+    - float: The memory in MB.
+    """
+    if traced:
+        return tracemalloc.get_traced_memory()[0] / 1e6
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+
+def render_memory(participants: int, charts: list, threads: int, interval: int, traced: bool, seed: int = 0,
+                  min_days: int = MIN_DIARY_DAYS, max_days: int = MAX_DIARY_DAYS, skip_rate: float = SKIP_RATE) -> list:
+    """
+    Renders the charts of a synthetic cohort into memory and samples the memory of the process.
+
+    Parameters:
+    - participants (int): Number of participants.
+    - charts (list): Names of the charts.
+    - threads (int): Number of threads that render participants at the same time.
+    - interval (int): Number of participants between two samples.
+    - traced (bool): Also sample the memory allocated by Python and NumPy.
+    - seed (int): Seed of the synthetic export.
+    - min_days (int): Minimum number of diary days of a participant.
+    - max_days (int): Maximum number of diary days of a participant.
+    - skip_rate (float): Share of the diary days without an entry.
+
+    Returns:
+    - list: The (rendered participants, resident memory in MB, traced memory in MB) samples, the resident
+      memory is None where it cannot be read and the traced memory None if traced is False.
+    """
+    with tempfile.TemporaryDirectory() as work_dir, contextlib.redirect_stdout(io.StringIO()):
+        input_path = os.path.join(work_dir, 'export.csv')
+        write_export(generate_export(participants, max_days, skip_rate=skip_rate, seed=seed, min_days=min_days), input_path)
+        data = evaluation(preprocess_data(load_data(input_path)))
+    index = ParticipantIndex(data)
+    topics_columns = list(TOPIC_FLAG_COLUMNS)
+    # One writer per thread would also work, the images are encoded in the rendering thread here
+    writer = ImageWriter(threads=0)
+
+    def render(unique_id):
+        # The images are dropped, only the memory of rendering counts
+        render_participant(index, unique_id, topics_columns, None, charts, in_memory=True, writer=writer)
+
+    resident = os.path.exists('/proc/self/statm')
+
+    def sample(rendered):
+        return (rendered, current_memory_mb(False) if resident else None, current_memory_mb(True) if traced else None)
+
+    # From the shortest to the longest span, so that new spans keep coming after the warm-up
+    # and state that is kept per span grows until the end instead of only during the warm-up
+    serials = sorted(index.serials, key=lambda unique_id: len(index.days(unique_id)))
+
+    if traced:
+        tracemalloc.start()
+    samples = [sample(0)]
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for rendered, _ in enumerate(executor.map(render, serials), start=1):
+                if rendered % interval == 0 or rendered == len(index):
+                    samples.append(sample(rendered))
+                    print(f"{rendered:>8} participants" + ''.join(f" {mb:>10.1f} MB" for mb in samples[-1][1:] if mb is not None))
+    finally:
+        if traced:
+            tracemalloc.stop()
+    return samples
+
+def memory_growth(samples: list, warmup: float, column: int = 1) -> tuple:
+    """
+    Calculates how much the memory grew after the warm-up.
+
+    Parameters:
+    - samples (list): The samples of render_memory.
+    - warmup (float): Fraction of the participants that belong to the warm-up.
+    - column (int): Position of the memory in the samples, 1 for the resident and 2 for the traced memory.
+
+    Returns:
+    - tuple: The growth in MB from the end of the warm-up to the maximum afterwards, and the slope of
+      a linear fit in MB per 1000 participants.
+    """
+    total = samples[-1][0]
+    after = [(sample[0], sample[column]) for sample in samples if sample[0] >= warmup * total]
+    if len(after) < 2:
+        return 0.0, 0.0
+    counts, memory = np.array(after, dtype=float).T
+    return float(memory.max() - memory[0]), float(np.polyfit(counts, memory, 1)[0] * 1000)
+
+def main():
+    parser = argparse.ArgumentParser(description='Renders the charts of a synthetic cohort and checks that the memory stays flat.')
+    parser.add_argument('--participants', type=int, default=10000, help='Number of participants (default: 10000)')
+    parser.add_argument('--charts', nargs='+', default=DEFAULT_CHARTS, help='Charts to render (default: the charts of create_visualizations)')
+    parser.add_argument('--threads', type=int, default=1, help='Number of threads that render participants at the same time (default: 1)')
+    parser.add_argument('--interval', type=int, default=250, help='Number of participants between two samples (default: 250)')
+    parser.add_argument('--warmup', type=float, default=0.1, help='Fraction of the participants ignored at the start (default: 0.1)')
+    parser.add_argument('--min-days', type=int, default=MIN_DIARY_DAYS, help=f'Minimum number of diary days of a participant (default: {MIN_DIARY_DAYS})')
+    parser.add_argument('--max-days', type=int, default=MAX_DIARY_DAYS, help=f'Maximum number of diary days of a participant (default: {MAX_DIARY_DAYS})')
+    parser.add_argument('--skip-rate', type=float, default=SKIP_RATE, help=f'Share of the diary days without an entry (default: {SKIP_RATE})')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='Also sample the memory allocated by Python and NumPy (slower)')
+    parser.add_argument('--budget', type=float, default=MEMORY_BUDGET_MB,
+                        help=f'Allowed growth in MB after the warm-up (default: {MEMORY_BUDGET_MB})')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic export (default: 0)')
+    parser.add_argument('--output', help='Optional path of a JSON file for the results')
+    args = parser.parse_args()
+
+    # The resident memory is read from /proc, elsewhere only the traced memory can be sampled
+    resident = os.path.exists('/proc/self/statm')
+    traced = args.tracemalloc or not resident
+    samples = render_memory(args.participants, args.charts, args.threads, args.interval, traced, args.seed,
+                            args.min_days, args.max_days, args.skip_rate)
+    growths = {}
+    for kind, column, sampled in [('resident', 1, resident), ('traced', 2, traced)]:
+        if sampled:
+            growth, slope = memory_growth(samples, args.warmup, column)
+            growths[kind] = {'growth_mb': growth, 'slope_mb_per_1000': slope}
+            print(f"Growth of the {kind} memory after the warm-up: {growth:.1f} MB (budget {args.budget:.0f} MB), {slope:.2f} MB per 1000 participants")
+    # The budget is checked on the resident memory, it also covers the figures and buffers of matplotlib
+    # that tracemalloc does not see
+    checked = 'resident' if resident else 'traced'
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'memory': checked, 'samples': samples, **growths[checked], 'growth': growths, 'budget_mb': args.budget}, f, indent=2)
+        print(f"Results saved to: {args.output}")
+
+    if growths[checked]['growth_mb'] > args.budget:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import os
+import io
+import sys
+import json
+import time
+import tempfile
+import argparse
+import tracemalloc
+import contextlib
+
+# The modules of the pipeline are imported from src, like in main.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import matplotlib
+matplotlib.use('Agg')
+
+from generate_data import generate_export, write_export
+from data_loader import load_data
+from preprocessing import preprocess_data, TOPIC_FLAG_COLUMNS
+from questionnaire_evaluation import evaluation
+from topics import topic_counts
+from visualization import ParticipantIndex, render_participant, CHARTS
+from pdf_generator import create_reports, report_file_path, REPORT_BACKENDS
+
+def measure(function, memory: bool = True):
+    """
+    Runs a stage and measures its time and, in a second run, the peak of the memory allocated by Python and NumPy.
+
+    Parameters:
+    - function (callable): The stage, without arguments.
+    - memory (bool): Measure the memory (runs the stage twice, the time is taken from the run without tracing).
+
+    Returns:
+    - tuple: The result of the stage, the time in seconds and the peak memory in MB (None if not measured).
+    """
+    # The stages print progress messages, which would hide the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start_time
+
+        peak = None
+        if memory:
+            tracemalloc.start()
+            try:
+                function()
+                peak = tracemalloc.get_traced_memory()[1] / 1e6
+            finally:
+                tracemalloc.stop()
+    return result, seconds, peak
+
+def benchmark(participants: int, work_dir: str, sample: int, memory: bool = True, seed: int = 0) -> list:
+    """
+    Benchmarks every stage of the pipeline on a synthetic export.
+
+    The data stages run on all participants, the chart and PDF stages on a sample of participants;
+    their time is also given per participant. The PDF stage runs once per report backend and also records
+    the mean file size of the reports.
+
+    Parameters:
+    - participants (int): Number of participants of the export.
+    - work_dir (str): Directory for the export and the outputs.
+    - sample (int): Number of participants for the chart and PDF stages.
+    - memory (bool): Measure the peak memory of every stage.
+    - seed (int): Seed of the synthetic export.
+
+    Returns:
+    - list: One dictionary per stage with the stage name, participants, seconds, seconds per participant, peak MB
+      and, for the PDF stages, the mean report size in kB.
+    """
+    input_path = os.path.join(work_dir, f'export_{participants}.csv')
+    output_dir = os.path.join(work_dir, f'outputs_{participants}')
+    os.makedirs(output_dir, exist_ok=True)
+    write_export(generate_export(participants, seed=seed), input_path)
+
+    results = []
+
+    def record(stage, n, seconds, peak, report_kb=None):
+        results.append({
+            'stage': stage, 'participants': n, 'seconds': seconds,
+            'seconds_per_participant': seconds / n if n else None, 'peak_mb': peak, 'report_kb': report_kb,
+        })
+
+    data, seconds, peak = measure(lambda: load_data(input_path, fast=True), memory)
+    record('load', participants, seconds, peak)
+
+    processed, seconds, peak = measure(lambda: preprocess_data(data), memory)
+    record('preprocess', participants, seconds, peak)
+
+    evaluated, seconds, peak = measure(lambda: evaluation(processed.copy()), memory)
+    record('evaluate', participants, seconds, peak)
+
+    topics_columns = list(TOPIC_FLAG_COLUMNS)
+    _, seconds, peak = measure(lambda: topic_counts(evaluated, topics_columns), memory)
+    record('topic counts', participants, seconds, peak)
+
+    index, seconds, peak = measure(lambda: ParticipantIndex(evaluated), memory)
+    record('index', participants, seconds, peak)
+
+    sample_ids = index.serials[:sample]
+    sample_index = ParticipantIndex(index.take(sample_ids))
+    for chart in CHARTS:
+        def render_chart():
+            for unique_id in sample_ids:
+                render_participant(sample_index, unique_id, topics_columns, output_dir, [chart])
+        _, seconds, peak = measure(render_chart, memory)
+        record(f'chart {chart}', len(sample_ids), seconds, peak)
+
+    for backend in REPORT_BACKENDS:
+        _, seconds, peak = measure(lambda: create_reports(sample_index.data, topics_columns, output_dir, backend=backend), memory)
+        sizes = [os.path.getsize(report_file_path(output_dir, unique_id)) for unique_id in sample_ids]
+        record(f'pdf {backend}', len(sample_ids), seconds, peak, sum(sizes) / len(sizes) / 1e3 if sizes else None)
+
+    return results
+
+def print_results(participants: int, results: list):
+    """
+    Prints the results of one export size as table.
+
+    Parameters:
+    - participants (int): Number of participants of the export.
+    - results (list): The results of benchmark.
+    """
+    print(f"\n{participants} participants")
+    print(f"{'Stage':<26} {'Participants':>12} {'Time (s)':>10} {'ms/participant':>15} {'Peak (MB)':>10} {'Report (kB)':>12}")
+    for result in results:
+        per_participant = result['seconds_per_participant'] * 1000 if result['seconds_per_participant'] is not None else float('nan')
+        peak = f"{result['peak_mb']:10.1f}" if result['peak_mb'] is not None else f"{'-':>10}"
+        report_kb = f"{result['report_kb']:12.1f}" if result['report_kb'] is not None else f"{'-':>12}"
+        print(f"{result['stage']:<26} {result['participants']:>12} {result['seconds']:>10.3f} {per_participant:>15.2f} {peak} {report_kb}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks every stage of the pipeline on synthetic exports of several sizes.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                        help='Numbers of participants of the exports (default: 100 1000 10000)')
+    parser.add_argument('--sample', type=int, default=100,
+                        help='Number of participants for the chart and PDF stages (default: 100)')
+    parser.add_argument('--no-memory', action='store_true', help='Only measure the time')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic exports (default: 0)')
+    parser.add_argument('--output', help='Optional path of a JSON file for the results')
+    args = parser.parse_args()
+
+    all_results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for participants in args.sizes:
+            results = benchmark(participants, work_dir, args.sample, memory=not args.no_memory, seed=args.seed)
+            print_results(participants, results)
+            all_results[participants] = results
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(all_results, f, indent=2)
+        print(f"\nResults saved to: {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+from functools import partial
+import numpy as np
+
+# The modules of the pipeline are imported from src, like in main.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from generate_data import generate_export, write_export
+from questionnaire_evaluation import score_columns
+from data_snapshot import DataSnapshot
+from main import load_and_evaluate, load_and_evaluate_tail
+
+def scores(data) -> np.ndarray:
+    """
+    Returns the scores of the data sorted by participant and time, to compare data that was built in different ways.
+
+    Parameters:
+    - data (pd.DataFrame): The evaluated data.
+
+    Returns:
+    - np.ndarray: The scores of every entry.
+    """
+    order = np.lexsort((data['STARTED'].to_numpy(), data['SERIAL'].astype(str).to_numpy()))
+    columns = [column for column in score_columns() if column in data.columns]
+    return data[columns].to_numpy(dtype=float, na_value=np.nan)[order]
+
+def edit_middle(input_path: str):
+    """
+    Changes one answer of the entry in the middle of the export without changing the size of the file,
+    like a re-export that corrected an answer.
+
+    Parameters:
+    - input_path (str): The path to the export.
+    """
+    with open(input_path, 'rb') as f:
+        lines = f.read().split(b'\n')
+    # The first entry from the middle on whose first MDBF item was answered (a single digit from 1 to 7)
+    line = next(i for i in range(len(lines) // 2, len(lines)) if len(lines[i].split(b';')[6]) == 1)
+    fields = lines[line].split(b';')
+    fields[6] = str(int(fields[6]) % 7 + 1).encode()
+    lines[line] = b';'.join(fields)
+    with open(input_path, 'wb') as f:
+        f.write(b'\n'.join(lines))
+
+def split_export(input_path: str, share: float) -> bytes:
+    """
+    Cuts the last rows off the export, so that they can be appended later.
+
+    Parameters:
+    - input_path (str): The path to the export.
+    - share (float): Share of the bytes that stay in the export, cut at the end of a row.
+
+    Returns:
+    - bytes: The rows that were cut off.
+    """
+    with open(input_path, 'rb') as f:
+        content = f.read()
+    cut = content.index(b'\n', int(len(content) * share)) + 1
+    with open(input_path, 'wb') as f:
+        f.write(content[:cut])
+    return content[cut:]
+
+def append_rows(input_path: str, rows: bytes):
+    """
+    Appends rows to the export, like the survey platform does.
+
+    Parameters:
+    - input_path (str): The path to the export.
+    - rows (bytes): The rows.
+    """
+    with open(input_path, 'ab') as f:
+        f.write(rows)
+
+def check_snapshot(participants: int, work_dir: str, seed: int = 0) -> dict:
+    """
+    Builds snapshots of a synthetic export, changes the export in the ways a re-export or the survey platform
+    does and checks that the snapshot delivers the same scores as a run without snapshot.
+
+    Parameters:
+    - participants (int): Number of participants of the export.
+    - work_dir (str): Directory for the export and the snapshots.
+    - seed (int): Seed of the synthetic export.
+
+    Returns:
+    - dict: For every case the seconds of the snapshot run, whether the snapshot was merged, rebuilt or
+      loaded, and whether the scores match.
+    """
+    input_path = os.path.join(work_dir, 'export.csv')
+    write_export(generate_export(participants, seed=seed), input_path)
+    results = {}
+
+    def run(case, snapshot_dir, incremental, expected):
+        snapshot = DataSnapshot(input_path, os.path.join(work_dir, snapshot_dir))
+        output = io.StringIO()
+        start_time = time.perf_counter()
+        with contextlib.redirect_stdout(output):
+            if incremental:
+                data, _ = snapshot.load_or_update(partial(load_and_evaluate_tail, input_path))
+            else:
+                data = snapshot.load_or_build(partial(load_and_evaluate, input_path))
+        seconds = time.perf_counter() - start_time
+        with contextlib.redirect_stdout(io.StringIO()):
+            reference = load_and_evaluate(input_path)
+        printed = output.getvalue()
+        used = 'merged' if 'Merged' in printed else 'loaded' if 'loaded from snapshot' in printed else 'rebuilt'
+        matches = bool(np.array_equal(scores(data), scores(reference), equal_nan=True))
+        results[case] = {'seconds': seconds, 'snapshot': used, 'expected': expected, 'matches': matches}
+        print(f"{case:<36} {seconds:>8.3f} {used:>8} {expected:>9} {'yes' if matches else 'NO':>8}")
+
+    print(f"{'Case':<36} {'Time (s)':>8} {'Snapshot':>8} {'Expected':>9} {'Matches':>8}")
+    run('build', 'full', False, 'rebuilt')
+    os.utime(input_path)
+    run('touched', 'full', False, 'loaded')
+    edit_middle(input_path)
+    run('edited in the middle', 'full', False, 'rebuilt')
+
+    rows = split_export(input_path, 0.7)
+    run('incremental build', 'incremental', True, 'rebuilt')
+    appended = rows[:len(rows) // 2]
+    appended = appended[:appended.rindex(b'\n') + 1]
+    append_rows(input_path, appended)
+    run('appended', 'incremental', True, 'merged')
+    edit_middle(input_path)
+    append_rows(input_path, rows[len(appended):])
+    run('edited in the middle, then appended', 'incremental', True, 'rebuilt')
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks that the data snapshot notices every change of the export and measures its time.')
+    parser.add_argument('--participants', type=int, default=1000, help='Number of participants of the export (default: 1000)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic export (default: 0)')
+    parser.add_argument('--output', help='Optional path of a JSON file for the results')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = check_snapshot(args.participants, work_dir, args.seed)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to: {args.output}")
+
+    failed = [case for case, result in results.items() if not result['matches'] or result['snapshot'] != result['expected']]
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import os
+import sys
+import csv
+import argparse
+import numpy as np
+import pandas as pd
+
+# The modules of the pipeline are imported from src, like in main.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from data_loader import DATE_FORMAT
+from preprocessing import MISSING_CODE
+
+# Item codes of the SoSci Survey export and the range of their answers
+LIKERT_ITEMS = (
+    [(f'MB01_{i:02d}', 1, 7) for i in range(1, 7)]
+    + [(f'PS01_{i:02d}', 1, 5) for i in range(1, 5)]
+    + [(f'SC01_{i:02d}', 1, 7) for i in range(1, 3)]
+)
+TOPIC_ITEMS = [f'TP01_{i:02d}' for i in range(1, 12)]
+
+def generate_export(participants: int, days: int = 14, missing_rate: float = 0.03, skip_rate: float = 0.0,
+                    seed: int = 0, start: str = '2024-04-01', min_days: int = None) -> pd.DataFrame:
+    """
+    Generates a synthetic diary export in the format of the SoSci Survey export of the study.
+
+    Every participant answers once a day at a random time between 7:00 and 22:00. The answers vary around
+    a personal baseline and every participant has personal topic preferences.
+
+    Parameters:
+    - participants (int): Number of participants.
+    - days (int): Number of days of the diary.
+    - missing_rate (float): Share of the items that were not answered (code -9).
+    - skip_rate (float): Share of the days without an answer.
+    - seed (int): Seed of the random numbers.
+    - start (str): First day of the diary of the first participant.
+    - min_days (int): Optional minimum number of days of the diary, then every participant gets a random
+      number of days between min_days and days instead of days.
+
+    Returns:
+    - pd.DataFrame: The export with the columns of the SoSci Survey export.
+    """
+    rng = np.random.default_rng(seed)
+    n_days = rng.integers(min_days, days + 1, participants) if min_days is not None else np.full(participants, days)
+    n_rows = int(n_days.sum())
+    participant = np.repeat(np.arange(participants), n_days)
+    day = np.arange(n_rows) - np.repeat(np.cumsum(n_days) - n_days, n_days)
+
+    # The participants start on different days of the first four weeks
+    start_day = rng.integers(0, 28, participants)[participant]
+    minutes = rng.integers(7 * 60, 22 * 60, n_rows)
+    started = pd.Timestamp(start) + pd.to_timedelta(start_day + day, unit='D') + pd.to_timedelta(minutes, unit='min')
+
+    data = {
+        'CASE': np.arange(1, n_rows + 1),
+        'SERIAL': np.array([f'P{i:05d}' for i in range(participants)], dtype=object)[participant],
+        'REF': 'jam-step',
+        'QUESTNNR': 'diary',
+        'MODE': 'interview',
+        'STARTED': started.strftime(DATE_FORMAT),
+    }
+
+    for item, low, high in LIKERT_ITEMS:
+        baseline = rng.normal((low + high) / 2, (high - low) / 6, participants)[participant]
+        answers = np.clip(np.rint(baseline + rng.normal(0, 1, n_rows)), low, high).astype(int)
+        answers[rng.random(n_rows) < missing_rate] = MISSING_CODE
+        data[item] = answers
+
+    # Topics are selected with a personal probability, 2 is selected and 1 not selected
+    preferences = rng.beta(1, 3, (participants, len(TOPIC_ITEMS)))
+    selected = rng.random((n_rows, len(TOPIC_ITEMS))) < preferences[participant]
+    data['TP01'] = selected.sum(axis=1)
+    for i, item in enumerate(TOPIC_ITEMS):
+        data[item] = np.where(selected[:, i], 2, 1)
+
+    export = pd.DataFrame(data)
+    if skip_rate > 0:
+        export = export[rng.random(n_rows) >= skip_rate].reset_index(drop=True)
+    return export
+
+def write_export(export: pd.DataFrame, filepath: str):
+    """
+    Writes an export like SoSci Survey: ;-delimited, ISO-8859-1 encoded and with quoted text.
+
+    Parameters:
+    - export (pd.DataFrame): The export, see generate_export.
+    - filepath (str): The path to the data file.
+    """
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+    export.to_csv(filepath, sep=';', encoding='ISO-8859-1', index=False, quoting=csv.QUOTE_NONNUMERIC)
+
+def main():
+    parser = argparse.ArgumentParser(description='Writes a synthetic SoSci Survey export for testing and benchmarks.')
+    parser.add_argument('filepath', help='Path of the export, e.g. data/data.csv')
+    parser.add_argument('--participants', type=int, default=100, help='Number of participants (default: 100)')
+    parser.add_argument('--days', type=int, default=14, help='Number of days of the diary (default: 14)')
+    parser.add_argument('--min-days', type=int,
+                        help='Minimum number of days of the diary, every participant gets a random number of days up to --days (default: all get --days)')
+    parser.add_argument('--missing-rate', type=float, default=0.03, help='Share of the items that were not answered (default: 0.03)')
+    parser.add_argument('--skip-rate', type=float, default=0.0, help='Share of the days without an answer (default: 0)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random numbers (default: 0)')
+    args = parser.parse_args()
+
+    export = generate_export(args.participants, args.days, args.missing_rate, args.skip_rate, args.seed, min_days=args.min_days)
+    write_export(export, args.filepath)
+    print(f"Export with {len(export)} rows of {args.participants} participants saved to: {args.filepath}")
+
+if __name__ == '__main__':
+    main()
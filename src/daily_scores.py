@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+from preprocessing import TOPIC_MASK_COLUMN
+
+# Scores of the time-series charts, the columns of the score array
+DAILY_SCORES = ['MDBF_Valence_Score', 'MDBF_Arousal_Score', 'MDBF_Calmness_Score', 'PSS4_Score']
+
+class ParticipantDays:
+    """
+    The study days of one participant, from the first to the last day with an entry.
+
+    Parameters:
+    - dates (pd.DatetimeIndex): The dates of the study days.
+    - values (np.ndarray): The mean scores of the entries with one row per study day and one column per score in DAILY_SCORES, NaN on missed days.
+    - masks (np.ndarray): The topic mask (see TOPIC_MASK_COLUMN) of the entries of every study day combined, 0 on missed days.
+    - answered (np.ndarray): True for the study days with an entry.
+    """
+
+    def __init__(self, dates: pd.DatetimeIndex, values: np.ndarray, masks: np.ndarray, answered: np.ndarray):
+        self.dates = dates
+        self.values = values
+        self.masks = masks
+        self.answered = answered
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def scores(self, columns) -> np.ndarray:
+        """
+        Returns some of the scores.
+
+        Parameters:
+        - columns (str or list): One score (a column of DAILY_SCORES) or a list of scores.
+
+        Returns:
+        - np.ndarray: The score per study day, or for a list one row per study day and one column per score.
+        """
+        if isinstance(columns, str):
+            return self.values[:, DAILY_SCORES.index(columns)]
+        return self.values[:, [DAILY_SCORES.index(column) for column in columns]]
+
+class DailyScores:
+    """
+    Arrays of the scores of all participants with one row per study day and one column per score, built once
+    for the time-series charts instead of slicing and pivoting the rows of every participant. The study days
+    of all participants are stored one after the other, each participant from its offset on, so the arrays
+    grow with the study days of every participant instead of the longest participant times all participants.
+
+    The study day of an entry is the number of days since the first day with an entry of the participant
+    (from the calendar date of STARTED), so missed days are NaN in the arrays and a protocol with more or
+    fewer days than planned gets as many days as it covers. If a participant has several entries on the same
+    day, all of them count: the scores of the day are their means (scores that are missing in an entry are
+    left out) and the topics of the day are the topics of any of them, like the pie chart counts every entry.
+    Entries without SERIAL or STARTED are left out.
+
+    Parameters:
+    - data (pd.DataFrame): The evaluated data of one or more participants, with STARTED as datetime.
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        started = data['STARTED'].to_numpy(dtype='datetime64[ns]')
+        codes, serials = pd.factorize(data['SERIAL'], sort=True)
+        valid = (codes >= 0) & ~np.isnat(started)
+        # Sorted by participant and time, so the entries of a day are next to each other
+        order = np.flatnonzero(valid)[np.lexsort((started[valid], codes[valid]))]
+        codes = codes[order]
+        dates = started[order].astype('datetime64[D]')
+
+        n_participants = len(serials)
+        self.first_days = np.full(n_participants, np.datetime64('NaT'), dtype='datetime64[D]')
+        self.n_days = np.zeros(n_participants, dtype=np.int64)
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) > 0 else np.array([], dtype=int)
+        if len(starts) > 0:
+            self.first_days[codes[starts]] = dates[starts]
+        days = (dates - self.first_days[codes]).astype(np.int64)
+        if len(days) > 0:
+            np.maximum.at(self.n_days, codes, days + 1)
+
+        # The first of the sorted entries of every participant and day, the entries of the day are combined
+        first = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]) | (days[1:] != days[:-1])]) if len(codes) > 0 else np.array([], dtype=int)
+
+        # Row of the first study day of every participant
+        self.offsets = np.r_[0, np.cumsum(self.n_days)[:-1]] if n_participants > 0 else np.zeros(0, dtype=np.int64)
+        total = int(self.n_days.sum())
+        positions = self.offsets[codes[first]] + days[first]
+        self.values = np.full((total, len(DAILY_SCORES)), np.nan)
+        self.masks = np.zeros(total, dtype=np.uint16)
+        self.answered = np.zeros(total, dtype=bool)
+        self.answered[positions] = True
+        if len(first) > 0:
+            scores = data[DAILY_SCORES].to_numpy(dtype=float, na_value=np.nan)[order]
+            has_score = ~np.isnan(scores)
+            sums = np.add.reduceat(np.where(has_score, scores, 0), first)
+            counts = np.add.reduceat(has_score.astype(np.int64), first)
+            with np.errstate(invalid='ignore'):
+                # 0 / 0 leaves a score that is missing in all entries of the day NaN
+                self.values[positions] = sums / counts
+            if TOPIC_MASK_COLUMN in data.columns:
+                self.masks[positions] = np.bitwise_or.reduceat(data[TOPIC_MASK_COLUMN].to_numpy(dtype=np.uint16)[order], first)
+
+        self.positions = {unique_id: i for i, unique_id in enumerate(serials)}
+
+    def participant(self, unique_id: str) -> ParticipantDays:
+        """
+        Returns the study days of one participant, views into the arrays.
+
+        Parameters:
+        - unique_id (str): The SERIAL of the participant.
+
+        Returns:
+        - ParticipantDays: The study days, empty if the participant has no entry with STARTED.
+        """
+        if unique_id not in self.positions:
+            return ParticipantDays(pd.DatetimeIndex([]), np.empty((0, len(DAILY_SCORES))), np.empty(0, dtype=np.uint16), np.empty(0, dtype=bool))
+        i = self.positions[unique_id]
+        n_days = self.n_days[i]
+        dates = pd.DatetimeIndex(self.first_days[i] + np.arange(n_days))
+        rows = slice(self.offsets[i], self.offsets[i] + n_days)
+        return ParticipantDays(dates, self.values[rows], self.masks[rows], self.answered[rows])
@@ -1,13 +1,59 @@
+import io
 import pandas as pd
 import os
-from datetime import datetime
+from preprocessing import COLUMN_RENAME_DICT
 
-def load_data(filepath: str) -> pd.DataFrame:
+# Format of the STARTED column in the SoSci Survey export
+DATE_FORMAT = '%d.%m.%Y %H:%M'
+
+# Columns of the export that are used by preprocess_data and the questionnaire evaluation
+ID_COLUMNS = ['SERIAL', 'REF', 'QUESTNNR', 'MODE']
+USED_COLUMNS = ID_COLUMNS + ['STARTED'] + list(COLUMN_RENAME_DICT)
+
+# Compact data types of the used columns: the codes are repeated for every row, the items are small
+# numbers (float, so that empty answers can be NaN)
+COLUMN_DTYPES = {
+    'SERIAL': str,
+    'REF': 'category',
+    'QUESTNNR': 'category',
+    'MODE': 'category',
+    'STARTED': str,
+    **{column: 'float32' for column in COLUMN_RENAME_DICT},
+}
+
+def _pyarrow_available() -> bool:
+    """
+    Checks if the pyarrow CSV engine can be used.
+
+    Returns:
+    - bool: True if pyarrow is installed.
+    """
+    try:
+        import pyarrow
+        return True
+    except ImportError:
+        return False
+
+def default_engine() -> str:
+    """
+    Returns the CSV engine of the fast mode of load_data: pyarrow if it is installed, otherwise the C engine.
+
+    Returns:
+    - str: The engine name for pd.read_csv.
+    """
+    return 'pyarrow' if _pyarrow_available() else 'c'
+
+def load_data(filepath: str, fast: bool = False, engine: str = None) -> pd.DataFrame:
     """
     Loads a dataset from a specified file path.
 
+    The fast mode only reads the columns used by the pipeline (USED_COLUMNS), declares compact data types
+    up front, parses STARTED in one vectorized step and uses the pyarrow CSV engine if it is installed.
+
     Parameters:
     - filepath (str): The path to the data file.
+    - fast (bool): Use the fast loader mode.
+    - engine (str): CSV engine of the fast mode ('pyarrow' or 'c'), defaults to default_engine().
 
     Returns:
     - pd.DataFrame: The loaded data as a pandas DataFrame.
@@ -16,19 +62,128 @@ def load_data(filepath: str) -> pd.DataFrame:
         raise FileNotFoundError(f"The file at {filepath} was not found.")
 
     try:
-        dateparser = lambda x: datetime.strptime(x, '%d.%m.%Y %H:%M')
+        if fast:
+            return _load_data_fast(filepath, engine if engine is not None else default_engine())
+
         data = pd.read_csv(
             filepath,
-            encoding='ISO-8859-1',  
-            delimiter=';',          
-            decimal='.',            
-            quotechar='"',   
-            parse_dates=['STARTED'], 
-            date_parser=dateparser,      
-            header=0,   # First row contains column names          
+            encoding='ISO-8859-1',
+            delimiter=';',
+            decimal='.',
+            quotechar='"',
+            parse_dates=['STARTED'],
+            date_format=DATE_FORMAT,
+            header=0,   # First row contains column names
             na_values=['']
         )
 
         return data
     except Exception as e:
-        raise Exception(f"Error loading data from {filepath}: {e}")
\ No newline at end of file
+        raise Exception(f"Error loading data from {filepath}: {e}")
+
+def _typed_read_options(filepath: str) -> dict:
+    """
+    Returns the read_csv arguments of the fast mode: the used columns that are in the export and their data types.
+
+    Parameters:
+    - filepath (str): The path to the data file.
+
+    Returns:
+    - dict: Keyword arguments of pd.read_csv.
+    """
+    options = dict(
+        encoding='ISO-8859-1',
+        delimiter=';',
+        quotechar='"',
+        header=0,   # First row contains column names
+        na_values=['']
+    )
+
+    # Only request the used columns that are in the export, e.g. older waves have no SSCCS items
+    header = pd.read_csv(filepath, nrows=0, **options).columns
+    usecols = [column for column in USED_COLUMNS if column in header]
+    options.update(usecols=usecols, dtype={column: COLUMN_DTYPES[column] for column in usecols})
+    return options
+
+def _parse_started(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parses the STARTED column of a DataFrame read with _typed_read_options and restores the column order of the export.
+
+    Parameters:
+    - data (pd.DataFrame): The loaded data.
+
+    Returns:
+    - pd.DataFrame: The data with STARTED as datetime.
+    """
+    # Parse all dates at once with the fixed format instead of guessing the format per row
+    data['STARTED'] = pd.to_datetime(data['STARTED'], format=DATE_FORMAT)
+
+    # Keep the column order of the export
+    return data[[column for column in USED_COLUMNS if column in data.columns]]
+
+def _load_data_fast(filepath: str, engine: str) -> pd.DataFrame:
+    """
+    Loads the used columns of a dataset with compact data types, see load_data.
+
+    Parameters:
+    - filepath (str): The path to the data file.
+    - engine (str): The CSV engine of pd.read_csv.
+
+    Returns:
+    - pd.DataFrame: The loaded data as a pandas DataFrame.
+    """
+    data = pd.read_csv(filepath, engine=engine, **_typed_read_options(filepath))
+    return _parse_started(data)
+
+def load_data_chunks(filepath: str, chunksize: int = 50000):
+    """
+    Loads a dataset in chunks of rows, with the same columns and data types as the fast mode of load_data.
+    Only one chunk is kept in memory at a time.
+
+    Parameters:
+    - filepath (str): The path to the data file.
+    - chunksize (int): Number of rows per chunk.
+
+    Returns:
+    - generator of pd.DataFrame: The chunks in file order.
+    """
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"The file at {filepath} was not found.")
+
+    try:
+        # The pyarrow engine does not support reading in chunks
+        with pd.read_csv(filepath, chunksize=chunksize, **_typed_read_options(filepath)) as reader:
+            for chunk in reader:
+                yield _parse_started(chunk)
+    except Exception as e:
+        raise Exception(f"Error loading data from {filepath}: {e}")
+
+def load_data_tail(filepath: str, offset: int) -> tuple:
+    """
+    Loads the rows that were appended to a dataset after a byte offset, with the same columns and data types
+    as the fast mode of load_data. The header is read from the start of the file. A last row that is not
+    complete yet (no line break at its end) is left for the next call.
+
+    Parameters:
+    - filepath (str): The path to the data file.
+    - offset (int): Byte offset where the new rows start, 0 reads all rows.
+
+    Returns:
+    - tuple: The loaded rows as a pandas DataFrame and the byte offset after the last complete row.
+    """
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"The file at {filepath} was not found.")
+
+    try:
+        with open(filepath, 'rb') as f:
+            header = f.readline()
+            f.seek(max(offset, len(header)))
+            tail = f.read()
+        complete = tail.rfind(b'\n') + 1
+        end_offset = max(offset, len(header)) + complete
+
+        engine = default_engine() if complete > 0 else 'c'
+        data = pd.read_csv(io.BytesIO(header + tail[:complete]), engine=engine, **_typed_read_options(filepath))
+        return _parse_started(data), end_offset
+    except Exception as e:
+        raise Exception(f"Error loading data from {filepath}: {e}")
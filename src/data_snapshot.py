@@ -0,0 +1,379 @@
+import os
+import json
+import hashlib
+import tempfile
+import pandas as pd
+from preprocessing import apply_schema
+
+SNAPSHOT_FILE = 'data_snapshot.feather'
+SNAPSHOT_METADATA_FILE = 'data_snapshot.json'
+
+# Bump when the loading, preprocessing or evaluation changes, so that old snapshots are rebuilt
+SNAPSHOT_VERSION = 7
+
+# Size of the blocks of the export that are hashed separately, see file_chunk_hashes
+HASH_CHUNK_SIZE = 1 << 20
+
+def snapshot_available() -> bool:
+    """
+    Checks if snapshots can be written and read, which needs pyarrow.
+
+    Returns:
+    - bool: True if pyarrow is installed.
+    """
+    try:
+        import pyarrow.feather
+        return True
+    except ImportError:
+        return False
+
+def file_chunk_hashes(filepath: str, limit: int = None, known: list = None) -> list:
+    """
+    Calculates a hash of every block of HASH_CHUNK_SIZE bytes of a file, the last block may be shorter.
+
+    Parameters:
+    - filepath (str): The path to the file.
+    - limit (int): Optional number of bytes from the start of the file to hash, defaults to the whole file.
+    - known (list): Optional hashes of the first full blocks, which were already checked and are not read again.
+
+    Returns:
+    - list: The hashes of the blocks.
+    """
+    hashes = list(known) if known is not None else []
+    remaining = (limit if limit is not None else os.path.getsize(filepath)) - len(hashes) * HASH_CHUNK_SIZE
+    with open(filepath, 'rb') as f:
+        f.seek(len(hashes) * HASH_CHUNK_SIZE)
+        while remaining > 0:
+            block = f.read(min(HASH_CHUNK_SIZE, remaining))
+            if not block:
+                break
+            hashes.append(hashlib.blake2b(block, digest_size=16).hexdigest())
+            remaining -= len(block)
+    return hashes
+
+def combined_hash(chunk_hashes: list) -> str:
+    """
+    Combines the hashes of the blocks of a file into the hash of its content.
+
+    Parameters:
+    - chunk_hashes (list): The hashes of the blocks, see file_chunk_hashes.
+
+    Returns:
+    - str: The hash.
+    """
+    return hashlib.blake2b(''.join(chunk_hashes).encode(), digest_size=16).hexdigest()
+
+def file_content_hash(filepath: str, limit: int = None) -> str:
+    """
+    Calculates a hash of the content of a file, read in blocks.
+
+    Parameters:
+    - filepath (str): The path to the file.
+    - limit (int): Optional number of bytes from the start of the file to hash, defaults to the whole file.
+
+    Returns:
+    - str: The hash.
+    """
+    return combined_hash(file_chunk_hashes(filepath, limit))
+
+def _temporary_path(path: str) -> str:
+    """
+    Creates a new temporary file next to a file, to be written and then moved to the file. Every call gets
+    its own file, so that runs writing the same file at the same time do not write into each other's file.
+
+    Parameters:
+    - path (str): The path of the file.
+
+    Returns:
+    - str: The path of the temporary file.
+    """
+    fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+    os.close(fd)
+    return temporary_path
+
+def _replace(path: str, write):
+    """
+    Writes a file through a temporary file, so that an interrupted run does not leave a broken file.
+
+    Parameters:
+    - path (str): The path of the file.
+    - write (callable): Function that writes the content to the path it is called with.
+    """
+    temporary_path = _temporary_path(path)
+    try:
+        write(temporary_path)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+def load_snapshot(snapshot_path: str) -> pd.DataFrame:
+    """
+    Loads a snapshot of the evaluated data, e.g. for analysis scripts. The file is memory-mapped instead of read.
+    Does not check if the snapshot is up to date, see DataSnapshot for that.
+
+    Parameters:
+    - snapshot_path (str): The path to the snapshot file.
+
+    Returns:
+    - pd.DataFrame: The evaluated data.
+    """
+    import pyarrow.feather
+    return pyarrow.feather.read_table(snapshot_path, memory_map=True).to_pandas()
+
+class DataSnapshot:
+    """
+    Snapshot of the preprocessed and evaluated data of an export in the columnar Feather format,
+    so that later runs do not parse, preprocess and evaluate the same export again.
+
+    The snapshot is stored with the size, modification time and content hash of the export it was built from.
+    It is stale if the content hash of the export changed; the hash is only recalculated if the size or the
+    modification time differ, so an unchanged export is recognized without reading it. The hashes of the
+    blocks of the export are stored as well: a merge checks every block before the stored offset, and only
+    hashes the blocks after it again for the new snapshot.
+
+    An export that only grew (new rows appended by the survey platform) can be merged into the snapshot
+    with load_or_update: the stored byte offset marks how far the export was read, and only the rows after
+    it are loaded, preprocessed and evaluated.
+
+    The metadata also lists the participants whose outputs were not created since their rows were added
+    (all participants after a build from scratch). They stay pending until rendered is called for them, so
+    participants whose rows were merged by a run that did not create their outputs (a crashed render,
+    --serial, --scores-only or --snapshot-only) are plotted by the next run.
+
+    Parameters:
+    - source_path (str): The path to the data file (the export).
+    - snapshot_dir (str): Directory where the snapshot is saved.
+    - snapshot_file (str): File name of the snapshot, runs that write into the same directory at the same
+      time (e.g. the shards of a cohort) each need their own.
+    - metadata_file (str): File name of the metadata, also one per run that writes at the same time.
+    """
+
+    def __init__(self, source_path: str, snapshot_dir: str, snapshot_file: str = SNAPSHOT_FILE, metadata_file: str = SNAPSHOT_METADATA_FILE):
+        self.source_path = source_path
+        self.path = os.path.join(snapshot_dir, snapshot_file)
+        self.metadata_path = os.path.join(snapshot_dir, metadata_file)
+        self.metadata = {}
+
+        if os.path.exists(self.metadata_path):
+            try:
+                with open(self.metadata_path, encoding='utf-8') as f:
+                    self.metadata = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Snapshot metadata {self.metadata_path} could not be read and is ignored: {e}")
+
+    def _source_stat(self) -> dict:
+        """
+        Returns the size and modification time of the export.
+
+        Returns:
+        - dict: The size in bytes and the modification time in nanoseconds.
+        """
+        stat = os.stat(self.source_path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def is_fresh(self) -> bool:
+        """
+        Checks if the snapshot was built from the current content of the export with the current code version.
+
+        Returns:
+        - bool: True if the snapshot can be loaded instead of the export.
+        """
+        if not os.path.exists(self.path) or self.metadata.get('version') != SNAPSHOT_VERSION:
+            return False
+        if self.metadata.get('source') != os.path.abspath(self.source_path):
+            return False
+        stat = self._source_stat()
+        if stat['size'] == self.metadata.get('size') and stat['mtime_ns'] == self.metadata.get('mtime_ns'):
+            return True
+        # The file was touched or copied: only the content counts, all of it is hashed
+        if stat['size'] != self._offset():
+            return False
+        chunk_hashes = file_chunk_hashes(self.source_path)
+        if combined_hash(chunk_hashes) != self.metadata.get('content_hash'):
+            return False
+        self._save_metadata(chunk_hashes, self._offset(), self.pending())
+        return True
+
+    def pending(self) -> list:
+        """
+        Returns the participants whose outputs were not created since their rows were added to the snapshot.
+
+        Returns:
+        - list: The SERIALs.
+        """
+        return list(self.metadata.get('pending', []))
+
+    def rendered(self, unique_ids):
+        """
+        Marks the outputs of participants as created, so that they are no longer pending.
+
+        Parameters:
+        - unique_ids: The SERIALs of the participants whose outputs were created.
+        """
+        pending = self.pending()
+        if not pending or not os.path.exists(self.metadata_path):
+            return
+        remaining = sorted(set(pending) - set(str(unique_id) for unique_id in unique_ids))
+        if len(remaining) < len(pending):
+            self.metadata['pending'] = remaining
+            self._write_metadata()
+
+    def _offset(self) -> int:
+        """
+        Returns how many bytes of the export the snapshot was built from.
+
+        Returns:
+        - int: The byte offset, the stored size for snapshots that were saved without offset.
+        """
+        return self.metadata.get('offset', self.metadata.get('size'))
+
+    def appended(self) -> bool:
+        """
+        Checks if the export still starts with the content the snapshot was built from, so that only rows
+        were appended since. Does not check if the snapshot is fresh, see is_fresh.
+
+        Returns:
+        - bool: True if the rows after the stored offset can be merged into the snapshot.
+        """
+        return self._checked_chunks() is not None
+
+    def _checked_chunks(self) -> list:
+        """
+        Compares every block of the export before the stored offset with the stored block hashes.
+
+        Returns:
+        - list: The hashes of the blocks before the stored offset, None if the export does not start with
+          the content the snapshot was built from.
+        """
+        if not os.path.exists(self.path) or self.metadata.get('version') != SNAPSHOT_VERSION:
+            return None
+        if self.metadata.get('source') != os.path.abspath(self.source_path) or self._offset() is None:
+            return None
+        if self._source_stat()['size'] < self._offset():
+            return None
+        chunk_hashes = file_chunk_hashes(self.source_path, self._offset())
+        if chunk_hashes != self.metadata.get('chunk_hashes'):
+            return None
+        return chunk_hashes
+
+    def load(self) -> pd.DataFrame:
+        """
+        Loads the snapshot.
+
+        Returns:
+        - pd.DataFrame: The evaluated data.
+        """
+        return load_snapshot(self.path)
+
+    def save(self, data: pd.DataFrame, offset: int = None, pending: list = None, known_chunks: list = None):
+        """
+        Saves the evaluated data as snapshot of the current export.
+
+        Parameters:
+        - data (pd.DataFrame): The evaluated data.
+        - offset (int): Number of bytes of the export the data was built from, defaults to the whole export.
+        - pending (list): The SERIALs whose outputs are not created yet, defaults to all participants of data.
+        - known_chunks (list): Optional hashes of the first full blocks of the export that were already checked
+          in this run (see appended), they are not read again.
+        """
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if offset is None:
+            offset = self._source_stat()['size']
+        # Hash before writing, so that a change of the export during the run makes the snapshot stale
+        chunk_hashes = file_chunk_hashes(self.source_path, offset, known_chunks)
+        # Write to a temporary file first, so that an interrupted run does not leave a broken snapshot
+        _replace(self.path, data.reset_index(drop=True).to_feather)
+        if pending is None:
+            pending = pd.unique(data['SERIAL'].astype(str))
+        self._save_metadata(chunk_hashes, offset, sorted(pending))
+        print(f"Data snapshot saved to: {self.path}")
+
+    def _save_metadata(self, chunk_hashes: list, offset: int, pending: list):
+        """
+        Writes the metadata of the export the snapshot belongs to.
+
+        Parameters:
+        - chunk_hashes (list): The hashes of the blocks of the first offset bytes of the export.
+        - offset (int): Number of bytes of the export the snapshot was built from.
+        - pending (list): The SERIALs whose outputs are not created yet.
+        """
+        self.metadata = {
+            'version': SNAPSHOT_VERSION,
+            'source': os.path.abspath(self.source_path),
+            'content_hash': combined_hash(chunk_hashes),
+            'chunk_hashes': list(chunk_hashes),
+            'offset': offset,
+            **self._source_stat(),
+            'pending': list(pending),
+        }
+        self._write_metadata()
+
+    def _write_metadata(self):
+        """
+        Writes the metadata file.
+        """
+        def write(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.metadata, f)
+
+        _replace(self.metadata_path, write)
+
+    def load_or_build(self, build, rebuild: bool = False) -> pd.DataFrame:
+        """
+        Loads the snapshot if it is up to date, otherwise builds the data and saves a new snapshot.
+
+        Parameters:
+        - build (callable): Function without arguments that loads, preprocesses and evaluates the export.
+        - rebuild (bool): Build a new snapshot even if the stored one is up to date.
+
+        Returns:
+        - pd.DataFrame: The evaluated data.
+        """
+        if not snapshot_available():
+            return build()
+        if not rebuild and self.is_fresh():
+            print(f"Data loaded from snapshot: {self.path}")
+            return self.load()
+        data = build()
+        self.save(data)
+        return data
+
+    def load_or_update(self, load_rows, rebuild: bool = False) -> tuple:
+        """
+        Loads the snapshot and merges the rows that were appended to the export since it was saved.
+        The snapshot is built from scratch if there is none, or if the export was changed in another way
+        than by appending rows.
+
+        Parameters:
+        - load_rows (callable): Function that loads, preprocesses and evaluates the rows of the export after
+          a byte offset (0 for all rows); it returns the evaluated rows and the byte offset after the last row.
+        - rebuild (bool): Build a new snapshot even if the stored one is up to date.
+
+        Returns:
+        - tuple: The evaluated data and the SERIALs of the participants whose outputs are pending: the
+          participants with new rows and those of earlier runs that were not rendered (see rendered).
+          None without snapshot, then all participants are new.
+        """
+        if not snapshot_available():
+            data, _ = load_rows(0)
+            return data, None
+        if not rebuild and self.is_fresh():
+            print(f"Data loaded from snapshot: {self.path}")
+            return self.load(), self.pending()
+        chunk_hashes = None if rebuild else self._checked_chunks()
+        if chunk_hashes is None:
+            data, offset = load_rows(0)
+            self.save(data, offset)
+            return data, self.pending()
+
+        new_rows, offset = load_rows(self._offset())
+        data = self.load()
+        if len(new_rows) > 0:
+            # The categories of the new rows differ from the stored ones, so they are rebuilt for the merged data
+            data = apply_schema(pd.concat([data, new_rows[data.columns]], ignore_index=True))
+        print(f"Merged {len(new_rows)} new rows into the data snapshot: {self.path}")
+        # The last block before the old offset may be incomplete, it is hashed again together with the new rows
+        known_chunks = chunk_hashes[:self._offset() // HASH_CHUNK_SIZE]
+        self.save(data, offset, set(self.pending()) | set(pd.unique(new_rows['SERIAL'].astype(str))), known_chunks)
+        return data, self.pending()
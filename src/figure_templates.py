@@ -0,0 +1,400 @@
+import threading
+import numpy as np
+import pandas as pd
+import matplotlib
+import matplotlib.dates as mdates
+import matplotlib.patches as mpatches
+from matplotlib.figure import Figure
+
+# The figures of the line graph, heatmap and diverging bar chart only differ in the plotted data between
+# participants. A template builds the static part of such a figure (axes, titles, labels, limits, spines,
+# grid, legend and layout) once, and only swaps in the data of the next participant before saving.
+# Templates are cached per thread (and therefore per worker process), because a figure must not be
+# filled by two threads at the same time. Templates that depend on the number of study days get one
+# figure per number, so only the TEMPLATE_CACHE_SIZE most recently used templates are kept.
+
+WEEKDAYS = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag', 'Samstag', 'Sonntag']
+
+# Score column, subplot title, line color and y-axis limits of the four line graph subplots
+LINE_GRAPH_SCORES = [
+    ('MDBF_Valence_Score', 'Gut-Schlechte Stimmung', '#1f77b4', (1, 7)),
+    ('MDBF_Arousal_Score', 'Wachheit-Müdigkeit', '#aec7e8', (1, 7)),
+    ('MDBF_Calmness_Score', 'Ruhe-Unruhe', '#ff7f0e', (1, 7)),
+    ('PSS4_Score', 'Stresslevel', '#ffbb78', (0, 16)),
+]
+
+HEATMAP_SCORES = ['MDBF_Valence_Score', 'MDBF_Arousal_Score', 'MDBF_Calmness_Score']
+
+# Fixed positions of the MDBF nodes of the force graph (a triangle around the topics) and the seed of the layouts
+FORCEGRAPH_ANCHORS = {
+    'Gute Stimmung': (0.0, 0.9),
+    'Wachheit': (-0.78, -0.45),
+    'Ruhe': (0.78, -0.45),
+}
+FORCEGRAPH_SEED = 42
+
+# Parameters of the subplot layout of a figure
+SUBPLOT_PARAMS = ['left', 'right', 'bottom', 'top', 'wspace', 'hspace']
+
+# Maximum number of computed layouts a template keeps, the oldest is dropped first
+LAYOUT_CACHE_SIZE = 256
+
+# Maximum number of templates a thread keeps, the least recently used is freed first
+TEMPLATE_CACHE_SIZE = 8
+
+_templates = threading.local()
+
+def apply_layout(fig: Figure, layouts: dict, key, adjust: dict = None, **tight_layout_options):
+    """
+    Lays out a template figure for the labels of the participant it was filled with. tight_layout starts
+    from the current positions, so the figure is reset to the defaults of a new figure first; otherwise
+    the layout would depend on the participant drawn before.
+
+    After the reset the layout only depends on the texts of the figure, so the computed subplot parameters
+    are kept in layouts and applied directly to the next participant with the same texts.
+
+    Parameters:
+    - fig (Figure): The figure of the template.
+    - layouts (dict): The computed layouts of the template by key, at most LAYOUT_CACHE_SIZE are kept.
+    - key: The texts the layout depends on, e.g. the weekday labels and the subplot titles.
+    - adjust (dict): Optional subplot parameters that override the computed layout, e.g. to leave room for a title.
+    - tight_layout_options: Arguments of Figure.tight_layout.
+    """
+    if key in layouts:
+        fig.subplots_adjust(**layouts[key])
+        return
+    fig.subplots_adjust(**{name: matplotlib.rcParams[f'figure.subplot.{name}'] for name in SUBPLOT_PARAMS})
+    fig.tight_layout(**tight_layout_options)
+    if adjust is not None:
+        fig.subplots_adjust(**adjust)
+    if len(layouts) >= LAYOUT_CACHE_SIZE:
+        del layouts[next(iter(layouts))]
+    # Rounded, because tight_layout differs in the last digits between participants with the same texts
+    # (e.g. by the dates of the x-axis); the figure gets the same parameters as a cached layout
+    layouts[key] = {name: round(getattr(fig.subplotpars, name), 10) for name in SUBPLOT_PARAMS}
+    fig.subplots_adjust(**layouts[key])
+
+def weekday_labels(started) -> list:
+    """
+    Returns the weekday of every entry as label of the x-axis.
+
+    Parameters:
+    - started: The STARTED times of the entries.
+
+    Returns:
+    - list: The German names of the weekdays.
+    """
+    return [WEEKDAYS[day] for day in pd.DatetimeIndex(started).dayofweek]
+
+def get_template(template_class, *key):
+    """
+    Returns the template of a chart for the current thread, and builds it on first use.
+    At most TEMPLATE_CACHE_SIZE templates are kept, the figure of the least recently used one is freed.
+
+    Parameters:
+    - template_class (type): The template class of the chart.
+    - key: Arguments of the template class, e.g. the number of days; a separate template is kept for every key.
+
+    Returns:
+    - The template.
+    """
+    if not hasattr(_templates, 'cache'):
+        _templates.cache = {}
+    cache = _templates.cache
+    cache_key = (template_class, key)
+    # Moved to the end on every use, so the first template is the least recently used
+    template = cache.pop(cache_key, None)
+    if template is None:
+        template = template_class(*key)
+        if len(cache) >= TEMPLATE_CACHE_SIZE:
+            release_figure(getattr(cache.pop(next(iter(cache))), 'fig', None))
+    cache[cache_key] = template
+    return template
+
+def clear_templates():
+    """
+    Removes all templates of the current thread, e.g. after the matplotlib style was changed
+    or after a template could not be filled.
+    """
+    _templates.cache = {}
+
+def release_figure(fig: Figure):
+    """
+    Frees a figure that was drawn for a single participant. A figure holds reference cycles between its
+    artists, so without clearing it its memory is only returned when the garbage collector runs.
+    The template figures of the current thread are kept for the next participant.
+
+    Parameters:
+    - fig (Figure): The figure, None is ignored.
+    """
+    if fig is None:
+        return
+    templates = getattr(_templates, 'cache', {}).values()
+    if any(getattr(template, 'fig', None) is fig for template in templates):
+        return
+    fig.clear()
+
+class LineGraphTemplate:
+    """
+    Template of the 2x2 line graph of the MDBF and PSS4 scores.
+    """
+
+    def __init__(self):
+        self.fig = Figure(figsize=(12, 10), facecolor='white')
+        self.axes = self.fig.subplots(2, 2)
+        self.lines = []
+
+        for ax, (column, title, color, ylim) in zip(self.axes.flat, LINE_GRAPH_SCORES):
+            line, = ax.plot([], [], marker='o', color=color, linewidth=2, markersize=8, alpha=0.8)
+            self.lines.append(line)
+            # No reference line for the stress level
+            if column != 'PSS4_Score':
+                ax.axhline(4, color='black', linewidth=1)
+            ax.set_title(title, fontsize=14)
+            ax.set_xlabel('Wochentag', fontsize=12)
+            ax.set_ylabel('Level', fontsize=12)
+            ax.set_ylim(*ylim)
+            if column != 'PSS4_Score':
+                ax.spines['bottom'].set_visible(False)
+            ax.grid(True, linestyle='--', alpha=0.6)
+            ax.spines['top'].set_visible(False)
+            ax.spines['right'].set_visible(False)
+
+        self.fig.suptitle(f'Verlauf der Befindlichkeit und des Stresslevel', fontsize=18, fontweight='bold')
+        # Computed layouts by weekday labels, see apply_layout
+        self.layouts = {}
+
+    def fill(self, days: 'ParticipantDays'):
+        """
+        Swaps the data of a participant into the figure.
+
+        Parameters:
+        - days (ParticipantDays): The study days of the participant, the lines have gaps on missed days.
+        """
+        started = days.dates.to_numpy()
+        labels = weekday_labels(started)
+        # All study days are shown, also if the first or last one has no score, so the layout only depends on the labels
+        x = mdates.date2num(started)
+
+        for ax, line, (column, _, _, _) in zip(self.axes.flat, self.lines, LINE_GRAPH_SCORES):
+            ax.xaxis.update_units(started)
+            line.set_data(started, days.scores(column))
+            margin = (x[-1] - x[0]) * ax.margins()[0]
+            ax.set_xlim(x[0] - margin, x[-1] + margin)
+            ax.set_xticks(started)
+            ax.set_xticklabels(labels, rotation=45, ha='right')
+
+        # The spacing depends on the weekdays and their positions, so it is computed per participant
+        apply_layout(self.fig, self.layouts, tuple(labels), pad=3.0, rect=[0, 0, 1, 0.96])
+
+class HeatmapTemplate:
+    """
+    Template of the heatmap of the three MDBF scores over the study days of one participant.
+
+    The cells are one mesh that is drawn once and recolored per participant; missed days are left blank.
+    Every cell is annotated with its value.
+
+    Parameters:
+    - n_days (int): Number of columns (days) of the heatmap.
+    """
+
+    cmap = 'RdYlGn'
+
+    def __init__(self, n_days: int):
+        self.fig = Figure(figsize=(12, 6))
+        ax = self.fig.subplots()
+        n_scores = len(HEATMAP_SCORES)
+
+        # Cell (i, j) covers [j, j + 1] x [i, i + 1] with the first score at the top; on the Agg canvas
+        # the mesh of these few cells is drawn faster than an image, which is resampled to the full size
+        self.mesh = ax.pcolormesh(np.zeros((n_scores, n_days)), cmap=self.cmap)
+        ax.set_xlim(0, n_days)
+        ax.set_ylim(n_scores, 0)
+        self.annotations = [
+            ax.text(j + 0.5, i + 0.5, '', ha='center', va='center')
+            for i in range(n_scores) for j in range(n_days)
+        ]
+        for spine in ax.spines.values():
+            spine.set_visible(False)
+        cbar = self.fig.colorbar(self.mesh, ax=ax, label='Wert')
+        cbar.outline.set_linewidth(0)
+
+        # Set the title and labels
+        ax.set_title(f'Ausprägung der Befindlichkeitswerte', fontsize=18)
+        ax.set_xlabel('Wochentag', fontsize=14)
+        ax.set_ylabel('Befindlichkeitswerte', fontsize=14)
+        # The weekdays are set per participant in fill()
+        midpoints_x = [i - 0.5 for i in range(1, n_days + 1)]
+        ax.set_xticks(ticks=midpoints_x)
+        self.ax = ax
+        y_ticks = ['Gute Stimmung -\nSchlechte Stimmung', 'Wachheit -\nMüdigkeit', 'Ruhe -\nUnruhe']
+
+        # Calculate the midpoints of each row
+        midpoints_y = [i - 0.5 for i in range(1, len(y_ticks) + 1)]
+        ax.set_yticks(ticks=midpoints_y, labels=y_ticks, rotation=0, va='center')
+
+        # Add text next to the color bar to explain the extremas
+        cbar.ax.text(2.8, 0.04, 'Schlecht Stimmung\nMüdigkeit\nUnruhe', ha='left', va='center', transform=cbar.ax.transAxes, fontsize=12)
+        cbar.ax.text(2.8, 0.96, 'Gute Stimmung\nWachheit\nRuhe', ha='left', va='center', transform=cbar.ax.transAxes, fontsize=12)
+        # Computed layouts by weekday labels, see apply_layout
+        self.layouts = {}
+
+    def fill(self, days: 'ParticipantDays'):
+        """
+        Swaps the data of a participant into the figure.
+
+        Parameters:
+        - days (ParticipantDays): The study days of the participant.
+        """
+        labels = weekday_labels(days.dates)
+        self.ax.set_xticklabels(labels, rotation=45, ha='right')
+
+        # One row per score and one column per day, missed days and missing scores are masked
+        plot_data = np.ma.masked_invalid(days.scores(HEATMAP_SCORES).T)
+        self.mesh.set_array(plot_data)
+        self.mesh.set_clim(plot_data.min(), plot_data.max())
+
+        # Dark text on light cells and white text on dark cells, by the relative luminance of the cell color
+        rgb = matplotlib.colormaps[self.cmap](self.mesh.norm(plot_data.filled(np.nan)))[..., :3]
+        rgb = np.where(rgb <= .03928, rgb / 12.92, ((rgb + .055) / 1.055) ** 2.4)
+        luminance = rgb @ [.2126, .7152, .0722]
+        for annotation, masked, light, value in zip(self.annotations, np.ma.getmaskarray(plot_data).flat, (luminance > .408).flat, plot_data.filled(np.nan).flat):
+            annotation.set_visible(not masked)
+            if not masked:
+                annotation.set_text(f"{value:.1f}")
+                annotation.set_color(".15" if light else "w")
+
+        # The spacing depends on the weekdays, so it is computed per participant
+        apply_layout(self.fig, self.layouts, tuple(labels))
+
+class DivergingBarChartTemplate:
+    """
+    Template of the diverging bar chart of the MDBF Valence score for the four most mentioned topics.
+
+    Parameters:
+    - n_days (int): Number of bars per subplot.
+    """
+
+    color_positive = '#ff7f0e'  # if topic was used
+    color_negative = '#1f77b4'
+    bar_width = 0.8
+
+    def __init__(self, n_days: int):
+        self.fig = Figure(figsize=(12, 8), facecolor='white')
+        self.axs = self.fig.subplots(2, 2)
+        self.bars = []
+        self.fig.suptitle(f'Gute-Schlechte Stimmung für die 4 häufigsten Topics', fontsize=18, fontweight='bold')
+
+        for ax in self.axs.flat:
+            # Placeholder bars at the days of the unix epoch, moved to the participant's days in fill()
+            placeholder_days = pd.date_range('1970-01-01', periods=n_days, freq='D').to_numpy()
+            self.bars.append(ax.bar(placeholder_days, np.zeros(n_days), width=self.bar_width, color=self.color_negative, edgecolor='black'))
+            ax.axhline(0, color='black', linewidth=1)
+            ax.set_ylim(-3, 3)
+            # change y-axis values to represent original MDBF values
+            ax.set_yticks([-3, -2, -1, 0, 1, 2, 3])
+            ax.set_yticklabels(['1', '2', '3', '4', '5', '6', '7'])
+            ax.set_xlabel('Wochentag', fontsize=12)
+            ax.set_ylabel('Stimmung', fontsize=12)
+            ax.tick_params(axis='x', labelsize=10)
+            ax.spines['top'].set_visible(False)
+            ax.spines['right'].set_visible(False)
+            ax.grid(True, linestyle='--', alpha=0.6)
+
+        # Create custom legend handles
+        legend_handles = [
+            mpatches.Patch(color=self.color_positive, label='Erwähnt'),
+            mpatches.Patch(color=self.color_negative, label='Nicht erwähnt')
+        ]
+
+        # Add the custom legend to the plot
+        self.fig.legend(handles=legend_handles, fontsize=12)
+        # Computed layouts by weekday labels and topics, see apply_layout
+        self.layouts = {}
+
+    def fill(self, days: 'ParticipantDays', top_topics: list, mentioned: np.ndarray):
+        """
+        Swaps the data of a participant into the figure.
+
+        Parameters:
+        - days (ParticipantDays): The study days of the participant, there is no bar on missed days.
+        - top_topics (list): The (up to four) topics to show.
+        - mentioned (np.ndarray): Flags with one row per study day and one column per topic in top_topics,
+          1 if the topic was mentioned that day.
+        """
+        started = days.dates.to_numpy()
+        x = mdates.date2num(started)
+        centered_values = days.scores('MDBF_Valence_Score') - 4 # MDBF can range from 1 to 7, so center around 4
+        labels = weekday_labels(started)
+
+        for i, ax in enumerate(self.axs.flat):
+            ax.set_visible(i < len(top_topics))
+            if i >= len(top_topics):
+                continue
+            topic = top_topics[i]
+            # if the topic was mentioned the bar is highlighted
+            colors = [self.color_positive if value else self.color_negative for value in mentioned[:, i]]
+            for bar, left, height, color in zip(self.bars[i], x - self.bar_width / 2, centered_values, colors):
+                bar.set_x(left)
+                bar.set_height(height if not np.isnan(height) else 0)
+                bar.set_visible(not np.isnan(height))
+                bar.set_facecolor(color)
+            ax.relim()
+            ax.autoscale(enable=True, axis='x')
+            ax.set_xticks(started)
+            ax.set_xticklabels(labels, rotation=45, ha='right')
+            ax.set_title(f'{topic.split("_")[1]}', fontsize=14, fontweight='bold')
+
+        # The spacing depends on the topic titles and the weekdays, so it is computed per participant
+        apply_layout(self.fig, self.layouts, (tuple(labels), tuple(top_topics)), adjust={'top': 0.9}, pad=3.0)
+
+class ForceGraphLayouts:
+    """
+    Layouts of the force graph, cached per graph structure (the topic nodes and their edges to the MDBF nodes).
+
+    The MDBF nodes are fixed at FORCEGRAPH_ANCHORS. A reference layout with all topics connected to all MDBF
+    nodes is computed once; the layout of a participant's graph starts from the topics' positions in the
+    reference layout and is only refined, so similar graphs get similar layouts. All layouts are seeded,
+    so the same graph always gets the same layout. The edge weights do not affect the layout.
+
+    Parameters:
+    - topics (list): Names of all topic nodes.
+    """
+
+    k = 0.5
+    iterations = 50
+    refine_iterations = 20
+
+    def __init__(self, *topics: str):
+        import networkx as nx
+
+        reference = nx.Graph()
+        reference.add_nodes_from(FORCEGRAPH_ANCHORS)
+        reference.add_edges_from((anchor, topic) for topic in topics for anchor in FORCEGRAPH_ANCHORS)
+        self.reference = nx.spring_layout(
+            reference, k=self.k, pos=dict(FORCEGRAPH_ANCHORS), fixed=list(FORCEGRAPH_ANCHORS),
+            iterations=self.iterations, seed=FORCEGRAPH_SEED, weight=None
+        )
+        self.layouts = {}
+
+    def layout(self, G: 'nx.Graph') -> dict:
+        """
+        Returns the positions of the nodes of a force graph.
+
+        Parameters:
+        - G (nx.Graph): The graph with the MDBF nodes and the participant's topic nodes.
+
+        Returns:
+        - dict: Dictionary with the nodes as keys and their positions as values.
+        """
+        signature = (tuple(G.nodes), tuple(sorted(tuple(sorted(edge)) for edge in G.edges)))
+        if signature not in self.layouts:
+            import networkx as nx
+
+            start = {node: self.reference.get(node, (0.0, 0.0)) for node in G.nodes}
+            start.update(FORCEGRAPH_ANCHORS)
+            self.layouts[signature] = nx.spring_layout(
+                G, k=self.k, pos=start, fixed=list(FORCEGRAPH_ANCHORS),
+                iterations=self.refine_iterations, seed=FORCEGRAPH_SEED, weight=None
+            )
+        return self.layouts[signature]
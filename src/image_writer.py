@@ -0,0 +1,213 @@
+import io
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+# Output profiles of the chart images: resolution, image format and how hard the images are compressed
+# - preview: small and fast JPEG images, e.g. to check a run
+# - standard: PNG images at the default resolution of matplotlib (the images of earlier versions)
+# - print: PNG images with the resolution for printing, compressed as much as possible
+IMAGE_PROFILES = {
+    'preview': {'dpi': 72, 'format': 'jpeg', 'quality': 85},
+    'standard': {'dpi': 100, 'format': 'png', 'compress_level': 6},
+    'print': {'dpi': 300, 'format': 'png', 'compress_level': 9},
+}
+DEFAULT_PROFILE = 'standard'
+
+# File extension of every image format
+IMAGE_EXTENSIONS = {
+    'png': 'png',
+    'jpeg': 'jpg',
+}
+
+# Number of threads that encode and write the images of a process; with a single CPU the encoding cannot
+# overlap with the drawing, so the images are written in the rendering thread
+IMAGE_WRITER_THREADS = 2 if (os.cpu_count() or 1) > 1 else 0
+
+def image_extension(profile: str) -> str:
+    """
+    Returns the file extension of the images of a profile.
+
+    Parameters:
+    - profile (str): Name of the profile (key of IMAGE_PROFILES).
+
+    Returns:
+    - str: The extension without dot, e.g. 'png'.
+    """
+    return IMAGE_EXTENSIONS[IMAGE_PROFILES[profile]['format']]
+
+def rasterize(fig, profile: str, **save_options) -> tuple:
+    """
+    Draws a figure into an uncompressed RGBA buffer with the resolution of a profile. This is the part of
+    saving an image that needs matplotlib, so it has to run in the thread that draws the figures.
+
+    Parameters:
+    - fig (Figure): The figure.
+    - profile (str): Name of the profile (key of IMAGE_PROFILES).
+    - save_options: Further arguments of Figure.savefig, e.g. the facecolor.
+
+    Returns:
+    - tuple: The width and height in pixels and the RGBA pixels (bytes).
+    """
+    dpi = IMAGE_PROFILES[profile]['dpi']
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='rgba', dpi=dpi, **save_options)
+    # The Agg canvas truncates the size in pixels the same way
+    width, height = (int(size * dpi) for size in fig.get_size_inches())
+    pixels = buffer.getvalue()
+    if len(pixels) != width * height * 4:
+        raise ValueError(f"Unexpected size of the rendered figure ({len(pixels)} bytes for {width}x{height} pixels).")
+    return width, height, pixels
+
+def encode(raster: tuple, profile: str) -> bytes:
+    """
+    Encodes the pixels of a rendered figure in the format of a profile. Pillow releases the GIL while it
+    compresses, so several images can be encoded in parallel with the drawing of the next figure.
+
+    Parameters:
+    - raster (tuple): The width, height and RGBA pixels, see rasterize.
+    - profile (str): Name of the profile (key of IMAGE_PROFILES).
+
+    Returns:
+    - bytes: The encoded image.
+    """
+    from PIL import Image
+
+    options = IMAGE_PROFILES[profile]
+    width, height, pixels = raster
+    image = Image.frombuffer('RGBA', (width, height), pixels, 'raw', 'RGBA', 0, 1)
+    buffer = io.BytesIO()
+    if options['format'] == 'jpeg':
+        # JPEG has no alpha channel, the charts are drawn on an opaque background anyway
+        image.convert('RGB').save(buffer, format='jpeg', quality=options['quality'], dpi=(options['dpi'], options['dpi']))
+    else:
+        image.save(buffer, format='png', compress_level=options['compress_level'], dpi=(options['dpi'], options['dpi']))
+    return buffer.getvalue()
+
+def save_image(fig, file_path: str, profile: str, **save_options):
+    """
+    Saves a figure as image of a profile in the current thread.
+
+    Parameters:
+    - fig (Figure): The figure.
+    - file_path (str): The path of the image.
+    - profile (str): Name of the profile (key of IMAGE_PROFILES).
+    - save_options: Further arguments of Figure.savefig, e.g. the facecolor.
+    """
+    image = encode(rasterize(fig, profile, **save_options), profile)
+    with open(file_path, 'wb') as f:
+        f.write(image)
+
+class ImageWriter:
+    """
+    Encodes and writes the rendered figures in background threads, so that the compression and the file
+    writes overlap with drawing the next charts. The figures are rasterized by the caller (see rasterize)
+    and passed as pixel buffers through a bounded queue; when the queue is full, submit waits, so the
+    drawing cannot run far ahead of the writing and the buffers do not pile up in memory.
+
+    Without threads the images are encoded and written in submit.
+
+    Parameters:
+    - profile (str): Name of the output profile (key of IMAGE_PROFILES).
+    - threads (int): Number of background threads, 0 encodes and writes in the calling thread.
+    - queue_size (int): Maximum number of waiting images, defaults to twice the number of threads.
+    - timings (list): Optional list, a (unique_id, '<chart> encode', seconds) and (unique_id, '<chart> write', seconds)
+      tuple is appended for every image, in the format of the render timings.
+    """
+
+    def __init__(self, profile: str = DEFAULT_PROFILE, threads: int = IMAGE_WRITER_THREADS, queue_size: int = None, timings: list = None):
+        if profile not in IMAGE_PROFILES:
+            raise ValueError(f"Unknown image profile '{profile}', expected one of {list(IMAGE_PROFILES)}.")
+        self.profile = profile
+        self.timings = timings
+        # Errors of the images written to files, by SERIAL
+        self.failures = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size if queue_size is not None else max(2 * threads, 1))
+        self._threads = [threading.Thread(target=self._drain, daemon=True) for _ in range(threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fig, unique_id: str, chart: str, file_path: str = None, **save_options) -> Future:
+        """
+        Rasterizes a figure and queues it to be encoded and written. The figure can be closed or reused
+        as soon as submit returns.
+
+        Parameters:
+        - fig (Figure): The figure.
+        - unique_id (str): The SERIAL of the participant.
+        - chart (str): Name of the chart.
+        - file_path (str): Path of the image, None only encodes it (e.g. for a report).
+        - save_options: Further arguments of Figure.savefig, e.g. the facecolor.
+
+        Returns:
+        - Future: The encoded image (bytes). Errors while writing a file are also collected in failures.
+        """
+        future = Future()
+        job = (rasterize(fig, self.profile, **save_options), unique_id, chart, file_path, future)
+        if self._threads:
+            self._queue.put(job)
+        else:
+            self._write(*job)
+            # Without threads the errors are raised right away
+            future.result()
+        return future
+
+    def _drain(self):
+        """
+        Encodes and writes the queued images until close puts None into the queue.
+        """
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._write(*job)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, raster: tuple, unique_id: str, chart: str, file_path: str, future: Future):
+        """
+        Encodes one image and writes it to its file.
+        """
+        try:
+            start_time = time.perf_counter()
+            image = encode(raster, self.profile)
+            encoded_time = time.perf_counter()
+            if file_path is not None:
+                # Written to a temporary file first, so that an interrupted run does not leave a broken image
+                temporary_path = f'{file_path}.{threading.get_ident()}.tmp'
+                with open(temporary_path, 'wb') as f:
+                    f.write(image)
+                os.replace(temporary_path, file_path)
+            if self.timings is not None:
+                self.timings.append((unique_id, f'{chart} encode', encoded_time - start_time))
+                self.timings.append((unique_id, f'{chart} write', time.perf_counter() - encoded_time))
+            future.set_result(image)
+        except Exception as e:
+            if file_path is not None:
+                with self._lock:
+                    self.failures.setdefault(unique_id, f"{type(e).__name__}: {e}")
+            future.set_exception(e)
+
+    def flush(self):
+        """
+        Waits until all queued images are written.
+        """
+        self._queue.join()
+
+    def close(self) -> dict:
+        """
+        Writes the queued images and stops the threads.
+
+        Returns:
+        - failures (dict): Dictionary with the SERIALs whose images could not be written as keys and the error message as values.
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        return self.failures
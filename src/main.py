@@ -1,56 +1,391 @@
 import os
+import argparse
+from functools import partial
 import pandas as pd
-from data_loader import load_data
-from preprocessing import preprocess_data
-from visualization import create_visualizations
-from pdf_generator import create_pdf
-from questionnaire_evaluation import evaluation
+from data_loader import load_data, load_data_tail
+from preprocessing import preprocess_data, TOPIC_FLAG_COLUMNS, TOPIC_MASK_COLUMN
+from questionnaire_evaluation import evaluation, score_columns
+from participant_store import partition_data, STORE_SUBDIRECTORY
+from data_snapshot import DataSnapshot, SNAPSHOT_FILE, SNAPSHOT_METADATA_FILE
+from run_report import RunReport
+from selection import ParticipantSelection, parse_shard, read_serial_file
+from image_writer import IMAGE_PROFILES, DEFAULT_PROFILE, IMAGE_WRITER_THREADS
+
+# File of --scores-only in the output directory
+SCORES_FILE = 'scores.csv'
+
+def shard_argument(text: str) -> tuple:
+    """
+    Parses the --shard argument, see selection.parse_shard.
+
+    Parameters:
+    - text (str): The shard, e.g. '0/4'.
+
+    Returns:
+    - tuple: The shard number and the number of shards.
+    """
+    try:
+        return parse_shard(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def parse_args():
+    """
+    Parses the command line arguments.
+
+    Returns:
+    - argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description='Generates the feedback visualizations and reports for the JAM-STEP study.')
+    parser.add_argument('-i', '--input', default='data/data.csv',
+                        help='Path of the SoSci Survey export (default: data/data.csv)')
+    parser.add_argument('-o', '--output', default='outputs',
+                        help='Directory for the plots, reports and caches (default: outputs)')
+    parser.add_argument('--serial', action='append', metavar='SERIAL',
+                        help='Only process this participant, can be given several times')
+    parser.add_argument('--serial-file', metavar='PATH',
+                        help='Only process the participants listed in this file, one SERIAL per line')
+    parser.add_argument('--start-date', metavar='YYYY-MM-DD',
+                        help='Only use the entries started on or after this day')
+    parser.add_argument('--end-date', metavar='YYYY-MM-DD',
+                        help='Only use the entries started on or before this day')
+    parser.add_argument('--shard', type=shard_argument, metavar='I/N',
+                        help='Only process the I-th of N shards of the participants (I counted from 0), assigned by a hash '
+                             'of the SERIAL, so N runs with the same output directory create all outputs without overlap')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes used to create the plots (default: 1)')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Ignore the render cache and recreate all plots and reports')
+    parser.add_argument('--in-memory', action='store_true',
+                        help='Create the PDF reports directly from in-memory plots instead of image files')
+    # The same as pdf_generator.REPORT_BACKENDS, which is not imported before the plots are created
+    parser.add_argument('--pdf-backend', choices=['fpdf', 'vector'], default='fpdf',
+                        help='With --in-memory, place the chart images with FPDF or save the charts as vector pages (default: fpdf)')
+    parser.add_argument('--image-profile', choices=list(IMAGE_PROFILES), default=DEFAULT_PROFILE,
+                        help=f'Resolution, format and compression of the chart images (default: {DEFAULT_PROFILE})')
+    parser.add_argument('--image-threads', type=int, default=IMAGE_WRITER_THREADS,
+                        help=f'Number of threads per process that encode and write the images, 0 writes them while rendering (default: {IMAGE_WRITER_THREADS})')
+    parser.add_argument('--archive', action='store_true',
+                        help='Write the PDF reports and the plots into one zip archive (outputs.zip) instead of separate files')
+    parser.add_argument('--keep-images', action='store_true',
+                        help='With --in-memory, also save the plots as image files')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read the data in chunks and partition it by participant on disk instead of loading it into memory')
+    parser.add_argument('--chunksize', type=int, default=50000,
+                        help='With --stream, number of rows read at a time (default: 50000)')
+    parser.add_argument('--memory-report', action='store_true',
+                        help='Print the memory saved per column by the preprocessing')
+    parser.add_argument('--no-snapshot', action='store_true',
+                        help='Always load the data from the export instead of the data snapshot')
+    parser.add_argument('--rebuild-snapshot', action='store_true',
+                        help='Rebuild the data snapshot even if it is up to date')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only read the rows appended to the export since the last run, merge them into the data snapshot '
+                             'and only create the plots and reports of the participants with new rows')
+    parser.add_argument('--scores-only', action='store_true',
+                        help='Only load, preprocess and evaluate the data and save the scores as scores.csv, '
+                             'without importing the plotting libraries (ignores --stream)')
+    parser.add_argument('--snapshot-only', action='store_true',
+                        help='Only build (or check) the data snapshot, without creating plots or reports')
+    parser.add_argument('--report', metavar='PATH',
+                        help='Measure the time and memory of every stage and the render time of every chart and save them as JSON report')
+    parser.add_argument('--slowest', type=int, default=10,
+                        help='With --report, number of the slowest participants listed per chart (default: 10)')
+    parser.add_argument('--profile-stage', choices=['data', 'load', 'preprocess', 'evaluate', 'partition', 'render', 'reports', 'archive'],
+                        help='Run one stage under cProfile')
+    parser.add_argument('--profile-output', metavar='PATH',
+                        help='With --profile-stage, path of the profile (default: <stage>.prof)')
+    args = parser.parse_args()
+    if args.archive and args.incremental:
+        # The archive is rewritten on every run and would only contain the participants with new rows
+        parser.error('--archive cannot be combined with --incremental')
+    return args
+
+def questionnaire_columns(data: pd.DataFrame):
+    """
+    Returns the columns of each questionnaire in the preprocessed data.
+
+    Parameters:
+    - data (pd.DataFrame): The preprocessed data.
+
+    Returns:
+    - tuple: The lists of the topics (without Topics_None, unpacked from the topic mask), MDBF and PSS4 columns.
+    """
+    topics_columns = list(TOPIC_FLAG_COLUMNS) if TOPIC_MASK_COLUMN in data.columns else []
+    mdbf_columns = [col for col in data.columns if 'MDBF' in col]
+    pss4_columns = [col for col in data.columns if 'PSS4' in col]
+    return topics_columns, mdbf_columns, pss4_columns
+
+def process_chunk(chunk: pd.DataFrame, selection: ParticipantSelection = None) -> pd.DataFrame:
+    """
+    Preprocesses and evaluates one chunk of the data, used for the partitioned data of --stream.
+
+    Parameters:
+    - chunk (pd.DataFrame): Rows of the loaded data.
+    - selection (ParticipantSelection): Optional selection, the other rows are dropped before the preprocessing.
+
+    Returns:
+    - pd.DataFrame: The evaluated rows.
+    """
+    if selection is not None:
+        chunk = selection.apply(chunk)
+    processed_chunk = preprocess_data(chunk)
+    _, mdbf_columns, pss4_columns = questionnaire_columns(processed_chunk)
+    return evaluation(data=processed_chunk, mdbf_columns=mdbf_columns, pss4_columns=pss4_columns)
+
+def preprocess_and_evaluate(data: pd.DataFrame, memory_report: bool = False, report: RunReport = None) -> pd.DataFrame:
+    """
+    Preprocesses and evaluates the loaded data.
+
+    Parameters:
+    - data (pd.DataFrame): The loaded data.
+    - memory_report (bool): Print the memory saved per column by the preprocessing.
+    - report (RunReport): Optional run report that measures the stages.
+
+    Returns:
+    - pd.DataFrame: The evaluated data.
+    """
+    report = report if report is not None else RunReport(enabled=False)
+
+    # Process the data using the preprocessing module
+    with report.stage('preprocess'):
+        processed_data = preprocess_data(data, report=memory_report)
+
+    # list of columns for each questionnaire
+    _, mdbf_columns, pss4_columns = questionnaire_columns(processed_data)
+
+    # Evaluate questionnaires
+    with report.stage('evaluate'):
+        return evaluation(data=processed_data, mdbf_columns=mdbf_columns, pss4_columns=pss4_columns)
+
+def load_and_evaluate(input_data_path: str, memory_report: bool = False, report: RunReport = None) -> pd.DataFrame:
+    """
+    Loads, preprocesses and evaluates the data.
+
+    Parameters:
+    - input_data_path (str): The path to the data file.
+    - memory_report (bool): Print the memory saved per column by the preprocessing.
+    - report (RunReport): Optional run report that measures the stages.
+
+    Returns:
+    - pd.DataFrame: The evaluated data.
+    """
+    report = report if report is not None else RunReport(enabled=False)
+
+    with report.stage('load'):
+        data = load_data(input_data_path, fast=True)
+
+    return preprocess_and_evaluate(data, memory_report, report)
+
+def load_and_evaluate_tail(input_data_path: str, offset: int, memory_report: bool = False, report: RunReport = None) -> tuple:
+    """
+    Loads, preprocesses and evaluates the rows that were appended to the data file after a byte offset,
+    used for --incremental.
+
+    Parameters:
+    - input_data_path (str): The path to the data file.
+    - offset (int): Byte offset where the new rows start, 0 for all rows.
+    - memory_report (bool): Print the memory saved per column by the preprocessing.
+    - report (RunReport): Optional run report that measures the stages.
+
+    Returns:
+    - tuple: The evaluated rows and the byte offset after the last row.
+    """
+    report = report if report is not None else RunReport(enabled=False)
+
+    with report.stage('load'):
+        data, end_offset = load_data_tail(input_data_path, offset)
+
+    return preprocess_and_evaluate(data, memory_report, report), end_offset
+
+def run_serials(data) -> list:
+    """
+    Returns the SERIALs of the participants of the run.
+
+    Parameters:
+    - data (pd.DataFrame or ParticipantStore): The evaluated data.
+
+    Returns:
+    - list: The SERIALs as text.
+    """
+    if isinstance(data, pd.DataFrame):
+        return list(pd.unique(data['SERIAL'].astype(str)))
+    return [str(unique_id) for unique_id in data.serials]
+
+def save_scores(data: pd.DataFrame, output_dir: str) -> str:
+    """
+    Saves the questionnaire scores of every entry as CSV file, used for --scores-only.
+
+    Parameters:
+    - data (pd.DataFrame): The evaluated data.
+    - output_dir (str): Directory where the file is saved.
+
+    Returns:
+    - str: The path of the file.
+    """
+    scores_path = os.path.join(output_dir, SCORES_FILE)
+    columns = ['SERIAL', 'STARTED'] + [column for column in score_columns() if column in data.columns]
+    data[columns].to_csv(scores_path, index=False)
+    print(f"Scores of {len(data)} entries saved to: {scores_path}")
+    return scores_path
 
 def main():
+    args = parse_args()
+
+    # Batch runs never show a window, so matplotlib does not have to look for a GUI toolkit;
+    # the worker processes inherit the setting
+    os.environ['MPLBACKEND'] = 'Agg'
+
+    # Measures the stages only if a report is requested
+    report = RunReport(enabled=args.report is not None, profile_stage=args.profile_stage, profile_path=args.profile_output)
+    try:
+        run(args, report)
+    finally:
+        if args.report is not None:
+            report.print_summary()
+            report.save(args.report, slowest=args.slowest)
+
+def build_selection(args: argparse.Namespace) -> ParticipantSelection:
+    """
+    Builds the participant selection from the command line arguments.
+
+    Parameters:
+    - args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+    - ParticipantSelection: The selection.
+    """
+    serials = None
+    if args.serial is not None or args.serial_file is not None:
+        serials = list(args.serial or []) + (read_serial_file(args.serial_file) if args.serial_file is not None else [])
+    return ParticipantSelection(serials=serials, start=args.start_date, end=args.end_date, shard=args.shard)
+
+def run(args: argparse.Namespace, report: RunReport):
+    """
+    Runs the pipeline.
+
+    Parameters:
+    - args (argparse.Namespace): The parsed arguments.
+    - report (RunReport): The run report that measures the stages.
+    """
+
     # Set file paths
-    input_data_path = 'data/data.csv'
-    output_dir = 'outputs'
+    input_data_path = args.input
+    output_dir = args.output
+    selection = build_selection(args)
     
     # Create output directory if it doesn't exist
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    # Load the data
-    try:
-        data = load_data(input_data_path)
+    # The data snapshot, if one is used, records which participants were plotted
+    snapshot = None
 
-    except Exception as e:
-        print(e)
+    if args.stream and not args.scores_only:
+        # Partition the data by participant on disk, every chunk is preprocessed and evaluated on its own
+        try:
+            with report.stage('partition'):
+                # Every shard partitions its participants into its own store
+                store_dir = os.path.join(output_dir, selection.shard_file_name(STORE_SUBDIRECTORY))
+                data_with_eval = partition_data(input_data_path, store_dir, process=partial(process_chunk, selection=selection), chunksize=args.chunksize)
+        except Exception as e:
+            print(f"Error during preprocessing: {e}")
+            return
+        if len(data_with_eval) == 0:
+            print("No data to process.")
+            return
+        topics_columns, _, _ = questionnaire_columns(data_with_eval.get(data_with_eval.serials[0]))
+    else:
+        # Load the evaluated data from the snapshot, or build it from the export if the export changed
+        try:
+            with report.stage('data'):
+                affected = None
+                if args.no_snapshot:
+                    data_with_eval = load_and_evaluate(input_data_path, args.memory_report, report)
+                elif args.incremental:
+                    snapshot = DataSnapshot(input_data_path, output_dir, selection.shard_file_name(SNAPSHOT_FILE), selection.shard_file_name(SNAPSHOT_METADATA_FILE))
+                    load_rows = partial(load_and_evaluate_tail, input_data_path, memory_report=args.memory_report, report=report)
+                    data_with_eval, affected = snapshot.load_or_update(load_rows, rebuild=args.rebuild_snapshot)
+                else:
+                    snapshot = DataSnapshot(input_data_path, output_dir, selection.shard_file_name(SNAPSHOT_FILE), selection.shard_file_name(SNAPSHOT_METADATA_FILE))
+                    data_with_eval = snapshot.load_or_build(partial(load_and_evaluate, input_data_path, args.memory_report, report), rebuild=args.rebuild_snapshot)
+        except Exception as e:
+            print(f"Error during preprocessing: {e}")
+            return
 
+        # Only the participants with new rows (or not yet plotted ones) are plotted, with all their rows
+        if affected is not None and not args.scores_only:
+            data_with_eval = data_with_eval[data_with_eval['SERIAL'].astype(str).isin(affected)]
+            # The pending participants of other shards are not counted
+            print(f"{selection.apply(data_with_eval)['SERIAL'].nunique()} participants with new or not yet plotted rows.")
+            if len(data_with_eval) == 0 and not args.snapshot_only:
+                print("No data to process.")
+                return
 
-    # Process the data using the preprocessing module
-    try:
-        processed_data = preprocess_data(data)
-    except Exception as e:
-        print(f"Error during preprocessing: {e}")
+        # The snapshot contains all participants, the selection is applied after loading it
+        if not selection.is_empty:
+            data_with_eval = selection.apply(data_with_eval)
+            print(f"Selected {len(data_with_eval)} rows of {data_with_eval['SERIAL'].nunique()} participants ({selection.describe()}).")
+            if len(data_with_eval) == 0:
+                print("No data to process.")
+                return
+
+        #print head of processed data
+        print("Data loaded and processed successfully.")
+        pd.set_option('display.max_columns', None)  # Show all columns
+        pd.set_option('display.max_rows', 10)       
+        #print(data_with_eval.head())  
+
+        topics_columns, _, _ = questionnaire_columns(data_with_eval)
+
+    if args.snapshot_only:
         return
 
-    #print head of processed data
-    print("Data loaded and processed successfully.")
-    pd.set_option('display.max_columns', None)  # Show all columns
-    pd.set_option('display.max_rows', 10)       
-    #print(processed_data.head())  
+    if args.scores_only:
+        save_scores(data_with_eval, output_dir)
+        return
 
+    # The plotting libraries are only imported if plots are created
+    from visualization import create_visualizations
+    from pdf_generator import create_pdf, create_reports, create_archive
+    from render_cache import RenderCache, MANIFEST_FILE
+    from output_archive import ARCHIVE_FILE
 
-    # list of columns for each questionnaire
-    all_topics_columns = [col for col in processed_data.columns if 'Topics' in col]
-    topics_columns = [col for col in all_topics_columns if col != 'Topics_None']
-    mdbf_columns = [col for col in processed_data.columns if 'MDBF' in col]
-    pss4_columns = [col for col in processed_data.columns if 'PSS4' in col]
+    if args.archive:
+        # All outputs go into one archive, which is written from scratch
+        with report.stage('archive'):
+            create_archive(data=data_with_eval, topics_columns=topics_columns, output_dir=output_dir, workers=args.workers, timings=report.timings, backend=args.pdf_backend, profile=args.image_profile, image_threads=args.image_threads, archive_file=selection.shard_file_name(ARCHIVE_FILE))
+        return
 
-    # Evaluate questionnaires
-    data_with_eval = evaluation(data=processed_data, mdbf_columns=mdbf_columns, pss4_columns=pss4_columns)
+    # Only recreate the plots and reports whose input changed since the last run
+    cache = RenderCache(output_dir, invalidate=args.rebuild, manifest_file=selection.shard_file_name(MANIFEST_FILE))
+
+    if args.in_memory:
+        # Plot the graphs for each unique ID and pass them straight to its PDF report
+        with report.stage('reports'):
+            failures = create_reports(data=data_with_eval, topics_columns=topics_columns, output_dir=output_dir, workers=args.workers, cache=cache, write_images=args.keep_images, timings=report.timings, backend=args.pdf_backend, profile=args.image_profile, image_threads=args.image_threads)
+    else:
+        # Plot graphs for each unique ID
+        with report.stage('render'):
+            failures = create_visualizations(data=data_with_eval, topics_columns=topics_columns, output_dir=output_dir, workers=args.workers, cache=cache, timings=report.timings, profile=args.image_profile, image_threads=args.image_threads)
+
+        # Generate a PDF report from the graphs of the participants of this run that were plotted
+        failed = set(str(unique_id) for unique_id in failures)
+        plotted = [unique_id for unique_id in run_serials(data_with_eval) if unique_id not in failed]
+        with report.stage('reports'):
+            failures.update(create_pdf(output_dir, cache=cache, workers=args.workers, serials=plotted))
 
-    # Plot graphs for each unique ID
-    create_visualizations(data=data_with_eval, topics_columns=topics_columns, output_dir=output_dir)
+    cache.save()
+    cache.report()
 
-    # Generate a PDF report
-    #create_pdf(output_dir)
+    # The participants of the snapshot stay pending until their outputs were created
+    if snapshot is not None:
+        rendered = set(run_serials(data_with_eval)) - set(str(unique_id) for unique_id in failures)
+        # Every shard has its own snapshot, the participants of the other shards are never plotted from it
+        if selection.shard is not None:
+            shard = ParticipantSelection(shard=selection.shard)
+            rendered |= set(unique_id for unique_id in snapshot.pending() if not shard.includes(unique_id))
+        snapshot.rendered(rendered)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
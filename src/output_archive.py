@@ -0,0 +1,193 @@
+import os
+import json
+import zipfile
+
+# Archive of all outputs of a run (main.py --archive), in the output directory
+ARCHIVE_FILE = 'outputs.zip'
+
+# Entry of the archive that maps every SERIAL to the names of its entries
+MANIFEST_ENTRY = 'manifest.json'
+ARCHIVE_VERSION = 1
+
+# Name of the report among the entries of a participant
+REPORT_ENTRY = 'report'
+
+# Fixed modification time of the entries, so that the same outputs give the same archive
+ENTRY_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+def archive_entry(unique_id: str, name: str, extension: str) -> str:
+    """
+    Returns the path of an output in the archive, the outputs of a participant are grouped in a folder.
+
+    Parameters:
+    - unique_id (str): The SERIAL of the participant.
+    - name (str): Name of the output, a chart name or REPORT_ENTRY.
+    - extension (str): The file extension without dot, e.g. 'png'.
+
+    Returns:
+    - str: The path of the entry, e.g. 'P00001/pie_chart.png'.
+    """
+    return f'{unique_id}/{name}.{extension}'
+
+class ArchiveWriter:
+    """
+    Writes outputs into a zip archive as they are produced, with a manifest that maps every SERIAL to its entries.
+    The images and PDFs are already compressed, so they are stored without compressing them again.
+    The archive is written to a temporary file and only replaces the archive at path when it is closed,
+    so an interrupted run does not leave a broken archive.
+
+    Parameters:
+    - path (str): The path of the archive.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.temporary_path = path + '.tmp'
+        self.zip = zipfile.ZipFile(self.temporary_path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True)
+        self.manifest = {}
+
+    def add(self, unique_id: str, name: str, extension: str, data: bytes):
+        """
+        Adds an output of a participant.
+
+        Parameters:
+        - unique_id (str): The SERIAL of the participant.
+        - name (str): Name of the output, a chart name or REPORT_ENTRY.
+        - extension (str): The file extension without dot.
+        - data (bytes): The content of the output.
+        """
+        entry = archive_entry(unique_id, name, extension)
+        self.zip.writestr(zipfile.ZipInfo(entry, date_time=ENTRY_DATE_TIME), data)
+        self.manifest.setdefault(str(unique_id), {})[name] = entry
+
+    def merge(self, parts: list, serials: list = None):
+        """
+        Copies the entries of other archives (e.g. written by worker processes) into this archive.
+
+        Parameters:
+        - parts (list): The paths of the archives.
+        - serials (list): Optional order of the participants in this archive, defaults to the order of the parts.
+        """
+        readers = [OutputArchive(part) for part in parts]
+        try:
+            owners = {unique_id: reader for reader in readers for unique_id in reader.serials}
+            for unique_id in (serials if serials is not None else list(owners)):
+                reader = owners.get(str(unique_id))
+                if reader is None:
+                    continue
+                for name, entry in reader.entries(unique_id).items():
+                    self.zip.writestr(zipfile.ZipInfo(entry, date_time=ENTRY_DATE_TIME), reader.zip.read(entry))
+                    self.manifest.setdefault(str(unique_id), {})[name] = entry
+        finally:
+            for reader in readers:
+                reader.close()
+
+    def close(self):
+        """
+        Writes the manifest and replaces the archive at path.
+        """
+        manifest = {'version': ARCHIVE_VERSION, 'participants': self.manifest}
+        self.zip.writestr(zipfile.ZipInfo(MANIFEST_ENTRY, date_time=ENTRY_DATE_TIME), json.dumps(manifest, indent=1))
+        self.zip.close()
+        os.replace(self.temporary_path, self.path)
+
+    def discard(self):
+        """
+        Closes the archive without saving it.
+        """
+        self.zip.close()
+        os.remove(self.temporary_path)
+
+class OutputArchive:
+    """
+    Reads single outputs from an archive written by ArchiveWriter without extracting it: the zip index
+    is read once and every output is read directly from its position in the archive.
+
+    Parameters:
+    - path (str): The path of the archive.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.zip = zipfile.ZipFile(path, 'r')
+        manifest = json.loads(self.zip.read(MANIFEST_ENTRY))
+        if manifest.get('version') != ARCHIVE_VERSION:
+            self.zip.close()
+            raise ValueError(f"Archive {path} has version {manifest.get('version')}, expected {ARCHIVE_VERSION}.")
+        self.manifest = manifest['participants']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def serials(self) -> list:
+        """
+        The SERIALs of the participants in the archive.
+        """
+        return list(self.manifest)
+
+    def entries(self, unique_id: str) -> dict:
+        """
+        Returns the outputs of a participant.
+
+        Parameters:
+        - unique_id (str): The SERIAL of the participant.
+
+        Returns:
+        - dict: Dictionary with the names of the outputs (chart names and REPORT_ENTRY) as keys and the
+          paths of the entries as values.
+        """
+        if str(unique_id) not in self.manifest:
+            raise KeyError(f"No outputs for ID {unique_id} in {self.path}.")
+        return self.manifest[str(unique_id)]
+
+    def read(self, unique_id: str, name: str) -> bytes:
+        """
+        Reads one output of a participant.
+
+        Parameters:
+        - unique_id (str): The SERIAL of the participant.
+        - name (str): Name of the output, a chart name or REPORT_ENTRY.
+
+        Returns:
+        - bytes: The content of the output.
+        """
+        entries = self.entries(unique_id)
+        if name not in entries:
+            raise KeyError(f"No output '{name}' for ID {unique_id} in {self.path}.")
+        return self.zip.read(entries[name])
+
+    def report(self, unique_id: str) -> bytes:
+        """
+        Reads the PDF report of a participant.
+
+        Parameters:
+        - unique_id (str): The SERIAL of the participant.
+
+        Returns:
+        - bytes: The PDF.
+        """
+        return self.read(unique_id, REPORT_ENTRY)
+
+    def close(self):
+        """
+        Closes the archive.
+        """
+        self.zip.close()
+
+def read_report(archive_path: str, unique_id: str) -> bytes:
+    """
+    Reads the PDF report of one participant from an archive without extracting it.
+
+    Parameters:
+    - archive_path (str): The path of the archive.
+    - unique_id (str): The SERIAL of the participant.
+
+    Returns:
+    - bytes: The PDF.
+    """
+    with OutputArchive(archive_path) as archive:
+        return archive.report(unique_id)
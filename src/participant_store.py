@@ -0,0 +1,202 @@
+import os
+import re
+import json
+import hashlib
+import pandas as pd
+from data_loader import load_data_chunks
+from preprocessing import preprocess_data, apply_schema
+from topics import TopicMoodTable
+from daily_scores import DailyScores, ParticipantDays
+from render_cache import hash_columns
+
+# Subdirectory of the output directory for the partitioned data
+STORE_SUBDIRECTORY = 'participants'
+
+# Columns that are read as text, apply_schema turns them into categoricals
+TEXT_COLUMNS = ['SERIAL', 'REF', 'QUESTNNR', 'MODE']
+
+# File of the participant store that maps every SERIAL to the file of its partition
+STORE_MANIFEST = 'manifest.json'
+
+# SERIALs that are used as file names as they are: letters, digits, '_', '-' and '.' (not at the start)
+SAFE_FILE_NAME = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.-]{0,99}')
+
+def partition_file_name(unique_id: str, taken: set = frozenset()) -> str:
+    """
+    Returns the file name of the partition of one participant. The SERIALs come from the survey data and
+    may contain any character, so only a SERIAL that is a safe file name (see SAFE_FILE_NAME) is used as it
+    is; any other gets a name from a hash of the SERIAL, which cannot leave the store directory. A SERIAL
+    that only differs in case from a name in taken also gets the hashed name, because the file system may
+    not tell them apart.
+
+    Parameters:
+    - unique_id (str): The SERIAL of the participant.
+    - taken (set): The lowercase file names that are already used.
+
+    Returns:
+    - str: The file name of the partition.
+    """
+    name = f'{unique_id}.csv'
+    if SAFE_FILE_NAME.fullmatch(str(unique_id)) is None or name.lower() in taken:
+        # Hashed names start with '_', which SAFE_FILE_NAME does not allow
+        name = f"_{hashlib.blake2b(str(unique_id).encode('utf-8'), digest_size=16).hexdigest()}.csv"
+    return name
+
+class ParticipantStore:
+    """
+    Participant index of data that is partitioned on disk with one CSV file per participant.
+    It has the same interface as visualization.ParticipantIndex, but the rows of a participant are only
+    read when they are needed, so the charts and reports can be created one participant at a time
+    without keeping the whole dataset in memory.
+
+    The file of every partition is looked up in the manifest of the store (STORE_MANIFEST), see partition_file_name.
+
+    Parameters:
+    - store_dir (str): Directory of the participant store, see partition_data.
+    - serials (list): Optional SERIALs of the participants to include, defaults to all in the store.
+    - files (dict): Optional file names of the partitions by SERIAL, defaults to the manifest of the store.
+    """
+
+    def __init__(self, store_dir: str, serials: list = None, files: dict = None):
+        self.store_dir = store_dir
+        if files is None:
+            with open(os.path.join(store_dir, STORE_MANIFEST), encoding='utf-8') as f:
+                files = json.load(f)
+        self.files = files
+        if serials is None:
+            # Same order as ParticipantIndex, which sorts by SERIAL
+            serials = sorted(files)
+        self.serials = list(serials)
+        self._members = set(self.serials)
+        # The last participant that was read, the charts of a participant read its rows several times
+        self._last = None
+
+    def __len__(self) -> int:
+        return len(self.serials)
+
+    def __contains__(self, unique_id) -> bool:
+        return unique_id in self._members
+
+    def __iter__(self):
+        """
+        Yields (unique_id, subset) for every participant in SERIAL order.
+        """
+        for unique_id in self.serials:
+            yield unique_id, self.get(unique_id)
+
+    def get(self, unique_id) -> pd.DataFrame:
+        """
+        Reads the rows of a single participant.
+
+        Parameters:
+        - unique_id: The SERIAL of the participant.
+
+        Returns:
+        - pd.DataFrame: The rows of the participant.
+        """
+        if self._last is not None and self._last[0] == unique_id:
+            return self._last[1]
+        subset = pd.read_csv(
+            os.path.join(self.store_dir, self.files[unique_id]),
+            dtype={column: str for column in TEXT_COLUMNS},
+            parse_dates=['STARTED'],
+            keep_default_na=False,  # Keep text like 'nan' that preprocess_data created
+            na_values=['']
+        )
+        # Restore the compact data types of preprocess_data
+        subset = apply_schema(subset)
+        self._last = (unique_id, subset)
+        return subset
+
+    def topic_moods(self, unique_id, topics_columns: list) -> pd.DataFrame:
+        """
+        Returns the mentions and mean MDBF scores per topic of a single participant (see topics.topic_mood_table).
+
+        Parameters:
+        - unique_id: The SERIAL of the participant.
+        - topics_columns (list): List of column names related to topics.
+
+        Returns:
+        - pd.DataFrame: The rows of the participant in the topic mood table, indexed by topic.
+        """
+        return TopicMoodTable(self.get(unique_id), topics_columns).participant(unique_id)
+
+    def days(self, unique_id) -> ParticipantDays:
+        """
+        Returns the study days of a single participant (see daily_scores.DailyScores).
+
+        Parameters:
+        - unique_id: The SERIAL of the participant.
+
+        Returns:
+        - ParticipantDays: The study days of the participant.
+        """
+        return DailyScores(self.get(unique_id)).participant(unique_id)
+
+    def take(self, unique_ids: list) -> 'ParticipantStore':
+        """
+        Returns the store restricted to several participants. Unlike ParticipantIndex.take no rows are read,
+        so a worker process that receives it only reads the rows of its own participants.
+
+        Parameters:
+        - unique_ids (list): The SERIALs of the participants.
+
+        Returns:
+        - ParticipantStore: The store with only these participants.
+        """
+        return ParticipantStore(self.store_dir, unique_ids, {unique_id: self.files[unique_id] for unique_id in unique_ids})
+
+    def row_hashes(self, columns: dict):
+        """
+        Yields a hash of every row of every participant for several sets of columns, used for the fingerprints
+        of the render cache (see render_cache.hash_columns). Every partition is read once for all sets.
+
+        Parameters:
+        - columns (dict): Dictionary with names (e.g. the charts) as keys and the lists of columns to hash as values.
+
+        Returns:
+        - generator of (str, dict): The SERIAL and the row hashes of every participant by name.
+        """
+        for unique_id, subset in self:
+            yield unique_id, hash_columns(subset, columns)
+
+def partition_data(filepath: str, store_dir: str, process=preprocess_data, chunksize: int = 50000) -> ParticipantStore:
+    """
+    Reads a dataset in chunks, processes every chunk and appends the rows of each participant to its partition file.
+    Only one chunk is kept in memory at a time, so the memory use does not grow with the size of the export.
+    The partitions from an earlier run are replaced. The file of every SERIAL is saved in the manifest of the store.
+
+    Parameters:
+    - filepath (str): The path to the data file.
+    - store_dir (str): Directory of the participant store.
+    - process (callable): Function applied to every chunk, it has to work row by row (e.g. preprocess_data).
+    - chunksize (int): Number of rows per chunk.
+
+    Returns:
+    - ParticipantStore: The store of the partitioned data.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    for file in os.listdir(store_dir):
+        if file.endswith('.csv'):
+            os.remove(os.path.join(store_dir, file))
+
+    files = {}
+    taken = set()
+    n_rows = 0
+    for chunk in load_data_chunks(filepath, chunksize):
+        chunk = process(chunk)
+        for unique_id, rows in chunk.groupby('SERIAL', sort=False, observed=True):
+            unique_id = str(unique_id)
+            # The header is only written with the first rows of a participant
+            header = unique_id not in files
+            if header:
+                files[unique_id] = partition_file_name(unique_id, taken)
+                taken.add(files[unique_id].lower())
+            rows.to_csv(os.path.join(store_dir, files[unique_id]), mode='a', header=header, index=False)
+        n_rows += len(chunk)
+
+    with open(os.path.join(store_dir, STORE_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(files, f)
+    print(f"Partitioned {n_rows} rows of {len(files)} participants into {store_dir}")
+
+    return ParticipantStore(store_dir, files=files)
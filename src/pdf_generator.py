@@ -1,64 +1,575 @@
 import os
+import io
+import time
+import tempfile
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
 import pandas as pd
-from fpdf import FPDF
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from participant_store import ParticipantStore
+from output_archive import ArchiveWriter, ARCHIVE_FILE, REPORT_ENTRY
+from visualization import ParticipantIndex, render_participant, render_plan, report_failures, chart_file_path, chart_inputs, DEFAULT_CHARTS, SAVE_OPTIONS
+from image_writer import save_image, rasterize, encode, image_extension, DEFAULT_PROFILE, IMAGE_WRITER_THREADS, IMAGE_EXTENSIONS
 
-def create_pdf(output_dir: str):
+# Charts that can be contained in a report, named by the prefix of their image files, and their page titles
+REPORT_CHARTS = ['pie_chart', 'line_graph', 'heatmap', 'diverging_barchart', 'forcegraph']
+REPORT_TITLES = {
+    'pie_chart': "Pie Chart",
+    'line_graph': "Line Graph",
+    'heatmap': "Heatmap",
+    'diverging_barchart': "Diverging Bar Chart",
+    'forcegraph': "Force Graph",
+}
+
+# Subdirectory of the output directory for the reports
+PDF_SUBDIRECTORY = 'PDFs'
+
+# Ways to write the reports and their versions, bump a version when its layout changes so that the cached reports are recreated
+# - fpdf: the charts are rendered as images of the image profile (PNG or JPEG) and placed on the pages with FPDF
+# - vector: the charts are saved by matplotlib as vector pages of a multi-page PDF, without images
+REPORT_BACKENDS = {
+    'fpdf': 1,
+    'vector': 1,
+}
+
+# Size of the title page of the vector reports in inches (A4)
+A4_SIZE = (8.27, 11.69)
+
+def report_file_path(output_dir: str, unique_id: str) -> str:
     """
-    Creates a PDF report containing all the graphs generated for each unique ID.
-    
+    Returns the path of the PDF report of one participant.
+
     Parameters:
     - output_dir (str): Directory where the graphs and PDFs are saved.
+    - unique_id (str): The SERIAL of the participant.
+
+    Returns:
+    - str: The path of the report.
+    """
+    return os.path.join(output_dir, PDF_SUBDIRECTORY, f'report_{unique_id}.pdf')
+
+class ReportBuilder:
+    """
+    Builds and saves the PDF reports. Everything that is the same for all reports (the report directory,
+    the font and the static text of the title page and the chart pages) is prepared once when the builder
+    is created, so a worker only creates one builder and reuses it for all its reports.
+
+    Parameters:
+    - output_dir (str): Directory where the PDFs are saved.
     """
-    
-    # Get the list of files in the output directory
-    files = os.listdir(output_dir)
-    
-     # Find all unique IDs from the filenames
-    unique_ids = set()
-    for file in files:
-        if file.endswith('.png'):
-            # Extract ID from the filename (assuming it is the part before '.png')
-            parts = file.split('_')
-            if len(parts) > 2:
-                id_part = parts[-1].split('.')[0]
-                unique_ids.add(id_part)
-    
-    # Create a PDF for each unique ID
-    for unique_id in unique_ids:
+
+    font = "helvetica"
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        os.makedirs(os.path.join(output_dir, PDF_SUBDIRECTORY), exist_ok=True)
+
+        # Static text of the title page as (font style, font size, text), the ID is filled in per report
+        self.title_page = [
+            ('B', 16, "Data Visualization Report for ID {unique_id}"),
+            ('', 12, "This report contains visualizations for this specific ID."),
+        ]
+        self.chart_pages = [(chart, REPORT_TITLES[chart]) for chart in REPORT_CHARTS]
+        # Title page of the vector reports, created on first use
+        self._title_figure = None
+        self._title_texts = []
+
+    def build(self, unique_id: str, images: dict) -> 'FPDF':
+        """
+        Builds the PDF report of one participant.
+
+        Parameters:
+        - unique_id (str): The SERIAL of the participant.
+        - images (dict): Dictionary with the chart names as keys and the path of the image file
+          or the encoded image (bytes) as values. Charts without image are left out.
+
+        Returns:
+        - FPDF: The report.
+        """
+        # fpdf is only imported by the FPDF backend
+        from fpdf import FPDF
+        from fpdf.enums import XPos, YPos
+
         pdf = FPDF()
-        
+
         # Add a title page
         pdf.add_page()
-        pdf.set_font("Arial", style='B', size=16)
-        pdf.cell(200, 10, f"Data Visualization Report for ID {unique_id}", ln=True, align='C')
-        pdf.ln(10)
-        pdf.set_font("Arial", size=12)
-        pdf.cell(200, 10, "This report contains visualizations for this specific ID.", ln=True, align='C')
-        pdf.ln(10)
-        
-        # Add plots for this unique ID
-        pie_chart_file = os.path.join(output_dir, f'pie_chart_{unique_id}.png')
-        line_graph_file = os.path.join(output_dir, f'line_graph_{unique_id}.png')
-        
-        if os.path.exists(pie_chart_file):
-            pdf.add_page()
-            pdf.set_font("Arial", style='B', size=14)
-            pdf.cell(200, 10, "Pie Chart", ln=True, align='C')
+        for style, size, text in self.title_page:
+            pdf.set_font(self.font, style=style, size=size)
+            pdf.cell(200, 10, text.format(unique_id=unique_id), new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
             pdf.ln(10)
-            pdf.image(pie_chart_file, x=10, y=30, w=180)
-        
-        if os.path.exists(line_graph_file):
+
+        # Add plots for this unique ID
+        for chart, title in self.chart_pages:
+            if chart not in images:
+                continue
+            image = images[chart]
             pdf.add_page()
-            pdf.set_font("Arial", style='B', size=14)
-            pdf.cell(200, 10, "Line Graph", ln=True, align='C')
+            pdf.set_font(self.font, style='B', size=14)
+            pdf.cell(200, 10, title, new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
             pdf.ln(10)
-            pdf.image(line_graph_file, x=10, y=30, w=180)
-        
-        # Save the PDF report in a subdirectory
-        subdirectory = 'PDFs'
-        subdirectory_path = os.path.join(output_dir, subdirectory)
-        os.makedirs(subdirectory_path, exist_ok=True)
-        pdf_output_path = os.path.join(subdirectory_path, f'report_{unique_id}.pdf')
-        pdf.output(pdf_output_path)
+            pdf.image(io.BytesIO(image) if isinstance(image, bytes) else image, x=10, y=30, w=180)
+
+        return pdf
+
+    def save(self, unique_id: str, images: dict):
+        """
+        Builds the PDF report of one participant and saves it in the report directory.
+
+        Parameters:
+        - unique_id (str): The SERIAL of the participant.
+        - images (dict): Dictionary with the chart names as keys and the path of the image file
+          or the encoded image (bytes) as values.
+        """
+        pdf_output_path = report_file_path(self.output_dir, unique_id)
+        self.build(unique_id, images).output(pdf_output_path)
         print(f"PDF report for ID {unique_id} saved to: {pdf_output_path}")
+
+    def title_figure(self, unique_id: str) -> Figure:
+        """
+        Returns the title page of a vector report as figure. The figure is created once and reused,
+        only its text is replaced per report.
+
+        Parameters:
+        - unique_id (str): The SERIAL of the participant.
+
+        Returns:
+        - Figure: The title page.
+        """
+        if self._title_figure is None:
+            # Reused for every report of the process
+            self._title_figure = Figure(figsize=A4_SIZE)
+            self._title_texts = [
+                self._title_figure.text(0.5, 0.93 - i * 0.04, '', ha='center', va='top', size=size,
+                                        weight='bold' if style == 'B' else 'normal', family='sans-serif')
+                for i, (style, size, _) in enumerate(self.title_page)
+            ]
+        for artist, (_, _, text) in zip(self._title_texts, self.title_page):
+            artist.set_text(text.format(unique_id=unique_id))
+        return self._title_figure
+
+    def write_vector(self, index: ParticipantIndex, unique_id: str, topics_columns: list, charts: list, timings: list = None, write_images: bool = False, profile: str = DEFAULT_PROFILE, output=None, on_image=None):
+        """
+        Renders the charts of one participant straight into a multi-page vector PDF report and saves it
+        in the report directory (or writes it to output), each chart on its own page with its title above it.
+
+        Parameters:
+        - index (ParticipantIndex): Participant index of the data.
+        - unique_id (str): The SERIAL of the participant.
+        - topics_columns (list): List of column names related to topics.
+        - charts (list): Names of the charts to render, they are placed in the order of REPORT_CHARTS.
+        - timings (list): Optional list, the (unique_id, chart, seconds) render time of every chart is appended.
+        - write_images (bool): Also save the images of the charts to the output directory.
+        - profile (str): Name of the image profile of the saved images (key of image_writer.IMAGE_PROFILES).
+        - output: Optional binary file object the report is written to instead of the report directory.
+        - on_image (callable): Optional function called with the chart name and the encoded image instead of
+          saving the images to the output directory, only used with write_images.
+        """
+        from matplotlib.backends.backend_pdf import PdfPages
+
+        pdf_output_path = report_file_path(self.output_dir, unique_id) if output is None else output
+        charts = [chart for chart, _ in self.chart_pages if chart in charts]
+
+        def save_page(chart, fig):
+            # The title is removed again after saving, the figure may be a reused template
+            title = fig.text(0.5, 1.0, REPORT_TITLES[chart], ha='center', va='bottom', size=14, weight='bold')
+            try:
+                pages.savefig(fig, bbox_inches='tight', **SAVE_OPTIONS[chart])
+            finally:
+                title.remove()
+            if write_images and on_image is not None:
+                on_image(chart, encode(rasterize(fig, profile, **SAVE_OPTIONS[chart]), profile))
+            elif write_images:
+                save_image(fig, chart_file_path(self.output_dir, chart, unique_id, image_extension(profile)), profile, **SAVE_OPTIONS[chart])
+
+        # Without a creation date, unchanged reports are byte-identical
+        with PdfPages(pdf_output_path, metadata={'CreationDate': None}) as pages:
+            pages.savefig(self.title_figure(unique_id))
+            render_participant(index, unique_id, topics_columns, self.output_dir, charts, timings=timings, save_figure=save_page)
+        if output is None:
+            print(f"PDF report for ID {unique_id} saved to: {pdf_output_path}")
+
+# Report builders of the current process, one per output directory
+_builders = {}
+
+def get_report_builder(output_dir: str) -> ReportBuilder:
+    """
+    Returns the report builder of the current process for an output directory, and creates it on first use.
+
+    Parameters:
+    - output_dir (str): Directory where the PDFs are saved.
+
+    Returns:
+    - ReportBuilder: The report builder.
+    """
+    if output_dir not in _builders:
+        _builders[output_dir] = ReportBuilder(output_dir)
+    return _builders[output_dir]
+
+def _save_report(unique_id: str, images: dict, output_dir: str):
+    """
+    Saves the PDF report of one participant from its in-memory images, used as callback of render_plan.
+
+    Parameters:
+    - unique_id (str): The SERIAL of the participant.
+    - images (dict): Dictionary with the chart names as keys and the encoded images (bytes) as values.
+    - output_dir (str): Directory where the PDFs are saved.
+    """
+    get_report_builder(output_dir).save(unique_id, images)
+
+def _write_vector_report(index: ParticipantIndex, unique_id: str, topics_columns: list, charts: list, timings: list, output_dir: str, write_images: bool, profile: str):
+    """
+    Writes the vector PDF report of one participant, used as render function of render_plan.
+
+    Parameters:
+    - index (ParticipantIndex): Participant index of the data.
+    - unique_id (str): The SERIAL of the participant.
+    - topics_columns (list): List of column names related to topics.
+    - charts (list): Names of the charts in the report.
+    - timings (list): Optional list, the (unique_id, chart, seconds) render time of every chart is appended.
+    - output_dir (str): Directory where the PDFs (and optionally the graphs) are saved.
+    - write_images (bool): Also save the images of the charts to output_dir.
+    - profile (str): Name of the image profile of the saved images.
+    """
+    get_report_builder(output_dir).write_vector(index, unique_id, topics_columns, charts, timings, write_images, profile)
+
+# Archives the current process writes its outputs to, one per directory of parts, and the number of parts
+# it wrote, see create_archive; a run with one process writes straight into the final archive
+_archive_parts = {}
+_archive_part_numbers = itertools.count()
+
+def get_archive_part(parts_dir: str) -> ArchiveWriter:
+    """
+    Returns the archive the current process writes its outputs to: the final archive if create_archive
+    registered it for parts_dir, otherwise a part archive in parts_dir that is created on first use.
+
+    Parameters:
+    - parts_dir (str): Directory of the part archives.
+
+    Returns:
+    - ArchiveWriter: The part archive.
+    """
+    if parts_dir not in _archive_parts:
+        _archive_parts[parts_dir] = ArchiveWriter(os.path.join(parts_dir, f'part-{os.getpid()}-{next(_archive_part_numbers)}.zip'))
+    return _archive_parts[parts_dir]
+
+def _close_archive_part(parts_dir: str):
+    """
+    Closes the part archive of the current process at the end of a shard, used as on_finished of render_plan.
+
+    Parameters:
+    - parts_dir (str): Directory of the part archives.
+    """
+    if parts_dir in _archive_parts:
+        _archive_parts.pop(parts_dir).close()
+
+def _archive_report(unique_id: str, images: dict, parts_dir: str, extension: str, write_images: bool):
+    """
+    Adds the PDF report of one participant, built from its in-memory images, and the images to the part
+    archive of the current process, used as callback of render_plan.
+
+    Parameters:
+    - unique_id (str): The SERIAL of the participant.
+    - images (dict): Dictionary with the chart names as keys and the encoded images (bytes) as values.
+    - parts_dir (str): Directory of the part archives.
+    - extension (str): The file extension of the images.
+    - write_images (bool): Also add the images.
+    """
+    report = bytes(get_report_builder(parts_dir).build(unique_id, images).output())
+    part = get_archive_part(parts_dir)
+    if write_images:
+        for chart, image in images.items():
+            part.add(unique_id, chart, extension, image)
+    part.add(unique_id, REPORT_ENTRY, 'pdf', report)
+
+def _archive_vector_report(index: ParticipantIndex, unique_id: str, topics_columns: list, charts: list, timings: list, parts_dir: str, write_images: bool, profile: str):
+    """
+    Adds the vector PDF report of one participant and the images of its charts to the part archive
+    of the current process, used as render function of render_plan.
+
+    Parameters:
+    - index (ParticipantIndex): Participant index of the data.
+    - unique_id (str): The SERIAL of the participant.
+    - topics_columns (list): List of column names related to topics.
+    - charts (list): Names of the charts in the report.
+    - timings (list): Optional list, the (unique_id, chart, seconds) render time of every chart is appended.
+    - parts_dir (str): Directory of the part archives.
+    - write_images (bool): Also add the images.
+    - profile (str): Name of the image profile of the images.
+    """
+    report = io.BytesIO()
+    images = {}
+    get_report_builder(parts_dir).write_vector(index, unique_id, topics_columns, charts, timings, write_images, profile, output=report, on_image=images.__setitem__)
+    part = get_archive_part(parts_dir)
+    for chart, image in images.items():
+        part.add(unique_id, chart, image_extension(profile), image)
+    part.add(unique_id, REPORT_ENTRY, 'pdf', report.getvalue())
+
+def _save_reports(jobs: list, output_dir: str) -> dict:
+    """
+    Saves the PDF reports of several participants and collects the errors instead of raising them.
+    Used by create_pdf, both directly and in the worker processes.
+
+    Parameters:
+    - jobs (list): List of (unique_id, images) tuples, with the images as in ReportBuilder.build.
+    - output_dir (str): Directory where the PDFs are saved.
+
+    Returns:
+    - failures (dict): Dictionary with the SERIALs that failed as keys and the error message as values.
+    """
+    builder = get_report_builder(output_dir)
+    failures = {}
+    for unique_id, images in jobs:
+        try:
+            builder.save(unique_id, images)
+        except Exception as e:
+            failures[unique_id] = f"{type(e).__name__}: {e}"
+    return failures
+
+def _print_throughput(n_reports: int, seconds: float):
+    """
+    Prints how many reports were created per second.
+
+    Parameters:
+    - n_reports (int): Number of reports that were created.
+    - seconds (float): Time it took in seconds.
+    """
+    rate = n_reports / seconds if seconds > 0 else 0.0
+    print(f"Created {n_reports} PDF reports in {seconds:.1f} s ({rate:.1f} reports/s)")
+
+def create_pdf(output_dir: str, cache=None, workers: int = 1, serials: list = None) -> dict:
+    """
+    Creates a PDF report containing all the graphs generated for each unique ID.
+
+    Parameters:
+    - output_dir (str): Directory where the graphs and PDFs are saved.
+    - cache (RenderCache): Optional render cache, reports whose charts did not change are not recreated.
+    - workers (int): Number of worker processes, 1 creates all reports in the current process.
+    - serials (list): Optional SERIALs of the participants whose reports are created, defaults to all with
+      graphs in output_dir (e.g. only the participants of the current run or shard).
+
+    Returns:
+    - failures (dict): Dictionary with the SERIALs that failed as keys and the error message as values.
+    """
+    start_time = time.perf_counter()
+
+    # Find all unique IDs and their graphs from the filenames in the output directory
+    images = {}
+    selected = set(str(unique_id) for unique_id in serials) if serials is not None else None
+    for file in os.listdir(output_dir):
+        root, extension = os.path.splitext(file)
+        if extension[1:] in IMAGE_EXTENSIONS.values():
+            # Extract ID from the filename (the part between the chart name and the extension, it may contain '_')
+            for chart in REPORT_CHARTS:
+                if root.startswith(f'{chart}_'):
+                    unique_id = root[len(chart) + 1:]
+                    if selected is None or unique_id in selected:
+                        images.setdefault(unique_id, {})[chart] = os.path.join(output_dir, file)
+
+    # Skip the reports whose charts are the same as in the last run
+    fingerprints = {}
+    jobs = []
+    for unique_id in sorted(images):
+        if cache is not None:
+            fingerprints[unique_id] = cache.combine('report', [
+                cache.stored(chart, unique_id) for chart in REPORT_CHARTS
+                if cache.stored(chart, unique_id) is not None
+            ])
+            if cache.is_fresh('report', unique_id, fingerprints[unique_id], report_file_path(output_dir, unique_id)):
+                continue
+        jobs.append((unique_id, images[unique_id]))
+
+    if workers <= 1 or len(jobs) <= 1:
+        failures = _save_reports(jobs, output_dir)
+    else:
+        failures = {}
+        # Several chunks per worker, so that a slow chunk does not leave the other workers idle
+        chunks = np.array_split(np.arange(len(jobs)), min(len(jobs), workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_save_reports, [jobs[i] for i in chunk], output_dir) for chunk in chunks]
+            for future in futures:
+                failures.update(future.result())
+
+    _print_throughput(len(jobs) - len(failures), time.perf_counter() - start_time)
+
+    if cache is not None:
+        for unique_id, _ in jobs:
+            # Failed reports are not stored, so that they are retried on the next run
+            if unique_id in failures:
+                cache.invalidate(['report'], [unique_id])
+            else:
+                cache.update('report', unique_id, fingerprints[unique_id], report_file_path(output_dir, unique_id))
+
+    report_failures(failures, len(images), 'PDF reports')
+
+    return failures
+
+def create_reports(data: pd.DataFrame, topics_columns: list, output_dir: str, charts: list = None, workers: int = 1, cache=None, write_images: bool = False, timings: list = None, backend: str = 'fpdf', profile: str = DEFAULT_PROFILE, image_threads: int = IMAGE_WRITER_THREADS) -> dict:
+    """
+    Creates the PDF reports directly from the data: the charts of each participant are rendered into memory
+    and passed straight to the report, without writing and re-reading image files or scanning the output directory.
+
+    Parameters:
+    - data (pd.DataFrame or ParticipantStore): The input DataFrame containing the data, or the data partitioned
+      on disk by participant, which is read one participant at a time.
+    - topics_columns (list): List of column names related to topics.
+    - output_dir (str): Directory where the PDFs (and optionally the graphs) are saved.
+    - charts (list): Names of the charts in the reports, defaults to the charts of create_visualizations.
+    - workers (int): Number of worker processes, 1 creates everything in the current process.
+    - cache (RenderCache): Optional render cache, reports whose charts did not change are not recreated.
+    - write_images (bool): Also save the images of the charts to output_dir.
+    - timings (list): Optional list, the (unique_id, chart, seconds) render time of every chart is appended.
+    - backend (str): How the reports are written, a key of REPORT_BACKENDS.
+    - profile (str): Name of the image profile of the images (key of image_writer.IMAGE_PROFILES); the vector
+      reports only use it for the saved images.
+    - image_threads (int): Number of threads per process that encode the images.
+
+    Returns:
+    - failures (dict): Dictionary with the SERIALs that failed as keys and the error message as values.
+    """
+    if backend not in REPORT_BACKENDS:
+        raise ValueError(f"Unknown report backend '{backend}', expected one of {list(REPORT_BACKENDS)}.")
+
+    start_time = time.perf_counter()
+    os.makedirs(os.path.join(output_dir, PDF_SUBDIRECTORY), exist_ok=True)
+
+    index = data if isinstance(data, ParticipantStore) else ParticipantIndex(data)
+    charts = charts if charts is not None else DEFAULT_CHARTS
+    extension = image_extension(profile)
+
+    # A report is recreated with all its charts if one of them changed
+    if cache is not None:
+        fingerprints = cache.fingerprints(index, chart_inputs(charts, topics_columns, profile))
+        report_fingerprints = {
+            unique_id: cache.combine('report', [f'{backend}-{REPORT_BACKENDS[backend]}'] + [fingerprints[chart][unique_id] for chart in REPORT_CHARTS if chart in charts])
+            for unique_id in index.serials
+        }
+        plan = {}
+        for unique_id in index.serials:
+            fresh = cache.is_fresh('report', unique_id, report_fingerprints[unique_id], report_file_path(output_dir, unique_id))
+            # The images only count if they are kept
+            if write_images:
+                fresh = all([
+                    cache.is_fresh(chart, unique_id, fingerprints[chart][unique_id], chart_file_path(output_dir, chart, unique_id, extension))
+                    for chart in charts
+                ]) and fresh
+            if not fresh:
+                plan[unique_id] = charts
+    else:
+        plan = {unique_id: charts for unique_id in index.serials}
+
+    if backend == 'vector':
+        failures = render_plan(
+            index, plan, topics_columns, output_dir, workers, timings=timings,
+            render=partial(_write_vector_report, output_dir=output_dir, write_images=write_images, profile=profile)
+        )
+    else:
+        failures = render_plan(
+            index, plan, topics_columns, output_dir, workers,
+            on_rendered=partial(_save_report, output_dir=output_dir), write_images=write_images, timings=timings,
+            profile=profile, image_threads=image_threads
+        )
+
+    _print_throughput(len(plan) - len(failures), time.perf_counter() - start_time)
+
+    if cache is not None:
+        for unique_id in plan:
+            # Failed participants are not stored, so that they are retried on the next run
+            if unique_id in failures:
+                cache.invalidate(['report'] + list(charts), [unique_id])
+                continue
+            cache.update('report', unique_id, report_fingerprints[unique_id], report_file_path(output_dir, unique_id))
+            if write_images:
+                for chart in charts:
+                    cache.update(chart, unique_id, fingerprints[chart][unique_id], chart_file_path(output_dir, chart, unique_id, extension))
+
+    report_failures(failures, len(index))
+
+    return failures
+
+def create_archive(data: pd.DataFrame, topics_columns: list, output_dir: str, charts: list = None, workers: int = 1, write_images: bool = True, timings: list = None, backend: str = 'fpdf', profile: str = DEFAULT_PROFILE, image_threads: int = IMAGE_WRITER_THREADS, archive_file: str = ARCHIVE_FILE) -> dict:
+    """
+    Creates the PDF reports (and the images of the charts) and writes them into one zip archive in the output
+    directory instead of separate files, see output_archive.OutputArchive for reading single reports back.
+
+    With one worker, the outputs are streamed straight into the archive as they are produced, in SERIAL order.
+    With several worker processes, a zip file cannot be written by several processes, so every process
+    streams the outputs of its participants into a part archive and the parts are copied into the archive in
+    SERIAL order at the end. This merge step writes every output twice, so it is only used for the parallel
+    run; the parts are kept in a temporary directory next to the archive, which has room for the outputs,
+    rather than in a local temporary directory that may be small. The archive gets a manifest of the entries
+    of every participant and replaces the one of an earlier run, so the render cache is not used.
+
+    Parameters:
+    - data (pd.DataFrame or ParticipantStore): The input DataFrame containing the data, or the data partitioned
+      on disk by participant, which is read one participant at a time.
+    - topics_columns (list): List of column names related to topics.
+    - output_dir (str): Directory where the archive is saved.
+    - charts (list): Names of the charts in the reports, defaults to the charts of create_visualizations.
+    - workers (int): Number of worker processes, 1 creates everything in the current process.
+    - write_images (bool): Also add the images of the charts to the archive.
+    - timings (list): Optional list, the (unique_id, chart, seconds) render time of every chart is appended.
+    - backend (str): How the reports are written, a key of REPORT_BACKENDS.
+    - profile (str): Name of the image profile of the images (key of image_writer.IMAGE_PROFILES).
+    - image_threads (int): Number of threads per process that encode the images.
+    - archive_file (str): The file name of the archive in output_dir, e.g. with the shard of the run.
+
+    Returns:
+    - failures (dict): Dictionary with the SERIALs that failed as keys and the error message as values.
+    """
+    if backend not in REPORT_BACKENDS:
+        raise ValueError(f"Unknown report backend '{backend}', expected one of {list(REPORT_BACKENDS)}.")
+
+    start_time = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+
+    index = data if isinstance(data, ParticipantStore) else ParticipantIndex(data)
+    charts = charts if charts is not None else DEFAULT_CHARTS
+    plan = {unique_id: charts for unique_id in index.serials}
+
+    archive_path = os.path.join(output_dir, archive_file)
+    with tempfile.TemporaryDirectory(prefix=f'{archive_file}.parts-', dir=output_dir) as parts_dir:
+        archive = ArchiveWriter(archive_path)
+        parallel = workers > 1 and len(plan) > 1
+        try:
+            if not parallel:
+                # The outputs are written straight into the archive by the callbacks of this process
+                _archive_parts[parts_dir] = archive
+            on_finished = partial(_close_archive_part, parts_dir) if parallel else None
+            if backend == 'vector':
+                failures = render_plan(
+                    index, plan, topics_columns, output_dir, workers, timings=timings,
+                    render=partial(_archive_vector_report, parts_dir=parts_dir, write_images=write_images, profile=profile),
+                    on_finished=on_finished
+                )
+            else:
+                failures = render_plan(
+                    index, plan, topics_columns, output_dir, workers,
+                    on_rendered=partial(_archive_report, parts_dir=parts_dir, extension=image_extension(profile), write_images=write_images),
+                    write_images=False, timings=timings, profile=profile, image_threads=image_threads,
+                    on_finished=on_finished
+                )
+
+            if parallel:
+                parts = sorted(os.path.join(parts_dir, file) for file in os.listdir(parts_dir) if file.endswith('.zip'))
+                # Failed participants may have been added before their error
+                archive.merge(parts, [unique_id for unique_id in index.serials if unique_id not in failures])
+            else:
+                # Entries a failed participant added before its error stay in the file, but not in the manifest
+                for unique_id in failures:
+                    archive.manifest.pop(str(unique_id), None)
+        except BaseException:
+            archive.discard()
+            raise
+        finally:
+            _archive_parts.pop(parts_dir, None)
+        archive.close()
+
+    _print_throughput(len(plan) - len(failures), time.perf_counter() - start_time)
+    print(f"Archive with the outputs of {len(archive.manifest)} participants saved to: {archive_path}")
+
+    report_failures(failures, len(index))
+
+    return failures
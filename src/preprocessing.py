@@ -1,51 +1,142 @@
+import numpy as np
 import pandas as pd
 import os
 
-def preprocess_data(data: pd.DataFrame) -> pd.DataFrame:
+# SoSci Survey item codes and the names they are renamed to
+COLUMN_RENAME_DICT = {
+    'MB01_01': 'MDBF_Awake', # 1 (Sehr müde) - 7 (Sehr wach), -9 not answered
+    'MB01_02': 'MDBF_Satisfied', # 1 (Sehr unzufrieden) - 7 (Sehr zufrieden), -9 not answered
+    'MB01_03': 'MDBF_Calm', # 1 (Sehr unruhig) - 7 (Sehr ruhig), -9 not answered
+    'MB01_04': 'MDBF_Energy', # 1 (Sehr ernergielos) - 7 (Sehr energiegeladen), -9 not answered
+    'MB01_05': 'MDBF_Unwell', # 1 (Sehr unwohl) - 7 (Sehr wohl), -9 not answered
+    'MB01_06': 'MDBF_Relaxed', # 1 (Sehr entspannt) - 7 (Sehr angespannt), -9 not answered
+    'PS01_01': 'PSS4_Control', # 1 (Nie) - 7 (Sehr oft), -9 not answered
+    'PS01_02': 'PSS4_Stress', # 1 (Nie) - 5 (Sehr oft), -9 not answered
+    'PS01_03': 'PSS4_Taks', # 1 (Nie) - 5 (Sehr oft), -9 not answered
+    'PS01_04': 'PSS4_Obstacles', # 1 (Nie) - 5 (Sehr oft), -9 not answered
+    'SC01_01': 'SSCCS_Giveup', #  1 (Stimme überhaupt nicht zu) - 7 (Stimme völlig zu), -9 not answered
+    'SC01_02': 'SSCCS_Resist',  # 1 (Stimme überhaupt nicht zu) - 7 (Stimme völlig zu), -9 not answered
+    'TP01': 'Topics_None', # negative or number selected
+    'TP01_01': 'Topics_Bewegung', # 1 (not selected) or 2 (selected)
+    'TP01_02': 'Topics_Familie', # 1 or 2
+    'TP01_03': 'Topics_Essen', # 1 or 2
+    'TP01_04': 'Topics_Freunde', # 1 or 2
+    'TP01_05': 'Topics_Religion/Spiritualität', # 1 or 2
+    'TP01_06': 'Topics_Gesundheit', # 1 or 2
+    'TP01_07': 'Topics_Liebe', # 1 or 2
+    'TP01_08': 'Topics_Freizeit', # 1 or 2
+    'TP01_09': 'Topics_Universität', # 1 or 2
+    'TP01_10': 'Topics_Schlaf', # 1 or 2
+    'TP01_11': 'Topics_Arbeit' # 1 or 2
+}
+
+# Code of the SoSci Survey export for items that were not answered
+MISSING_CODE = -9
+
+# Columns of the preprocessed data by data type
+CODE_COLUMNS = ['SERIAL', 'REF', 'QUESTNNR', 'MODE']
+LIKERT_COLUMNS = [name for code, name in COLUMN_RENAME_DICT.items() if code.startswith(('MB01_', 'PS01_', 'SC01_'))]
+TOPIC_FLAG_COLUMNS = [name for code, name in COLUMN_RENAME_DICT.items() if code.startswith('TP01_')]
+COUNT_COLUMNS = ['Topics_None']
+
+# The topic flags are packed into one bitmask per entry: bit i is set if the topic TOPIC_FLAG_COLUMNS[i] was selected
+TOPIC_MASK_COLUMN = 'Topics_Mask'
+
+# Data types of the preprocessed data: the codes repeat for every row, the items are small numbers
+# that can be missing and the topic mask has one bit per topic
+COLUMN_SCHEMA = {
+    **{column: 'category' for column in CODE_COLUMNS},
+    **{column: 'Int8' for column in LIKERT_COLUMNS + COUNT_COLUMNS},
+    TOPIC_MASK_COLUMN: 'uint16',
+}
+
+def apply_schema(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts the columns of data that was already preprocessed (e.g. read back from a file) to COLUMN_SCHEMA.
+
+    Parameters:
+    - data (pd.DataFrame): The preprocessed data.
+
+    Returns:
+    - pd.DataFrame: The data with the compact data types.
+    """
+    return data.astype({column: dtype for column, dtype in COLUMN_SCHEMA.items() if column in data.columns})
+
+def encode_topic_mask(data: pd.DataFrame) -> np.ndarray:
+    """
+    Packs the topic items of the export into one bitmask per entry, see TOPIC_MASK_COLUMN.
+
+    Parameters:
+    - data (pd.DataFrame): The renamed data with the topic items (2 is selected, 1 not selected).
+
+    Returns:
+    - np.ndarray: The bitmasks (uint16), not selected and missing answers are 0 bits.
+    """
+    present = [column for column in TOPIC_FLAG_COLUMNS if column in data.columns]
+    bits = np.array([1 << TOPIC_FLAG_COLUMNS.index(column) for column in present], dtype=np.uint16)
+    selected = data[present].to_numpy(dtype=float, na_value=np.nan) == 2
+    return np.bitwise_or.reduce(np.where(selected, bits, np.uint16(0)), axis=1, initial=np.uint16(0)).astype(np.uint16)
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame):
+    """
+    Prints the memory use of every column before and after the preprocessing and the memory saved.
+
+    Parameters:
+    - before (pd.DataFrame): The data before the preprocessing.
+    - after (pd.DataFrame): The preprocessed data.
+    """
+    usage_before = before.rename(columns=COLUMN_RENAME_DICT).memory_usage(deep=True, index=False)
+    usage_after = after.memory_usage(deep=True, index=False)
+
+    print(f"{'Column':<32} {'Before':>12} {'After':>12} {'Saved':>12}")
+    for column in usage_after.index:
+        column_before = usage_before.get(column, 0)
+        print(f"{column:<32} {column_before:>12,} {usage_after[column]:>12,} {column_before - usage_after[column]:>12,}")
+    total_before, total_after = usage_before.sum(), usage_after.sum()
+    ratio = total_before / total_after if total_after > 0 else float('nan')
+    print(f"{'Total':<32} {total_before:>12,} {total_after:>12,} {total_before - total_after:>12,} ({ratio:.1f}x smaller)")
+
+def preprocess_data(data: pd.DataFrame, report: bool = False) -> pd.DataFrame:
     """
     Preprocesses the data by renaming columns and converting data types.
 
+    The ID and code columns become categoricals, the items nullable Int8 with the "not answered" code (-9)
+    as missing value, and the topic items are replaced by one bitmask (see TOPIC_MASK_COLUMN).
+
     Parameters:
     - data (pd.DataFrame): The input data to preprocess.
+    - report (bool): Print the memory saved per column.
 
     Returns:
     - pd.DataFrame: The preprocessed data.
     """
-    column_rename_dict = {
-        'MB01_01': 'MDBF_Awake', # 1 (Sehr müde) - 7 (Sehr wach), -9 not answered
-        'MB01_02': 'MDBF_Satisfied', # 1 (Sehr unzufrieden) - 7 (Sehr zufrieden), -9 not answered
-        'MB01_03': 'MDBF_Calm', # 1 (Sehr unruhig) - 7 (Sehr ruhig), -9 not answered
-        'MB01_04': 'MDBF_Energy', # 1 (Sehr ernergielos) - 7 (Sehr energiegeladen), -9 not answered
-        'MB01_05': 'MDBF_Unwell', # 1 (Sehr unwohl) - 7 (Sehr wohl), -9 not answered
-        'MB01_06': 'MDBF_Relaxed', # 1 (Sehr entspannt) - 7 (Sehr angespannt), -9 not answered
-        'PS01_01': 'PSS4_Control', # 1 (Nie) - 7 (Sehr oft), -9 not answered
-        'PS01_02': 'PSS4_Stress', # 1 (Nie) - 5 (Sehr oft), -9 not answered
-        'PS01_03': 'PSS4_Taks', # 1 (Nie) - 5 (Sehr oft), -9 not answered
-        'PS01_04': 'PSS4_Obstacles', # 1 (Nie) - 5 (Sehr oft), -9 not answered
-        'SC01_01': 'SSCCS_Giveup', #  1 (Stimme überhaupt nicht zu) - 7 (Stimme völlig zu), -9 not answered
-        'SC01_02': 'SSCCS_Resist',  # 1 (Stimme überhaupt nicht zu) - 7 (Stimme völlig zu), -9 not answered
-        'TP01': 'Topics_None', # negative or number selected
-        'TP01_01': 'Topics_Bewegung', # 1 (not selected) or 2 (selected)
-        'TP01_02': 'Topics_Familie', # 1 or 2
-        'TP01_03': 'Topics_Essen', # 1 or 2
-        'TP01_04': 'Topics_Freunde', # 1 or 2
-        'TP01_05': 'Topics_Religion/Spiritualität', # 1 or 2
-        'TP01_06': 'Topics_Gesundheit', # 1 or 2
-        'TP01_07': 'Topics_Liebe', # 1 or 2
-        'TP01_08': 'Topics_Freizeit', # 1 or 2
-        'TP01_09': 'Topics_Universität', # 1 or 2
-        'TP01_10': 'Topcis_Schlaf', # 1 or 2
-        'TP01_11': 'Topics_Arbeit' # 1 or 2
-    }
 
     # Rename columns
-    data = data.rename(columns=column_rename_dict)
+    processed = data.rename(columns=COLUMN_RENAME_DICT)
+
+    for column in CODE_COLUMNS:
+        # Text first, so that missing codes stay 'nan' as before
+        processed[column] = processed[column].astype(str).astype('category')
+
+    for column in LIKERT_COLUMNS:
+        if column in processed.columns:
+            processed[column] = processed[column].mask(processed[column] == MISSING_CODE).astype('Int8')
+
+    for column in COUNT_COLUMNS:
+        if column in processed.columns:
+            processed[column] = processed[column].astype('Int8')
+
+    topic_columns = [column for column in TOPIC_FLAG_COLUMNS if column in processed.columns]
+    if topic_columns:
+        # One uint16 instead of eleven columns, in the place of the first topic
+        position = processed.columns.get_loc(topic_columns[0])
+        mask = encode_topic_mask(processed)
+        processed = processed.drop(columns=topic_columns)
+        processed.insert(position, TOPIC_MASK_COLUMN, mask)
 
-    data['SERIAL'] = data['SERIAL'].astype(str)
-    data['REF'] = data['REF'].astype(str)
-    data['QUESTNNR'] = data['QUESTNNR'].astype(str)
-    data['MODE'] = data['MODE'].astype(str)
+    #print(processed.dtypes)
 
-    #print(data.dtypes)
+    if report:
+        memory_report(data, processed)
 
-    return data
\ No newline at end of file
+    return processed
@@ -1,23 +1,146 @@
+import numpy as np
 import pandas as pd
 
-def evaluation(data: pd.DataFrame, mdbf_columns: list, pss4_columns: list) -> pd.DataFrame:
+# Scoring rules of the questionnaires. Every instrument declares
+# - items: the item columns (after preprocess_data)
+# - reverse: the reverse-keyed items, scored as (minimum + maximum - value)
+# - range: the valid (minimum, maximum) of the answers, other values count as missing
+# - offset: added to every item after reversing, e.g. to score 1-5 answers as 0-4
+# - aggregate: 'sum' or 'mean' of the items of a subscale
+# - missing: 'complete' (a score is missing if one of its items is missing) or
+#   'prorate' (the mean of the answered items, scaled to all items for 'sum', if at least min_items were answered)
+# - subscales: the score columns and their items
+# More instruments can be added here, all scores are calculated together in evaluation().
+SCORING_REGISTRY = {
+    # values 0-16
+    'PSS4': {
+        'items': ['PSS4_Control', 'PSS4_Stress', 'PSS4_Taks', 'PSS4_Obstacles'],
+        'reverse': ['PSS4_Stress', 'PSS4_Taks'],
+        'range': (1, 5),
+        'offset': -1,
+        'aggregate': 'sum',
+        'missing': 'complete',
+        'subscales': {
+            'PSS4_Score': ['PSS4_Control', 'PSS4_Stress', 'PSS4_Taks', 'PSS4_Obstacles'],
+        },
+    },
+    'MDBF': {
+        'items': ['MDBF_Awake', 'MDBF_Satisfied', 'MDBF_Calm', 'MDBF_Energy', 'MDBF_Unwell', 'MDBF_Relaxed'],
+        'reverse': [],
+        'range': (1, 7),
+        'offset': 0,
+        'aggregate': 'mean',
+        'missing': 'complete',
+        'subscales': {
+            'MDBF_Valence_Score': ['MDBF_Satisfied', 'MDBF_Unwell'],
+            'MDBF_Arousal_Score': ['MDBF_Awake', 'MDBF_Energy'],
+            'MDBF_Calmness_Score': ['MDBF_Calm', 'MDBF_Relaxed'],
+        },
+    },
+    # values 1-7, high values mean high self-control capacity
+    'SSCCS': {
+        'items': ['SSCCS_Giveup', 'SSCCS_Resist'],
+        'reverse': ['SSCCS_Giveup'],
+        'range': (1, 7),
+        'offset': 0,
+        'aggregate': 'mean',
+        'missing': 'complete',
+        'subscales': {
+            'SSCCS_Score': ['SSCCS_Giveup', 'SSCCS_Resist'],
+        },
+    },
+}
+
+def score_columns(registry: dict = None) -> list:
+    """
+    Returns the names of the score columns of all instruments of the registry.
+
+    Parameters:
+    - registry (dict): The scoring rules, defaults to SCORING_REGISTRY.
+
+    Returns:
+    - list: The score columns, in the order of the registry.
+    """
+    registry = registry if registry is not None else SCORING_REGISTRY
+    return [name for spec in registry.values() for name in spec['subscales']]
+
+def score_questionnaires(data: pd.DataFrame, registry: dict = None) -> pd.DataFrame:
+    """
+    Calculates the scores of all instruments of the registry whose items are in the data.
+
+    The items are stacked into one matrix and recoded (range check, reverse keying, offset) in one step,
+    then the sums and the numbers of answered items of all subscales are calculated with one matrix product.
+
+    Parameters:
+    - data (pd.DataFrame): The preprocessed data.
+    - registry (dict): The scoring rules, defaults to SCORING_REGISTRY.
+
+    Returns:
+    - pd.DataFrame: One column per subscale with the scores (NaN if missing), with the index of data.
     """
-    Evaluates the data for the questionnaires MDBF and PSS4.
-    
+    registry = registry if registry is not None else SCORING_REGISTRY
+    instruments = [spec for spec in registry.values() if all(item in data.columns for item in spec['items'])]
+
+    items = [item for spec in instruments for item in spec['items']]
+    minimum = np.array([spec['range'][0] for spec in instruments for _ in spec['items']], dtype=float)
+    maximum = np.array([spec['range'][1] for spec in instruments for _ in spec['items']], dtype=float)
+    reverse = np.array([item in spec['reverse'] for spec in instruments for item in spec['items']])
+    offset = np.array([spec['offset'] for spec in instruments for _ in spec['items']], dtype=float)
+
+    # Stacked item matrix, answers outside of the valid range (e.g. the code -9) are missing
+    values = data[items].to_numpy(dtype=float, na_value=np.nan)
+    values[(values < minimum) | (values > maximum)] = np.nan
+    values = np.where(reverse, minimum + maximum - values, values) + offset
+    answered = ~np.isnan(values)
+
+    # One column per subscale with the weight 1 for its items
+    subscales = [(name, spec) for spec in instruments for name in spec['subscales']]
+    weights = np.zeros((len(items), len(subscales)))
+    for j, (name, spec) in enumerate(subscales):
+        for item in spec['subscales'][name]:
+            weights[items.index(item), j] = 1
+
+    sums = np.where(answered, values, 0) @ weights
+    counts = answered.astype(float) @ weights
+    n_items = weights.sum(axis=0)
+
+    scores = {}
+    for j, (name, spec) in enumerate(subscales):
+        if spec['missing'] == 'complete':
+            valid = counts[:, j] == n_items[j]
+        elif spec['missing'] == 'prorate':
+            valid = counts[:, j] >= spec.get('min_items', 1)
+        else:
+            raise ValueError(f"Unknown missing policy '{spec['missing']}' for {name}.")
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = sums[:, j] / counts[:, j]
+        if spec['aggregate'] == 'mean':
+            score = mean
+        elif spec['aggregate'] == 'sum':
+            # Prorated sum if items are missing
+            score = np.where(counts[:, j] == n_items[j], sums[:, j], mean * n_items[j])
+        else:
+            raise ValueError(f"Unknown aggregate '{spec['aggregate']}' for {name}.")
+        scores[name] = np.where(valid, score, np.nan)
+
+    return pd.DataFrame(scores, index=data.index)
+
+def evaluation(data: pd.DataFrame, mdbf_columns: list = None, pss4_columns: list = None, registry: dict = None) -> pd.DataFrame:
+    """
+    Evaluates the data for the questionnaires MDBF, PSS4 and SSCCS, see SCORING_REGISTRY.
+
     Parameters:
     - data (pd.DataFrame): The input DataFrame containing the data.
+    - mdbf_columns (list): Unused, the items are declared in the registry; kept for existing callers.
+    - pss4_columns (list): Unused, the items are declared in the registry; kept for existing callers.
+    - registry (dict): The scoring rules, defaults to SCORING_REGISTRY.
+
+    Returns:
+    - pd.DataFrame: The data with one column per score.
     """
-    # Calculate the PSS4 score for each row; values 0-16
-    data['PSS4_Score'] = (
-        data['PSS4_Control'] +                  
-        (4 - data['PSS4_Stress']) +         
-        (4 - data['PSS4_Taks']) +                
-        data['PSS4_Obstacles']                 
-    )
-
-    # Calculate the mean MDBF score for each dimension for each participant
-    data['MDBF_Valence_Score'] = (data['MDBF_Satisfied'] + data['MDBF_Unwell']) / 2
-    data['MDBF_Arousal_Score'] = (data['MDBF_Awake'] + data['MDBF_Energy']) / 2
-    data['MDBF_Calmness_Score'] = (data['MDBF_Calm'] + data['MDBF_Relaxed']) / 2
-
-    return data
\ No newline at end of file
+    scores = score_questionnaires(data, registry)
+    for column in scores.columns:
+        data[column] = scores[column]
+
+    return data
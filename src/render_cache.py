@@ -0,0 +1,199 @@
+import os
+import json
+import hashlib
+from importlib.metadata import version
+import numpy as np
+import pandas as pd
+
+MANIFEST_FILE = 'render_manifest.json'
+
+# Bump when the layout of the manifest changes
+MANIFEST_VERSION = 1
+
+def hash_columns(data: pd.DataFrame, columns: dict) -> dict:
+    """
+    Hashes every row of several sets of columns. Every column is hashed once, also if it is in several sets,
+    so the fingerprints of all charts are calculated in one pass over the data.
+
+    Parameters:
+    - data (pd.DataFrame): The rows to hash.
+    - columns (dict): Dictionary with names (e.g. the charts) as keys and the lists of columns to hash as values.
+
+    Returns:
+    - hashes (dict): Dictionary with the names as keys and the hashes as values, one row per row of data
+      and one column per hashed column.
+    """
+    column_hashes = {
+        column: pd.util.hash_pandas_object(data[column], index=False).to_numpy()
+        for column in dict.fromkeys(column for names in columns.values() for column in names)
+    }
+    return {
+        name: np.column_stack([column_hashes[column] for column in names]) if names else np.empty((len(data), 0), dtype=np.uint64)
+        for name, names in columns.items()
+    }
+
+class RenderCache:
+    """
+    Remembers a fingerprint of the input rows of every chart and report that was created, so that a re-run
+    only recreates the outputs whose input changed.
+
+    The fingerprints are stored in a manifest file next to the outputs. A fingerprint covers the relevant
+    columns of the rows of one participant, the version of the chart code and the matplotlib
+    version. An output is also recreated if its file is missing.
+
+    Parameters:
+    - output_dir (str): Directory where the plots and the manifest are saved.
+    - invalidate (bool): Ignore the stored manifest and recreate all outputs.
+    - manifest_file (str): File name of the manifest, runs that write into the same output directory at the same
+      time (e.g. the shards of a cohort) each need their own.
+    """
+
+    def __init__(self, output_dir: str, invalidate: bool = False, manifest_file: str = MANIFEST_FILE):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, manifest_file)
+        # The versions are read from the package metadata, importing the libraries would only cost time
+        self.environment = f"{MANIFEST_VERSION}|matplotlib {version('matplotlib')}"
+        self.entries = {}
+        self.hits = {}
+        self.misses = {}
+
+        if not invalidate and os.path.exists(self.path):
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    manifest = json.load(f)
+                # A manifest written by other library versions does not describe the current outputs
+                if manifest.get('environment') == self.environment:
+                    self.entries = manifest.get('entries', {})
+            except (OSError, ValueError) as e:
+                print(f"Render cache manifest {self.path} could not be read and is ignored: {e}")
+
+    def fingerprints(self, index, inputs: dict) -> dict:
+        """
+        Calculates the fingerprint of the rows of every participant for several charts, in one pass over the
+        participants (a ParticipantStore reads every partition once).
+
+        Parameters:
+        - index (ParticipantIndex or ParticipantStore): Participant index of the data.
+        - inputs (dict): Dictionary with the chart names as keys and the columns the chart reads and
+          the version of the chart code as values.
+
+        Returns:
+        - fingerprints (dict): Dictionary with the chart names as keys and dictionaries with the SERIALs as keys
+          and the fingerprints as values as values.
+        """
+        salts = {
+            kind: f"{self.environment}|{kind} {version}|{','.join(columns)}".encode('utf-8')
+            for kind, (columns, version) in inputs.items()
+        }
+
+        fingerprints = {kind: {} for kind in inputs}
+        # One hash per row and column, combined per participant
+        for unique_id, hashes in index.row_hashes({kind: columns for kind, (columns, _) in inputs.items()}):
+            for kind, row_hashes in hashes.items():
+                digest = hashlib.blake2b(salts[kind], digest_size=16)
+                digest.update(row_hashes.tobytes())
+                fingerprints[kind][unique_id] = digest.hexdigest()
+        return fingerprints
+
+    def stored(self, kind: str, unique_id: str):
+        """
+        Returns the fingerprint stored for an output in the last run.
+
+        Parameters:
+        - kind (str): Name of the output.
+        - unique_id (str): The SERIAL of the participant.
+
+        Returns:
+        - str: The fingerprint, or None if the output is unknown.
+        """
+        entry = self.entries.get(kind, {}).get(str(unique_id))
+        return entry[0] if entry is not None else None
+
+    def combine(self, kind: str, fingerprints: list):
+        """
+        Calculates the fingerprint of an output that is built from other outputs, e.g. a report from its charts.
+
+        Parameters:
+        - kind (str): Name of the output.
+        - fingerprints (list): Fingerprints of the outputs it is built from.
+
+        Returns:
+        - str: The fingerprint, or None if one of the fingerprints is unknown (None).
+        """
+        if any(fingerprint is None for fingerprint in fingerprints):
+            return None
+        digest = hashlib.blake2b(f"{self.environment}|{kind}".encode('utf-8'), digest_size=16)
+        for fingerprint in fingerprints:
+            digest.update(f"{fingerprint};".encode('utf-8'))
+        return digest.hexdigest()
+
+    def is_fresh(self, kind: str, unique_id: str, fingerprint: str, file_path: str) -> bool:
+        """
+        Checks if an output is up to date and counts a hit or a miss.
+
+        Parameters:
+        - kind (str): Name of the output.
+        - unique_id (str): The SERIAL of the participant.
+        - fingerprint (str): The current fingerprint of the output's input.
+        - file_path (str): Path of the output file.
+
+        Returns:
+        - bool: True if the output does not need to be recreated.
+        """
+        entry = self.entries.get(kind, {}).get(str(unique_id))
+        # Outputs that were skipped on purpose (e.g. no topics selected) have no file
+        fresh = (
+            fingerprint is not None and entry is not None and entry[0] == fingerprint
+            and (os.path.exists(file_path) or not entry[1])
+        )
+        counter = self.hits if fresh else self.misses
+        counter[kind] = counter.get(kind, 0) + 1
+        return fresh
+
+    def update(self, kind: str, unique_id: str, fingerprint: str, file_path: str):
+        """
+        Stores the fingerprint of an output that was created.
+
+        Parameters:
+        - kind (str): Name of the output.
+        - unique_id (str): The SERIAL of the participant.
+        - fingerprint (str): The fingerprint of the output's input.
+        - file_path (str): Path of the output file.
+        """
+        self.entries.setdefault(kind, {})[str(unique_id)] = [fingerprint, os.path.exists(file_path)]
+
+    def invalidate(self, kinds: list = None, unique_ids: list = None):
+        """
+        Forgets stored fingerprints, so that the outputs are recreated on the next run.
+
+        Parameters:
+        - kinds (list): Names of the outputs to forget, defaults to all.
+        - unique_ids (list): SERIALs of the participants to forget, defaults to all.
+        """
+        for kind in (kinds if kinds is not None else list(self.entries)):
+            if unique_ids is None:
+                self.entries.pop(kind, None)
+            else:
+                for unique_id in unique_ids:
+                    self.entries.get(kind, {}).pop(str(unique_id), None)
+
+    def save(self):
+        """
+        Writes the manifest next to the outputs.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        manifest = {'environment': self.environment, 'entries': self.entries}
+        # Write to a temporary file first, so that an interrupted run does not leave a broken manifest
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(temporary_path, self.path)
+
+    def report(self):
+        """
+        Prints the number of cache hits and misses per output.
+        """
+        kinds = sorted(set(self.hits) | set(self.misses))
+        print(f"Render cache: {sum(self.hits.values())} hits, {sum(self.misses.values())} misses")
+        for kind in kinds:
+            print(f"- {kind}: {self.hits.get(kind, 0)} hits, {self.misses.get(kind, 0)} misses")
@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import platform
+import contextlib
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the memory and child process CPU time are not measured there
+    resource = None
+
+def _children_cpu_seconds() -> float:
+    """
+    Returns the CPU time of the finished child processes.
+
+    Returns:
+    - float: The CPU time in seconds, 0 if it cannot be measured.
+    """
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def _peak_rss_mb(children: bool = False) -> float:
+    """
+    Returns the peak resident memory of the current process (or of its finished child processes) since it
+    was started, not since the start of a stage.
+
+    Parameters:
+    - children (bool): Return the peak of the child processes.
+
+    Returns:
+    - float: The peak resident memory in MB, None if it cannot be measured.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+class RunReport:
+    """
+    Measures the stages of a run (wall time, CPU time and peak resident memory) and the render time of every
+    chart of every participant, and writes them as JSON report.
+
+    The operating system only reports the peak resident memory since the start of the process, so the memory
+    of a stage is the amount by which it raised that peak (peak_rss_increase_mb): 0 for a stage that stayed
+    below the peak of an earlier stage. The peak of the process is kept as process_peak_rss_mb.
+
+    A disabled report does not measure anything, its stages are empty context managers.
+
+    Parameters:
+    - enabled (bool): Measure the stages.
+    - profile_stage (str): Optional name of a stage that is run under cProfile.
+    - profile_path (str): Path of the cProfile dump, defaults to '<profile_stage>.prof'.
+    """
+
+    def __init__(self, enabled: bool = True, profile_stage: str = None, profile_path: str = None):
+        self.enabled = enabled
+        self.profile_stage = profile_stage
+        self.profile_path = profile_path if profile_path is not None else f'{profile_stage}.prof'
+        self.started = datetime.now().isoformat(timespec='seconds')
+        self.stages = []
+        # (SERIAL, chart, seconds) of every rendered chart, only filled if the report is enabled
+        self.render_timings = []
+
+    def stage(self, name: str):
+        """
+        Returns a context manager that measures a stage.
+
+        Parameters:
+        - name (str): Name of the stage.
+
+        Returns:
+        - A context manager.
+        """
+        if not self.enabled and name != self.profile_stage:
+            return contextlib.nullcontext()
+        return self._measure(name)
+
+    @contextlib.contextmanager
+    def _measure(self, name: str):
+        profiler = cProfile.Profile() if name == self.profile_stage else None
+        rss_before = _peak_rss_mb()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        children_start = _children_cpu_seconds()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(self.profile_path)
+                print(f"Profile of stage {name} saved to: {self.profile_path}")
+            rss_after = _peak_rss_mb()
+            self.stages.append({
+                'stage': name,
+                'wall_seconds': time.perf_counter() - wall_start,
+                'cpu_seconds': time.process_time() - cpu_start,
+                # CPU time of the worker processes that finished during the stage
+                'children_cpu_seconds': _children_cpu_seconds() - children_start,
+                'peak_rss_increase_mb': max(0.0, rss_after - rss_before) if rss_after is not None else None,
+                # Since the start of the run, the same for every stage after the one with the highest memory
+                'process_peak_rss_mb': rss_after,
+                'children_process_peak_rss_mb': _peak_rss_mb(children=True),
+            })
+
+    @property
+    def timings(self):
+        """
+        The list for the render timings of render_plan, None if the report is disabled (no timing overhead).
+        """
+        return self.render_timings if self.enabled else None
+
+    def chart_summary(self, slowest: int = 10) -> dict:
+        """
+        Summarizes the render times per chart.
+
+        Parameters:
+        - slowest (int): Number of the slowest participants listed per chart.
+
+        Returns:
+        - dict: Dictionary with the chart names as keys and the number of renders, the total, mean and maximum time
+          and the slowest participants as values.
+        """
+        per_chart = {}
+        for unique_id, chart, seconds in self.render_timings:
+            per_chart.setdefault(chart, []).append((seconds, unique_id))
+
+        summary = {}
+        for chart, times in sorted(per_chart.items()):
+            times.sort(key=lambda entry: entry[0], reverse=True)
+            total = sum(seconds for seconds, _ in times)
+            summary[chart] = {
+                'renders': len(times),
+                'total_seconds': total,
+                'mean_seconds': total / len(times),
+                'max_seconds': times[0][0],
+                'slowest': [{'SERIAL': unique_id, 'seconds': seconds} for seconds, unique_id in times[:slowest]],
+            }
+        return summary
+
+    def to_dict(self, slowest: int = 10) -> dict:
+        """
+        Returns the report as dictionary.
+
+        Parameters:
+        - slowest (int): Number of the slowest participants listed per chart.
+
+        Returns:
+        - dict: The report.
+        """
+        return {
+            'started': self.started,
+            'command': sys.argv,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'stages': self.stages,
+            'charts': self.chart_summary(slowest),
+        }
+
+    def save(self, path: str, slowest: int = 10):
+        """
+        Writes the report as JSON file.
+
+        Parameters:
+        - path (str): Path of the report.
+        - slowest (int): Number of the slowest participants listed per chart.
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(slowest), f, indent=2)
+        print(f"Run report saved to: {path}")
+
+    def print_summary(self, slowest: int = 3):
+        """
+        Prints the stages and the slowest participants per chart.
+
+        Parameters:
+        - slowest (int): Number of the slowest participants printed per chart.
+        """
+        for stage in self.stages:
+            peak = f", peak RSS +{stage['peak_rss_increase_mb']:.0f} MB (process peak {stage['process_peak_rss_mb']:.0f} MB)" if stage['process_peak_rss_mb'] is not None else ''
+            print(f"Stage {stage['stage']}: {stage['wall_seconds']:.2f} s wall, {stage['cpu_seconds']:.2f} s CPU{peak}")
+        for chart, summary in self.chart_summary(slowest).items():
+            slowest_ids = ', '.join(f"{entry['SERIAL']} ({entry['seconds'] * 1000:.0f} ms)" for entry in summary['slowest'])
+            print(f"Chart {chart}: {summary['renders']} renders, mean {summary['mean_seconds'] * 1000:.0f} ms, slowest: {slowest_ids}")
@@ -0,0 +1,152 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+def parse_shard(text: str) -> tuple:
+    """
+    Parses a shard given as 'i/n', the i-th of n shards (counted from 0).
+
+    Parameters:
+    - text (str): The shard, e.g. '0/4'.
+
+    Returns:
+    - tuple: The shard number and the number of shards.
+    """
+    try:
+        shard, n_shards = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{text}', expected 'i/n', e.g. '0/4'.") from None
+    if n_shards < 1 or not 0 <= shard < n_shards:
+        raise ValueError(f"Invalid shard '{text}', expected 0 <= i < n.")
+    return shard, n_shards
+
+def shard_of(unique_id: str, n_shards: int) -> int:
+    """
+    Returns the shard of a participant. The shard only depends on the SERIAL and the number of shards
+    (not on the data, the machine or the Python hash seed), so independent runs split a cohort the same way.
+
+    Parameters:
+    - unique_id (str): The SERIAL of the participant.
+    - n_shards (int): Number of shards.
+
+    Returns:
+    - int: The shard of the participant, from 0 to n_shards - 1.
+    """
+    digest = hashlib.blake2b(str(unique_id).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % n_shards
+
+def read_serial_file(filepath: str) -> list:
+    """
+    Reads a list of SERIALs, one per line. Empty lines and lines starting with '#' are ignored.
+
+    Parameters:
+    - filepath (str): The path to the file.
+
+    Returns:
+    - list: The SERIALs.
+    """
+    with open(filepath, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+class ParticipantSelection:
+    """
+    Selects the participants and days that a run processes: a list of SERIALs, a range of days of STARTED
+    and one shard of the cohort. Every part is optional, an empty selection keeps all rows.
+
+    Parameters:
+    - serials (list): Optional SERIALs of the participants to process.
+    - start (str): Optional first day of STARTED (inclusive), e.g. '2024-04-01'.
+    - end (str): Optional last day of STARTED (inclusive), e.g. '2024-04-30'.
+    - shard (tuple): Optional (i, n), only the participants of the i-th of n shards are processed, see shard_of.
+    """
+
+    def __init__(self, serials: list = None, start: str = None, end: str = None, shard: tuple = None):
+        self.serials = set(str(unique_id) for unique_id in serials) if serials is not None else None
+        self.start = pd.Timestamp(start).normalize() if start is not None else None
+        # The whole last day is included
+        self.end = pd.Timestamp(end).normalize() + pd.Timedelta(days=1) if end is not None else None
+        self.shard = shard
+        if self.start is not None and self.end is not None and self.start >= self.end:
+            raise ValueError(f"The start date {start} is after the end date {end}.")
+
+    @property
+    def is_empty(self) -> bool:
+        """
+        True if the selection keeps all rows.
+        """
+        return self.serials is None and self.start is None and self.end is None and self.shard is None
+
+    def shard_file_name(self, file_name: str) -> str:
+        """
+        Returns the name of a file that every shard writes next to the outputs of the other shards
+        (e.g. the render cache manifest), so that the shards can share one output directory.
+
+        Parameters:
+        - file_name (str): The name of the file without shard, e.g. 'render_manifest.json'.
+
+        Returns:
+        - str: The name with the shard before the extension, e.g. 'render_manifest.shard-0-of-4.json',
+          file_name itself without shard.
+        """
+        if self.shard is None:
+            return file_name
+        root, extension = os.path.splitext(file_name)
+        return f'{root}.shard-{self.shard[0]}-of-{self.shard[1]}{extension}'
+
+    def includes(self, unique_id: str) -> bool:
+        """
+        Checks if a participant is selected by the SERIALs and the shard.
+
+        Parameters:
+        - unique_id (str): The SERIAL of the participant.
+
+        Returns:
+        - bool: True if the participant is selected.
+        """
+        if self.serials is not None and str(unique_id) not in self.serials:
+            return False
+        return self.shard is None or shard_of(unique_id, self.shard[1]) == self.shard[0]
+
+    def apply(self, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns the selected rows of the data.
+
+        Parameters:
+        - data (pd.DataFrame): The data, with the columns SERIAL and STARTED (as datetime).
+
+        Returns:
+        - pd.DataFrame: The selected rows, data itself if the selection is empty.
+        """
+        if self.is_empty:
+            return data
+
+        mask = np.ones(len(data), dtype=bool)
+        if self.serials is not None or self.shard is not None:
+            # Every participant is checked once, not once per row
+            codes, serials = pd.factorize(data['SERIAL'])
+            selected = np.array([self.includes(unique_id) for unique_id in serials], dtype=bool)
+            mask &= (codes >= 0) & selected[codes] if len(serials) > 0 else np.zeros(len(data), dtype=bool)
+        if self.start is not None:
+            mask &= (data['STARTED'] >= self.start).to_numpy(dtype=bool, na_value=False)
+        if self.end is not None:
+            mask &= (data['STARTED'] < self.end).to_numpy(dtype=bool, na_value=False)
+        return data[mask]
+
+    def describe(self) -> str:
+        """
+        Returns a short description of the selection for the progress messages.
+
+        Returns:
+        - str: The description.
+        """
+        parts = []
+        if self.serials is not None:
+            parts.append(f"{len(self.serials)} SERIALs")
+        if self.start is not None or self.end is not None:
+            first = self.start.date() if self.start is not None else '...'
+            last = (self.end - pd.Timedelta(days=1)).date() if self.end is not None else '...'
+            parts.append(f"days {first} to {last}")
+        if self.shard is not None:
+            parts.append(f"shard {self.shard[0]} of {self.shard[1]}")
+        return ', '.join(parts) if parts else 'all participants'
@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+from preprocessing import TOPIC_FLAG_COLUMNS, TOPIC_MASK_COLUMN
+
+# MDBF scores that are averaged per topic and the names of their columns in the topic mood table
+MOOD_SCORES = {
+    'MDBF_Valence_Score': 'mean_valence',
+    'MDBF_Arousal_Score': 'mean_arousal',
+    'MDBF_Calmness_Score': 'mean_calmness',
+}
+
+def topic_bits(topics_columns: list) -> np.ndarray:
+    """
+    Returns the bit of every topic in the topic mask (see TOPIC_MASK_COLUMN).
+
+    Parameters:
+    - topics_columns (list): Names of the topics, a subset of TOPIC_FLAG_COLUMNS in any order.
+
+    Returns:
+    - np.ndarray: The bit positions (uint16), in topics_columns order.
+    """
+    return np.array([TOPIC_FLAG_COLUMNS.index(topic) for topic in topics_columns], dtype=np.uint16)
+
+def topic_flags(masks, topics_columns: list) -> np.ndarray:
+    """
+    Unpacks topic masks into one flag per topic.
+
+    Parameters:
+    - masks (array-like): The topic masks of the entries.
+    - topics_columns (list): Names of the topics to unpack.
+
+    Returns:
+    - np.ndarray: Matrix (uint8) with one row per entry and one column per topic, 1 if the topic was selected.
+    """
+    masks = np.asarray(masks, dtype=np.uint16)
+    return ((masks[:, None] >> topic_bits(topics_columns)) & 1).astype(np.uint8)
+
+def topic_counts(data: pd.DataFrame, topics_columns: list) -> pd.DataFrame:
+    """
+    Counts how often every participant selected every topic.
+
+    Parameters:
+    - data (pd.DataFrame): The evaluated data of one or more participants.
+    - topics_columns (list): Names of the topics to count.
+
+    Returns:
+    - pd.DataFrame: The counts, indexed by SERIAL (sorted) with one column per topic.
+    """
+    codes, serials = pd.factorize(data['SERIAL'], sort=True)
+    flags = topic_flags(data[TOPIC_MASK_COLUMN], topics_columns)
+    counts = np.zeros((len(serials), len(topics_columns)), dtype=np.int64)
+    np.add.at(counts, codes[codes >= 0], flags[codes >= 0])
+    return pd.DataFrame(counts, index=pd.Index(np.asarray(serials, dtype=object), name='SERIAL'), columns=list(topics_columns))
+
+def top_topics(mentions: pd.Series, k: int) -> list:
+    """
+    Returns the k most mentioned topics. Topics with the same count keep their order in mentions,
+    so the result does not depend on the sort algorithm.
+
+    Parameters:
+    - mentions (pd.Series): How often each topic was mentioned, indexed by topic.
+    - k (int): Number of topics.
+
+    Returns:
+    - list: The names of up to k topics, the most mentioned first.
+    """
+    order = np.argsort(-mentions.to_numpy(dtype=np.int64), kind='stable')
+    return [mentions.index[i] for i in order[:k]]
+
+def topic_cooccurrence(data: pd.DataFrame, topics_columns: list) -> pd.DataFrame:
+    """
+    Counts on how many entries every pair of topics was selected together.
+
+    Parameters:
+    - data (pd.DataFrame): The evaluated data, e.g. of one participant or the whole cohort.
+    - topics_columns (list): Names of the topics.
+
+    Returns:
+    - pd.DataFrame: Symmetric matrix with one row and column per topic, the diagonal holds how often
+      each topic was selected.
+    """
+    flags = topic_flags(data[TOPIC_MASK_COLUMN], topics_columns).astype(np.int64)
+    return pd.DataFrame(flags.T @ flags, index=list(topics_columns), columns=list(topics_columns))
+
+def topic_mood_table(data: pd.DataFrame, topics_columns: list) -> pd.DataFrame:
+    """
+    Calculates for every participant and topic how often the topic was mentioned and the mean MDBF scores
+    of the days it was mentioned, for all participants at once.
+
+    The topic flags and the scores are combined into one matrix (flag, flag x score and flag x answered score
+    per topic), which is summed per participant in a single grouped reduction.
+
+    Parameters:
+    - data (pd.DataFrame): The evaluated data of one or more participants.
+    - topics_columns (list): Names of the topics, unpacked from the topic mask.
+
+    Returns:
+    - pd.DataFrame: Tidy table with one row per participant and topic (in SERIAL and topics_columns order) and the
+      columns SERIAL, topic, mentions and the mean scores (see MOOD_SCORES, NaN if the topic was not mentioned).
+    """
+    n_topics = len(topics_columns)
+    codes, serials = pd.factorize(data['SERIAL'], sort=True)
+    order = np.argsort(codes, kind='stable')
+    codes = codes[order]
+
+    # Unanswered topics are 0 bits in the mask, missing scores are left out of the means
+    flags = topic_flags(data[TOPIC_MASK_COLUMN], topics_columns).astype(float)[order]
+    scores = data[list(MOOD_SCORES)].to_numpy(dtype=float, na_value=np.nan)[order]
+    answered = ~np.isnan(scores)
+    scores = np.where(answered, scores, 0)
+
+    matrix = np.hstack(
+        [flags]
+        + [flags * scores[:, [j]] for j in range(len(MOOD_SCORES))]
+        + [flags * answered[:, [j]] for j in range(len(MOOD_SCORES))]
+    )
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) > 0 else np.array([], dtype=int)
+    sums = np.add.reduceat(matrix, starts, axis=0) if len(starts) > 0 else np.zeros((0, matrix.shape[1]))
+
+    table = pd.DataFrame({
+        'SERIAL': np.repeat(np.asarray(serials, dtype=object), n_topics),
+        'topic': np.tile(np.asarray(topics_columns, dtype=object), len(serials)),
+        'mentions': sums[:, :n_topics].reshape(-1).astype('int64'),
+    })
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for j, column in enumerate(MOOD_SCORES.values()):
+            score_sums = sums[:, n_topics * (1 + j):n_topics * (2 + j)]
+            score_counts = sums[:, n_topics * (1 + len(MOOD_SCORES) + j):n_topics * (2 + len(MOOD_SCORES) + j)]
+            table[column] = (score_sums / score_counts).reshape(-1)
+
+    return table
+
+class TopicMoodTable:
+    """
+    Topic mood table of a dataset (see topic_mood_table) with fast access to the rows of one participant.
+
+    Parameters:
+    - data (pd.DataFrame): The evaluated data of one or more participants.
+    - topics_columns (list): List of column names related to topics.
+    """
+
+    def __init__(self, data: pd.DataFrame, topics_columns: list):
+        self.table = topic_mood_table(data, topics_columns)
+        self.n_topics = len(topics_columns)
+        # Position of every participant's block of rows in the table
+        self.positions = {unique_id: i for i, unique_id in enumerate(pd.unique(self.table['SERIAL']))}
+
+    def participant(self, unique_id: str) -> pd.DataFrame:
+        """
+        Returns the rows of one participant, indexed by topic.
+
+        Parameters:
+        - unique_id (str): The SERIAL of the participant.
+
+        Returns:
+        - pd.DataFrame: The mentions and mean scores of the participant per topic.
+        """
+        start = self.positions[unique_id] * self.n_topics
+        return self.table.iloc[start:start + self.n_topics].set_index('topic')
@@ -1,394 +1,752 @@
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
-import seaborn as sns
-import networkx as nx
+import matplotlib
+from matplotlib.figure import Figure
+from participant_store import ParticipantStore
+from render_cache import hash_columns
+from topics import TopicMoodTable, MOOD_SCORES, top_topics, topic_flags
+from daily_scores import DailyScores, ParticipantDays
+from preprocessing import TOPIC_MASK_COLUMN
+from image_writer import ImageWriter, image_extension, DEFAULT_PROFILE, IMAGE_WRITER_THREADS
+from figure_templates import get_template, clear_templates, release_figure, LineGraphTemplate, HeatmapTemplate, DivergingBarChartTemplate, ForceGraphLayouts, HEATMAP_SCORES
+
+class ParticipantIndex:
+    """
+    Groups the data by participant once, so that the chart functions can access the rows
+    of a single participant without scanning the whole DataFrame.
+
+    The data is sorted by SERIAL (stable, so the order of the rows within a participant is kept)
+    and the first and last row of every participant are stored in an offset table.
+    The rows of a participant are then returned as a cheap positional slice.
+
+    Parameters:
+    - data (pd.DataFrame): The input DataFrame containing the data.
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        self.data = data.sort_values('SERIAL', kind='stable')
+
+        serials = self.data['SERIAL'].to_numpy()
+        # Row positions where a new participant starts
+        if len(serials) > 0:
+            starts = np.flatnonzero(np.r_[True, serials[1:] != serials[:-1]])
+        else:
+            starts = np.array([], dtype=int)
+        stops = np.r_[starts[1:], len(serials)].astype(int)
+
+        self.serials = [serials[start] for start in starts]
+        self.offsets = dict(zip(self.serials, zip(starts.tolist(), stops.tolist())))
+
+        # Topic mood tables of all participants, calculated on first use per list of topics
+        self.topic_mood_tables = {}
+        # Study days of all participants, calculated on first use
+        self.daily_scores = None
+
+    def __len__(self) -> int:
+        return len(self.serials)
+
+    def __contains__(self, unique_id) -> bool:
+        return unique_id in self.offsets
+
+    def __iter__(self):
+        """
+        Yields (unique_id, subset) for every participant in SERIAL order.
+        """
+        for unique_id in self.serials:
+            yield unique_id, self.get(unique_id)
+
+    def get(self, unique_id) -> pd.DataFrame:
+        """
+        Returns the rows of a single participant.
+
+        Parameters:
+        - unique_id: The SERIAL of the participant.
+
+        Returns:
+        - pd.DataFrame: The rows of the participant.
+        """
+        start, stop = self.offsets[unique_id]
+        return self.data.iloc[start:stop]
+
+    def take(self, unique_ids: list) -> pd.DataFrame:
+        """
+        Returns the rows of several participants.
+
+        Parameters:
+        - unique_ids (list): The SERIALs of the participants.
+
+        Returns:
+        - pd.DataFrame: The rows of the participants.
+        """
+        positions = [np.arange(*self.offsets[unique_id]) for unique_id in unique_ids]
+        return self.data.iloc[np.concatenate(positions) if positions else []]
+
+    def topic_moods(self, unique_id, topics_columns: list) -> pd.DataFrame:
+        """
+        Returns the mentions and mean MDBF scores per topic of a single participant (see topics.topic_mood_table).
+        The table is calculated for all participants at once on the first call.
+
+        Parameters:
+        - unique_id: The SERIAL of the participant.
+        - topics_columns (list): List of column names related to topics.
+
+        Returns:
+        - pd.DataFrame: The rows of the participant in the topic mood table, indexed by topic.
+        """
+        key = tuple(topics_columns)
+        if key not in self.topic_mood_tables:
+            self.topic_mood_tables[key] = TopicMoodTable(self.data, topics_columns)
+        return self.topic_mood_tables[key].participant(unique_id)
+
+    def days(self, unique_id) -> ParticipantDays:
+        """
+        Returns the study days of a single participant (see daily_scores.DailyScores).
+        The arrays of all participants are built on the first call.
+
+        Parameters:
+        - unique_id: The SERIAL of the participant.
+
+        Returns:
+        - ParticipantDays: The study days of the participant.
+        """
+        if self.daily_scores is None:
+            self.daily_scores = DailyScores(self.data)
+        return self.daily_scores.participant(unique_id)
+
+    def row_hashes(self, columns: dict):
+        """
+        Yields a hash of every row of every participant for several sets of columns, used for the fingerprints
+        of the render cache (see render_cache.hash_columns).
+
+        Parameters:
+        - columns (dict): Dictionary with names (e.g. the charts) as keys and the lists of columns to hash as values.
+
+        Returns:
+        - generator of (str, dict): The SERIAL and the row hashes of every participant by name.
+        """
+        # One vectorized hash for all rows, sliced per participant
+        hashes = hash_columns(self.data, columns)
+        for unique_id in self.serials:
+            start, stop = self.offsets[unique_id]
+            yield unique_id, {name: name_hashes[start:stop] for name, name_hashes in hashes.items()}
+
+def chart_file_path(output_dir: str, chart: str, unique_id: str, extension: str = 'png') -> str:
+    """
+    Returns the path of the image of a chart for one participant.
+
+    Parameters:
+    - output_dir (str): Directory where the plots are saved.
+    - chart (str): Name of the chart (key of CHARTS).
+    - unique_id (str): The SERIAL of the participant.
+    - extension (str): The file extension of the image format, see image_writer.image_extension.
+
+    Returns:
+    - str: The path of the image.
+    """
+    return os.path.join(output_dir, f'{chart}_{unique_id}.{extension}')
+
+def _pie_chart(subset: pd.DataFrame, unique_id: str, topics_columns: list, topic_moods: pd.DataFrame, days: ParticipantDays):
+    """
+    Creates the pie chart for one participant, only displaying topics that were selected.
+
+    Parameters:
+    - subset (pd.DataFrame): The rows of one participant.
+    - unique_id (str): The SERIAL of the participant.
+    - topics_columns (list): List of column names related to topics.
+    - topic_moods (pd.DataFrame): The mentions and mean scores per topic of the participant.
+    - days (ParticipantDays): The study days of the participant (unused).
 
-def plot_pie_charts(data: pd.DataFrame, topics_columns: list, output_dir: str):
+    Returns:
+    - Figure: The pie chart, or None if no topic was selected.
+    """
+    # How often each topic was selected
+    topics_data = topic_moods['mentions']
+
+    # Only keep selected topics
+    selected_topics = topics_data[topics_data > 0]
+
+    # If no topics selected, skip
+    if selected_topics.empty:
+        return None
+
+    # Prepare data for pie chart
+    partitions = selected_topics.values
+    # use topics as labels but remove 'Topics_' from the column names
+    topics = [col.split('_')[1] for col in selected_topics.index]
+    # use the tab20 color palette (the same colors as seaborn's 'tab20' palette)
+    colors_pie = list(matplotlib.colormaps['tab20'].colors)
+
+    #hex_codes = colors_pie.as_hex()
+    #print(hex_codes)
+
+    # Create pie chart
+    fig1 = Figure(figsize=(7, 6), facecolor='white')
+    ax1 = fig1.subplots()
+    wedges, texts, autotexts = ax1.pie(partitions, labels=topics, autopct='%1.0f%%', startangle=140, shadow=True, colors=colors_pie)
+    ax1.set_title(f'Verteilung der erwähnten Themen', fontsize=18, fontweight='bold')
+    for text in texts:
+        text.set_fontsize(18)
+    for autotext in autotexts:
+        autotext.set_fontsize(18)
+        autotext.set_color('white')
+    fig1.tight_layout(pad=3.0)
+
+    return fig1
+
+def _line_graph(subset: pd.DataFrame, unique_id: str, topics_columns: list, topic_moods: pd.DataFrame, days: ParticipantDays):
     """
-    Creates pie charts for each participant, only displaying topics that were selected (value 2).
-    
+    Creates the line graph for one participant, showing average values for MDBF and PSS4 columns.
+
+    Parameters:
+    - subset (pd.DataFrame): The rows of one participant.
+    - unique_id (str): The SERIAL of the participant.
+    - topics_columns (list): List of column names related to topics (unused, kept for a common signature).
+    - topic_moods (pd.DataFrame): The mentions and mean scores per topic of the participant (unused).
+    - days (ParticipantDays): The study days of the participant.
+
+    Returns:
+    - Figure: The line graph, or None if the participant answered on one day only.
+    """
+    # Ensure there is more than one day for plotting
+    if days.answered.sum() <= 1:
+        return None
+
+    # Swap the participant's days into the prebuilt 2x2 subplots
+    template = get_template(LineGraphTemplate)
+    template.fill(days)
+
+    return template.fig
+
+def _heatmap(subset: pd.DataFrame, unique_id: str, topics_columns: list, topic_moods: pd.DataFrame, days: ParticipantDays):
+    """
+    Creates the heatmap for the MDBF values over time for one participant.
+
+    Parameters:
+    - subset (pd.DataFrame): The rows of one participant.
+    - unique_id (str): The SERIAL of the participant.
+    - topics_columns (list): List of column names related to topics (unused, kept for a common signature).
+    - topic_moods (pd.DataFrame): The mentions and mean scores per topic of the participant (unused).
+    - days (ParticipantDays): The study days of the participant.
+
+    Returns:
+    - Figure: The heatmap, or None if the participant answered on one day only.
+    """
+    # Ensure there is more than one day for plotting
+    if days.answered.sum() <= 1:
+        return None
+
+    # Swap the participant's days into a prebuilt heatmap with the same number of days,
+    # the study days are already sorted, so no pivot is needed
+    template = get_template(HeatmapTemplate, len(days))
+    template.fill(days)
+
+    return template.fig
+
+def _diverging_bar_chart(subset: pd.DataFrame, unique_id: str, topics_columns: list, topic_moods: pd.DataFrame, days: ParticipantDays):
+    """
+    Creates the diverging bar chart of the MDBF Valence score for the four most mentioned topics of one participant.
+
+    Parameters:
+    - subset (pd.DataFrame): The rows of one participant.
+    - unique_id (str): The SERIAL of the participant.
+    - topics_columns (list): List of column names related to topics.
+    - topic_moods (pd.DataFrame): The mentions and mean scores per topic of the participant.
+    - days (ParticipantDays): The study days of the participant.
+
+    Returns:
+    - Figure: The diverging bar chart, or None if the participant has no study day.
+    """
+    if len(days) == 0:
+        return None
+
+    # Get the four most mentioned topics, topics with the same count in topics_columns order
+    shown_topics = top_topics(topic_moods['mentions'], 4)
+
+    # Swap the participant's data into the prebuilt four subplots with a bar for every day;
+    # the bar is highlighted if the topic was mentioned
+    template = get_template(DivergingBarChartTemplate, len(days))
+    template.fill(days, shown_topics, topic_flags(days.masks, shown_topics))
+
+    return template.fig
+
+def _forcegraph(subset: pd.DataFrame, unique_id: str, topics_columns: list, topic_moods: pd.DataFrame, days: ParticipantDays):
+    """
+    Creates the force-directed graph showing the relationships between topics und MDBF values for one participant.
+
+    Parameters:
+    - subset (pd.DataFrame): The rows of one participant.
+    - unique_id (str): The SERIAL of the participant.
+    - topics_columns (list): List of column names related to topics.
+    - topic_moods (pd.DataFrame): The mentions and mean scores per topic of the participant.
+    - days (ParticipantDays): The study days of the participant (unused).
+
+    Returns:
+    - Figure: The force-directed graph.
+    """
+    # networkx is only imported when a force graph is drawn, it is not one of the default charts
+    import networkx as nx
+
+    G = nx.Graph()
+
+    # Add nodes for MDBF scores
+    G.add_node('Gute Stimmung', color='lightcoral', size=4000)
+    G.add_node('Wachheit', color='lightgreen', size=4000)
+    G.add_node('Ruhe', color='lightblue', size=4000)
+
+    # Add nodes and edges for each topic
+    for topic in topics_columns:
+
+        # Get the mean scores for this topic (NaN if it was not mentioned)
+        mean_valence, mean_arousal, mean_calmness = topic_moods.loc[topic, list(MOOD_SCORES.values())]
+
+        # Check if any of the scores for this topic are non-NaN
+        if pd.notna(mean_valence) or pd.notna(mean_arousal) or pd.notna(mean_calmness):
+            # add topic node but remove 'Topics_' from the column names
+            G.add_node(topic.split('_')[1], color='lightgray', size=2000)
+
+            # Add edges between the topic and the MDBF scores
+            if pd.notna(mean_valence):
+                G.add_edge('Gute Stimmung', topic.split('_')[1], weight=mean_valence)
+            if pd.notna(mean_arousal):
+                G.add_edge('Wachheit', topic.split('_')[1], weight=mean_arousal)
+            if pd.notna(mean_calmness):
+                G.add_edge('Ruhe', topic.split('_')[1], weight=mean_calmness)
+
+    # Force-directed layout with fixed MDBF nodes, reused for every participant with the same topics and edges
+    layouts = get_template(ForceGraphLayouts, *[topic.split('_')[1] for topic in topics_columns])
+    pos = layouts.layout(G)
+
+    # Draw the graph on an axes that fills the figure, as nx.draw does
+    fig = Figure(figsize=(10, 8), facecolor='w')
+    ax = fig.add_axes((0, 0, 1, 1))
+    node_colors = [G.nodes[node]['color'] for node in G.nodes()]
+    node_sizes = [G.nodes[node]['size'] for node in G.nodes()]
+
+    # Normalize edge weights for better visualization
+    edge_weights = [G[u][v]['weight'] for u, v in G.edges()]
+
+    # The parts of nx.draw, which would also touch the current pyplot figure
+    nx.draw_networkx_nodes(G, pos, ax=ax, node_color=node_colors, node_size=node_sizes)
+    nx.draw_networkx_edges(G, pos, ax=ax, node_size=node_sizes, width=edge_weights, edge_color='gray', edge_cmap=matplotlib.colormaps['Blues'])
+    nx.draw_networkx_labels(G, pos, ax=ax, font_size=12)
+    ax.set_axis_off()
+
+    ax.set_title(f"Topic und Befindlichkeits-Graph für ID {unique_id}")
+
+    return fig
+
+def plot_pie_charts(data: pd.DataFrame, topics_columns: list, output_dir: str, index: ParticipantIndex = None):
+    """
+    Creates pie charts for each participant, only displaying topics that were selected.
+
     Parameters:
     - data (pd.DataFrame): The input DataFrame containing the data.
     - topics_columns (list): List of column names related to topics.
     - output_dir (str): Directory where the pie charts will be saved.
+    - index (ParticipantIndex): Optional participant index of the data, built if not given.
     """
-    
-    # Unique IDs in the SERIAL column
-    unique_ids = data['SERIAL'].unique()
-    
-    for unique_id in unique_ids:
-        # Filter data for the current ID
-        subset = data[data['SERIAL'] == unique_id]
-        
-        # Aggregate the data for topics with value 2
-        topics_data = data[topics_columns].eq(2).sum()
-
-        # Only keep topics with value 2
-        selected_topics = topics_data[topics_data > 0]
-        
-        # If no topics selected, skip
-        if selected_topics.empty:
-            continue
-        
-        # Prepare data for pie chart
-        partitions = selected_topics.values 
-        # use topics as labels but remove 'Topics_' from the column names
-        topics = [col.split('_')[1] for col in selected_topics.index]
-        # use seaborn color palette
-        colors_pie = sns.color_palette('tab20') 
-
-        #hex_codes = colors_pie.as_hex()
-        #print(hex_codes)
-        
-        # Create pie chart
-        fig1, ax1 = plt.subplots(figsize=(7, 6), facecolor='white')
-        wedges, texts, autotexts = ax1.pie(partitions, labels=topics, autopct='%1.0f%%', startangle=140, shadow=True, colors=colors_pie)
-        ax1.set_title(f'Verteilung der erwähnten Themen', fontsize=18, fontweight='bold')
-        for text in texts:
-            text.set_fontsize(18)
-        for autotext in autotexts:
-            autotext.set_fontsize(18)
-            autotext.set_color('white')
-        plt.tight_layout(pad=3.0)
-        
-        # Save the pie chart
-        file_path = os.path.join(output_dir, f'pie_chart_{unique_id}.png')
-        fig1.savefig(file_path, facecolor='white')
-        plt.close(fig1)  
-
-        break
-
-def plot_line_graphs(data: pd.DataFrame, output_dir: str):
+    index = index if index is not None else ParticipantIndex(data)
+    for unique_id, subset in index:
+        render_participant(index, unique_id, topics_columns, output_dir, ['pie_chart'])
+
+def plot_line_graphs(data: pd.DataFrame, output_dir: str, index: ParticipantIndex = None):
     """
     Creates line graphs for each participant, showing average values for MDBF and PSS4 columns.
-    
+
     Parameters:
     - data (pd.DataFrame): The input DataFrame containing the data.
     - output_dir (str): Directory where the line graphs will be saved.
+    - index (ParticipantIndex): Optional participant index of the data, built if not given.
     """
-    
-    # Unique IDs in the SERIAL column
-    unique_ids = data['SERIAL'].unique()
-    
-    for unique_id in unique_ids:
-        # Filter data for the current ID
-        subset = data[data['SERIAL'] == unique_id]
-       
-        # Ensure the subset has more than one row for plotting
-        if subset.shape[0] <= 1:
-            continue
-    
-        # Create 2x2 subplots
-        fig2, axes = plt.subplots(2, 2, figsize=(12, 10), facecolor='white')
-        
-        # Plot each score in a separate subplot
-        axes[0, 0].plot(subset['STARTED'], subset['MDBF_Valence_Score'], marker='o', color='#1f77b4', linewidth=2, markersize=8, alpha=0.8)
-        axes[0, 0].axhline(4, color='black', linewidth=1)
-        axes[0, 0].set_title('Gut-Schlechte Stimmung', fontsize=14)
-        axes[0, 0].set_xlabel('Wochentag', fontsize=12)
-        axes[0, 0].set_ylabel('Level', fontsize=12)
-        axes[0, 0].set_ylim(1, 7)
-        axes[0, 0].spines['bottom'].set_visible(False)
-        axes[0, 0].grid(True, linestyle='--', alpha=0.6)
-        
-        axes[0, 1].plot(subset['STARTED'], subset['MDBF_Arousal_Score'], marker='o', color='#aec7e8', linewidth=2, markersize=8, alpha=0.8)
-        axes[0, 1].axhline(4, color='black', linewidth=1)
-        axes[0, 1].set_title('Wachheit-Müdigkeit', fontsize=14)
-        axes[0, 1].set_xlabel('Wochentag', fontsize=12)
-        axes[0, 1].set_ylabel('Level', fontsize=12)
-        axes[0, 1].set_ylim(1, 7)
-        axes[0, 1].spines['bottom'].set_visible(False)
-        axes[0, 1].grid(True, linestyle='--', alpha=0.6)
-        
-        axes[1, 0].plot(subset['STARTED'], subset['MDBF_Calmness_Score'], marker='o', color='#ff7f0e', linewidth=2, markersize=8, alpha=0.8)
-        axes[1, 0].axhline(4, color='black', linewidth=1)
-        axes[1, 0].set_title('Ruhe-Unruhe', fontsize=14)
-        axes[1, 0].set_xlabel('Wochentag', fontsize=12)
-        axes[1, 0].set_ylabel('Level', fontsize=12)
-        axes[1, 0].set_ylim(1, 7)
-        axes[1, 0].spines['bottom'].set_visible(False)
-        axes[1, 0].grid(True, linestyle='--', alpha=0.6)
-        
-        axes[1, 1].plot(subset['STARTED'], subset['PSS4_Score'], marker='o', color='#ffbb78', linewidth=2, markersize=8, alpha=0.8)
-        axes[1, 1].set_title('Stresslevel', fontsize=14)
-        axes[1, 1].set_xlabel('Wochentag', fontsize=12)
-        axes[1, 1].set_ylabel('Level', fontsize=12)
-        axes[1, 1].set_ylim(0, 16) 
-        axes[1, 1].grid(True, linestyle='--', alpha=0.6)
-        
-        # Customize x-axis labels to show only the day
-        # Adjust for all subplots
-        weekdays = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag', 'Samstag', 'Sonntag']
-        days = weekdays + weekdays
-        
-        for ax in axes.flat:
-            ax.set_xticks(subset['STARTED'])
-            ax.set_xticklabels(days, rotation=45, ha='right')
-            ax.spines['top'].set_visible(False)
-            ax.spines['right'].set_visible(False)
-        
-        fig2.suptitle(f'Verlauf der Befindlichkeit und des Stresslevel', fontsize=18, fontweight='bold')
-        plt.tight_layout(pad=3.0, rect=[0, 0, 1, 0.96]) 
-        
-        # Save the line graph
-        file_path = os.path.join(output_dir, f'line_graph_{unique_id}.png')
-        fig2.savefig(file_path, facecolor='white')
-        plt.close(fig2) 
-
-        break
-
-def create_heatmap(data: pd.DataFrame, output_dir: str):
+    index = index if index is not None else ParticipantIndex(data)
+    for unique_id, subset in index:
+        render_participant(index, unique_id, [], output_dir, ['line_graph'])
+
+def create_heatmap(data: pd.DataFrame, output_dir: str, index: ParticipantIndex = None):
     """
     Creates and saves a heatmap for the MDBF values over time for every participant.
-    
+
     Parameters:
     - data (pd.DataFrame): The input DataFrame containing the data.
     - output_dir (str): Directory where the heatmap will be saved.
+    - index (ParticipantIndex): Optional participant index of the data, built if not given.
     """
+    index = index if index is not None else ParticipantIndex(data)
+    for unique_id, subset in index:
+        render_participant(index, unique_id, [], output_dir, ['heatmap'])
 
-    # Unique IDs in the SERIAL column
-    unique_ids = data['SERIAL'].unique()
-    
-    for unique_id in unique_ids:
-        # Filter data for the current ID
-        subset = data[data['SERIAL'] == unique_id]
-       
-        # Ensure the subset has more than one row for plotting
-        if subset.shape[0] <= 1:
-            continue
-    
-
-        # Pivot the data so that each SERIAl becomes the columns and the three MDBF values become the rows
-        pivot_data = subset.pivot(index='STARTED', columns='SERIAL', values=['MDBF_Valence_Score', 'MDBF_Arousal_Score', 'MDBF_Calmness_Score'])
-
-        # Sort by date
-        pivot_data = pivot_data.sort_index()
-
-        # Create the heatmap
-        plt.figure(figsize=(12, 6))
-        sns.heatmap(pivot_data.T, cmap='RdYlGn', cbar_kws={'label': 'Wert'}, annot=True, fmt=".1f")
+def create_diverging_bar_chart(data: pd.DataFrame, topics_columns: list, output_dir: str, index: ParticipantIndex = None):
+    """
+    Creates and saves a diverging bar chart of the MDBF Valence score for the four most mentioned topics for every participant.
 
-        # Set the title and labels
-        plt.title(f'Ausprägung der Befindlichkeitswerte', fontsize=18)
-        plt.xlabel('Wochentag', fontsize=14)
-        plt.ylabel('Befindlichkeitswerte', fontsize=14)
-        #days_months = subset['STARTED'].dt.strftime('%d-%m')
-        weekdays = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag', 'Samstag', 'Sonntag']
-        days = weekdays + weekdays 
-        midpoints_x = [i - 0.5 for i in range(1, len(days) + 1)]
-        plt.xticks(ticks=midpoints_x, labels=days, rotation=45, ha='right')
-        y_ticks = ['Gute Stimmung -\nSchlechte Stimmung', 'Wachheit -\nMüdigkeit', 'Ruhe -\nUnruhe']
-        
-        # Calculate the midpoints of each row
-        midpoints_y = [i - 0.5 for i in range(1, len(y_ticks) + 1)]
-        plt.yticks(ticks= midpoints_y, labels=y_ticks, rotation=0)
+    Parameters:
+    - data (pd.DataFrame): The input DataFrame containing the data.
+    - topics_columns (list): List of column names related to topics.
+    - output_dir (str): Directory where the diverging bar chart will be saved.
+    - index (ParticipantIndex): Optional participant index of the data, built if not given.
+    """
+    index = index if index is not None else ParticipantIndex(data)
+    for unique_id, subset in index:
+        render_participant(index, unique_id, topics_columns, output_dir, ['diverging_barchart'])
 
-        # Add text next to the color bar to explain the extremas
-        cbar = plt.gcf().axes[-1]  # Get the color bar axis
-        cbar.text(2.8, 0.04, 'Schlecht Stimmung\nMüdigkeit\nUnruhe', ha='left', va='center', transform=cbar.transAxes, fontsize=12)
-        cbar.text(2.8, 0.96, 'Gute Stimmung\nWachheit\nRuhe', ha='left', va='center', transform=cbar.transAxes, fontsize=12)
+def plot_forcegraph(data: pd.DataFrame, topics_columns: list, output_dir: str, index: ParticipantIndex = None):
+    """
+    Creates and saves a force-directed graph showing the relationships between topics und MDBF values for every participant.
 
-        plt.tight_layout()
+    Parameters:
+    - data (pd.DataFrame): The input DataFrame containing the data.
+    - topics_columns (list): List of column names related to topics.
+    - output_dir (str): Directory where the force-directed graph will be saved.
+    - index (ParticipantIndex): Optional participant index of the data, built if not given.
+    """
+    index = index if index is not None else ParticipantIndex(data)
+    for unique_id, subset in index:
+        render_participant(index, unique_id, topics_columns, output_dir, ['forcegraph'])
+
+# Per-participant chart functions returning the figure, keyed by the prefix of their output files
+CHARTS = {
+    'pie_chart': _pie_chart,
+    'line_graph': _line_graph,
+    'heatmap': _heatmap,
+    'diverging_barchart': _diverging_bar_chart,
+    'forcegraph': _forcegraph,
+}
+
+# Options for saving the figure of each chart
+SAVE_OPTIONS = {
+    'pie_chart': {'facecolor': 'white'},
+    'line_graph': {'facecolor': 'white'},
+    'heatmap': {},
+    'diverging_barchart': {'facecolor': 'white'},
+    'forcegraph': {},
+}
+
+# Charts rendered by create_visualizations (the force graph is currently disabled)
+DEFAULT_CHARTS = ['pie_chart', 'line_graph', 'heatmap', 'diverging_barchart']
+
+# Columns each chart reads and whether it also reads the topic mask, used to detect changed input
+CHART_INPUTS = {
+    'pie_chart': ([], True),
+    'line_graph': (['STARTED', 'MDBF_Valence_Score', 'MDBF_Arousal_Score', 'MDBF_Calmness_Score', 'PSS4_Score'], False),
+    'heatmap': (['STARTED'] + HEATMAP_SCORES, False),
+    'diverging_barchart': (['STARTED', 'MDBF_Valence_Score'], True),
+    'forcegraph': (['MDBF_Valence_Score', 'MDBF_Arousal_Score', 'MDBF_Calmness_Score'], True),
+}
+
+# Version of each chart's code and style, bump it when a chart changes so that the cached images are recreated
+CHART_VERSIONS = {
+    'pie_chart': 2,
+    'line_graph': 6,
+    'heatmap': 5,
+    'diverging_barchart': 6,
+    'forcegraph': 3,
+}
+
+def chart_columns(chart: str, topics_columns: list) -> list:
+    """
+    Returns the columns a chart reads.
 
-        # Save the heatmap
-        file_path = os.path.join(output_dir, f'heatmap_{unique_id}.png')
-        plt.savefig(file_path)
-        plt.close()
+    Parameters:
+    - chart (str): Name of the chart (key of CHARTS).
+    - topics_columns (list): List of column names related to topics.
 
-        break
+    Returns:
+    - list: The column names, the topics are read from the topic mask.
+    """
+    columns, uses_topics = CHART_INPUTS[chart]
+    return columns + [TOPIC_MASK_COLUMN] if uses_topics else list(columns)
 
-def create_diverging_bar_chart(data: pd.DataFrame, topics_columns: list, output_dir: str):
+def chart_inputs(charts: list, topics_columns: list, profile: str = DEFAULT_PROFILE) -> dict:
     """
-    Creates and saves a diverging bar chart of the MDBF Valence score for the four most mentioned topics for every participant.
-    
+    Returns the columns and versions of several charts, the input of RenderCache.fingerprints.
+
     Parameters:
-    - data (pd.DataFrame): The input DataFrame containing the data.
+    - charts (list): Names of the charts (keys of CHARTS).
     - topics_columns (list): List of column names related to topics.
-    - output_dir (str): Directory where the diverging bar chart will be saved.
+    - profile (str): Name of the image profile (key of image_writer.IMAGE_PROFILES).
+
+    Returns:
+    - dict: Dictionary with the chart names as keys and the columns and the version of every chart as values.
     """
-    # Unique IDs in the SERIAL column
-    unique_ids = data['SERIAL'].unique()
-    
-    for unique_id in unique_ids:
-        # Filter data for the current ID
-        subset = data[data['SERIAL'] == unique_id]
-        # Get the four most mentioned topics
-        # TODO: what if several topics have same count?
-        topics_data = subset[topics_columns].eq(2).sum()
-        top_topics = topics_data.sort_values(ascending=False).head(4).index
-
-
-        # Filter the data for the top topics
-        subset = subset[['STARTED', 'MDBF_Valence_Score'] + list(top_topics)]
-
-        color_positive = '#ff7f0e'  # if topic was used
-        color_negative = '#1f77b4'  
-        
-
-        # create four subplots with barchart for every topic in top_topics, if the value is 2 plot the Valence score, else use zero
-        fig, axs = plt.subplots(2, 2, figsize=(12, 8), facecolor='white')
-        fig.suptitle(f'Gute-Schlechte Stimmung für die 4 häufigsten Topics', fontsize=18, fontweight='bold')
-        for i, topic in enumerate(top_topics):
-            row = i // 2
-            col = i % 2
-            ax = axs[row, col]
-            colors = [color_positive if value == 2 else color_negative for value in subset[topic]]
-            centered_values = subset['MDBF_Valence_Score'] - 4 # MDBF can range from 1 to 7, so center around 4
-            ax.bar(subset['STARTED'], centered_values , color=colors, edgecolor='black')
-            ax.axhline(0, color='black', linewidth=1)
-            ax.set_ylim(-3, 3)
-            # change y-axis values to represent original MDBF values
-            ax.set_yticks([-3, -2, -1, 0, 1, 2, 3])
-            ax.set_yticklabels(['1', '2', '3', '4', '5', '6', '7'])
-            ax.set_xlabel('Wochentag', fontsize=12)
-            ax.set_ylabel('Stimmung', fontsize=12)
-            ax.tick_params(axis='x', labelsize=10)
-            ax.spines['top'].set_visible(False)
-            ax.spines['right'].set_visible(False)
-            ax.grid(True, linestyle='--', alpha=0.6)
-            days_months = subset['STARTED'].dt.strftime('%d-%m')
-            ax.set_xticks(subset['STARTED'])
-            weekdays = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag', 'Samstag', 'Sonntag']
-            days = weekdays + weekdays
-            ax.set_xticklabels(days, rotation=45, ha='right')
-            ax.set_title(f'{topic.split("_")[1]}', fontsize=14, fontweight='bold')
-        # Create custom legend handles
-        legend_handles = [
-            mpatches.Patch(color=color_positive, label='Erwähnt'),
-            mpatches.Patch(color=color_negative, label='Nicht erwähnt')
-        ]
+    return {chart: (chart_columns(chart, topics_columns), chart_version(chart, profile)) for chart in charts}
 
-        # Add the custom legend to the plot
-        fig.legend(handles=legend_handles, fontsize=12)
-        plt.tight_layout(pad=3.0)
-        plt.subplots_adjust(top=0.9)
+def chart_version(chart: str, profile: str = DEFAULT_PROFILE) -> str:
+    """
+    Returns the version of a chart's images for the render cache: the version of the chart code and the
+    image profile, so that the images are recreated when either changes.
 
-        # Save the diverging bar chart
-        file_path = os.path.join(output_dir, f'diverging_barchart_{unique_id}.png')
-        plt.savefig(file_path, facecolor='white')
-        plt.close()
+    Parameters:
+    - chart (str): Name of the chart (key of CHARTS).
+    - profile (str): Name of the image profile (key of image_writer.IMAGE_PROFILES).
 
-        break
+    Returns:
+    - str: The version.
+    """
+    return f'{CHART_VERSIONS[chart]}-{profile}'
 
-def calculate_mean_mdbf_scores(data: pd.DataFrame, topics_columns: list):
+def render_participant(index: ParticipantIndex, unique_id: str, topics_columns: list, output_dir: str, charts: list = None, in_memory: bool = False, timings: list = None, save_figure=None, writer: ImageWriter = None) -> dict:
     """
-    Calculates the mean MDBF scores for each topic.
-    
+    Creates the plots for a single participant, using the participant index instead of scanning the whole data.
+
     Parameters:
-    - data (pd.DataFrame): The input DataFrame containing the data from one individual participant.
+    - index (ParticipantIndex): Participant index of the data.
+    - unique_id (str): The SERIAL of the participant.
     - topics_columns (list): List of column names related to topics.
-    
+    - output_dir (str): Directory where the plots will be saved.
+    - charts (list): Names of the charts to create (keys of CHARTS), defaults to DEFAULT_CHARTS.
+    - in_memory (bool): Return the images instead of saving them to output_dir.
+    - timings (list): Optional list, a (unique_id, chart, seconds) tuple with the time to draw and rasterize
+      is appended for every chart.
+    - save_figure (callable): Optional function called with the chart name and the figure, it saves the figure
+      instead of the image (e.g. as page of a PDF).
+    - writer (ImageWriter): Optional writer that encodes and writes the images in the background, defaults
+      to writing them in the current thread with the standard profile. The images in output_dir may still
+      be written when the function returns, see ImageWriter.close.
+
     Returns:
-    - mean_scores (dict): Dictionary with topics as keys and a tuple of mean MDBF scores as values.
+    - images (dict): Dictionary with the chart names as keys and the encoded images (bytes) as values,
+      only filled if in_memory is True. Charts that were skipped are missing.
+    """
+    writer = writer if writer is not None else ImageWriter(threads=0)
+    subset = index.get(unique_id)
+    topic_moods = index.topic_moods(unique_id, topics_columns)
+    days = index.days(unique_id)
+    images = {}
+    extension = image_extension(writer.profile)
+    for chart in (charts if charts is not None else DEFAULT_CHARTS):
+        start_time = time.perf_counter() if timings is not None else None
+        try:
+            fig = CHARTS[chart](subset, unique_id, topics_columns, topic_moods, days)
+        except Exception:
+            # A template may be left half-filled, the next participant gets new ones
+            clear_templates()
+            raise
+        if fig is None:
+            continue
+        try:
+            if save_figure is not None:
+                save_figure(chart, fig)
+            elif in_memory:
+                images[chart] = writer.submit(fig, unique_id, chart, **SAVE_OPTIONS[chart])
+            else:
+                writer.submit(fig, unique_id, chart, chart_file_path(output_dir, chart, unique_id, extension), **SAVE_OPTIONS[chart])
+        finally:
+            # The figures are not managed by pyplot; a figure of this participant only is freed right away
+            # instead of waiting for the garbage collector, reused templates are kept
+            release_figure(fig)
+        if timings is not None:
+            timings.append((unique_id, chart, time.perf_counter() - start_time))
+    # The charts of the participant are encoded while the next ones are drawn
+    return {chart: future.result() for chart, future in images.items()}
+
+def _render_shard(shard: pd.DataFrame, plan: dict, topics_columns: list, output_dir: str, on_rendered=None, write_images: bool = True, timed: bool = False, render=None, profile: str = DEFAULT_PROFILE, image_threads: int = IMAGE_WRITER_THREADS, on_finished=None) -> tuple:
+    """
+    Creates the plots for all participants in a shard of the data and collects the errors instead of raising them.
+    Used by render_plan, both directly and in the worker processes.
+
+    Parameters:
+    - shard (pd.DataFrame or ParticipantStore): The rows of the participants to plot.
+    - plan (dict): Dictionary with the SERIALs as keys and the names of the charts to create as values.
+    - topics_columns (list): List of column names related to topics.
+    - output_dir (str): Directory where the plots will be saved.
+    - on_rendered (callable): Optional function called with the SERIAL and the in-memory PNG images of every participant.
+    - write_images (bool): Save the images to output_dir, can only be turned off together with on_rendered.
+    - timed (bool): Measure the render time of every chart.
+    - render (callable): Optional function that creates the outputs of a participant instead, see render_plan.
+    - profile (str): Name of the image profile (key of image_writer.IMAGE_PROFILES).
+    - image_threads (int): Number of threads that encode and write the images.
+    - on_finished (callable): Optional function without arguments called after the last participant, see render_plan.
 
+    Returns:
+    - failures (dict): Dictionary with the SERIALs that failed as keys and the error message as values.
+    - timings (list): The (unique_id, chart, seconds) render, encode and write times, empty if not timed.
+    """
+    index = ParticipantIndex(shard) if isinstance(shard, pd.DataFrame) else shard
+    failures = {}
+    timings = [] if timed else None
+    writer = ImageWriter(profile, image_threads, timings=timings)
+    extension = image_extension(profile)
+    for unique_id in index.serials:
+        if unique_id not in plan:
+            continue
+        try:
+            if render is not None:
+                render(index, unique_id, topics_columns, plan[unique_id], timings)
+                continue
+
+            if on_rendered is None:
+                render_participant(index, unique_id, topics_columns, output_dir, plan[unique_id], timings=timings, writer=writer)
+                continue
+
+            images = render_participant(index, unique_id, topics_columns, output_dir, plan[unique_id], in_memory=True, timings=timings, writer=writer)
+            if write_images:
+                for chart, image in images.items():
+                    with open(chart_file_path(output_dir, chart, unique_id, extension), 'wb') as f:
+                        f.write(image)
+            on_rendered(unique_id, images)
+        except Exception as e:
+            failures[unique_id] = f"{type(e).__name__}: {e}"
+    # Wait for the images still in the queue, a participant whose images could not be written failed as well
+    for unique_id, error in writer.close().items():
+        failures.setdefault(unique_id, error)
+    if on_finished is not None:
+        on_finished()
+    return failures, timings or []
+
+def _shards(index: ParticipantIndex, unique_ids: list, n_shards: int):
     """
-    # calculate the mean scores for each topic for all MDBF scores  
-    mean_scores = {}
+    Splits participants into blocks of consecutive participants.
 
-    # Iterate through each topic
-    for topic in topics_columns:
-        # Filter the rows where the topic are mentioned
-        topic_filtered_data = data[data[topic] == 2]
-        
-        # Calculate the mean scores for the MDBF columns
-        if not topic_filtered_data.empty:
-            mean_valence = topic_filtered_data['MDBF_Valence_Score'].mean()
-            mean_arousal = topic_filtered_data['MDBF_Arousal_Score'].mean()
-            mean_calmness = topic_filtered_data['MDBF_Calmness_Score'].mean()
-            
-            # Store the results in the dictionary
-            mean_scores[topic] = (mean_valence, mean_arousal, mean_calmness)
-        else:
-            # If topic was not mentioned, store NaN values
-            mean_scores[topic] = (float('nan'), float('nan'), float('nan'))
+    Parameters:
+    - index (ParticipantIndex or ParticipantStore): Participant index of the data.
+    - unique_ids (list): The SERIALs of the participants, in index order.
+    - n_shards (int): Number of blocks.
 
-    return mean_scores
+    Returns:
+    - generator of (list, pd.DataFrame or ParticipantStore): The SERIALs and the rows of the participants of each block
+      (for a ParticipantStore the rows are read by the worker).
+    """
+    for block in np.array_split(np.arange(len(unique_ids)), n_shards):
+        if len(block) == 0:
+            continue
+        block_ids = [unique_ids[i] for i in block]
+        yield block_ids, index.take(block_ids)
 
-def plot_forcegraph(data: pd.DataFrame, topics_columns: list, output_dir: str):
+def render_plan(index: ParticipantIndex, plan: dict, topics_columns: list, output_dir: str, workers: int = 1, on_rendered=None, write_images: bool = True, timings: list = None, render=None, profile: str = DEFAULT_PROFILE, image_threads: int = IMAGE_WRITER_THREADS, on_finished=None) -> dict:
     """
-    Creates and saves a force-directed graph showing the relationships between topics und MDBF values for every participant.
-    
+    Creates the planned plots, either in the current process or split into shards that are rendered in a process pool.
+    Every worker only receives the rows of its own participants (or reads them from a ParticipantStore).
+
     Parameters:
-    - data (pd.DataFrame): The input DataFrame containing the data.
+    - index (ParticipantIndex or ParticipantStore): Participant index of the data.
+    - plan (dict): Dictionary with the SERIALs as keys and the names of the charts to create as values.
     - topics_columns (list): List of column names related to topics.
-    - output_dir (str): Directory where the force-directed graph will be saved.
+    - output_dir (str): Directory where the plots will be saved.
+    - workers (int): Number of worker processes, 1 renders everything in the current process.
+    - on_rendered (callable): Optional function called with the SERIAL and the in-memory images of every participant.
+      It is called in the worker processes, so it has to be picklable (e.g. a module level function or a functools.partial).
+    - write_images (bool): Save the images to output_dir, can only be turned off together with on_rendered.
+    - timings (list): Optional list, the (unique_id, chart, seconds) render time of every chart is appended,
+      and the encode and write times of its image as '<chart> encode' and '<chart> write'.
+    - render (callable): Optional function that creates all outputs of a participant instead of the images,
+      called with the participant index, the SERIAL, topics_columns, the names of the charts and the timings list
+      (None if not timed). It is called in the worker processes, so it has to be picklable.
+    - profile (str): Name of the image profile (key of image_writer.IMAGE_PROFILES).
+    - image_threads (int): Number of threads per process that encode and write the images, 0 writes them
+      in the rendering thread.
+    - on_finished (callable): Optional function without arguments called in the rendering process after the
+      last participant of every shard, e.g. to close files that on_rendered or render wrote to. It has to be picklable.
+
+    Returns:
+    - failures (dict): Dictionary with the SERIALs that failed as keys and the error message as values.
+    """
+    if on_rendered is None and render is None and not write_images:
+        raise ValueError("The images can only be skipped if they are passed to on_rendered.")
+
+    timed = timings is not None
+    if workers <= 1 or len(plan) <= 1:
+        failures, shard_timings = _render_shard(index, plan, topics_columns, output_dir, on_rendered, write_images, timed, render, profile, image_threads, on_finished)
+        if timed:
+            timings.extend(shard_timings)
+        return failures
+
+    failures = {}
+    unique_ids = [unique_id for unique_id in index.serials if unique_id in plan]
+    # Several shards per worker, so that a slow shard does not leave the other workers idle
+    n_shards = min(len(unique_ids), workers * 4)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_render_shard, shard, {unique_id: plan[unique_id] for unique_id in block_ids}, topics_columns, output_dir, on_rendered, write_images, timed, render, profile, image_threads, on_finished)
+            for block_ids, shard in _shards(index, unique_ids, n_shards)
+        ]
+        for future in futures:
+            shard_failures, shard_timings = future.result()
+            failures.update(shard_failures)
+            if timed:
+                timings.extend(shard_timings)
+    return failures
+
+def report_failures(failures: dict, total: int, outputs: str = 'Plots'):
     """
-    unique_ids = data['SERIAL'].unique()
-    
-    for unique_id in unique_ids:
-        subset = data[data['SERIAL'] == unique_id]
-
-        mean_scores = calculate_mean_mdbf_scores(subset, topics_columns)
-    
-        G = nx.Graph()
-        
-        # Add nodes for MDBF scores
-        G.add_node('Gute Stimmung', color='lightcoral', size=4000)
-        G.add_node('Wachheit', color='lightgreen', size=4000)
-        G.add_node('Ruhe', color='lightblue', size=4000)
-        
-        # Add nodes and edges for each topic
-        for topic in topics_columns:
-            
-            # Get the mean scores for this topic
-            mean_valence, mean_arousal, mean_calmness = mean_scores[topic]
-
-            # Check if any of the scores for this topic are non-NaN
-            if pd.notna(mean_valence) or pd.notna(mean_arousal) or pd.notna(mean_calmness):
-                # add topic node but remove 'Topics_' from the column names
-                G.add_node(topic.split('_')[1], color='lightgray', size=2000)
-            
-                # Add edges between the topic and the MDBF scores
-                if pd.notna(mean_valence):
-                    G.add_edge('Gute Stimmung', topic.split('_')[1], weight=mean_valence)
-                if pd.notna(mean_arousal):
-                    G.add_edge('Wachheit', topic.split('_')[1], weight=mean_arousal)
-                if pd.notna(mean_calmness):
-                    G.add_edge('Ruhe', topic.split('_')[1], weight=mean_calmness)
-
-        # Draw the graph using NetworkX's spring layout (force-directed)
-        pos = nx.spring_layout(G, k=0.5, iterations=50)
-        
-        # Draw the graph
-        plt.figure(figsize=(10, 8))
-        node_colors = [G.nodes[node]['color'] for node in G.nodes()]
-        node_sizes = [G.nodes[node]['size'] for node in G.nodes()]
-        
-        # Normalize edge weights for better visualization
-        edge_weights = [G[u][v]['weight'] for u, v in G.edges()]
-       
-        nx.draw(
-            G, pos, with_labels=True, node_color=node_colors, node_size=node_sizes,
-            font_size=12, width=edge_weights, edge_color='gray', edge_cmap=plt.cm.Blues
-        )
-        
-        # Save the graph
-        plt.title(f"Topic und Befindlichkeits-Graph für ID {unique_id}")
-        file_path = os.path.join(output_dir, f'forcegraph_{unique_id}.png')
-        plt.savefig(file_path)
-        plt.close()
-
-        break
-
-def create_visualizations(data: pd.DataFrame, topics_columns: list, output_dir: str):
+    Prints the participants whose plots (or other outputs) could not be created.
+
+    Parameters:
+    - failures (dict): Dictionary with the SERIALs that failed as keys and the error message as values.
+    - total (int): Number of participants.
+    - outputs (str): Name of the outputs for the message.
+    """
+    if failures:
+        print(f"{outputs} could not be created for {len(failures)} of {total} participants:")
+        for unique_id, error in failures.items():
+            print(f"- ID {unique_id}: {error}")
+
+def create_visualizations(data: pd.DataFrame, topics_columns: list, output_dir: str, charts: list = None, workers: int = 1, cache=None, timings: list = None, profile: str = DEFAULT_PROFILE, image_threads: int = IMAGE_WRITER_THREADS) -> dict:
     """
     Creates all plots for the individual participants
-    - pie charts 
+    - pie charts
     - line graphs
-    
+    - heatmaps
+    - diverging bar charts
+
+    The data is grouped by participant once and every chart reads the rows of a participant from this index.
+    With more than one worker the participants are split into shards that are rendered in a process pool;
+    every worker only receives the rows of its own participants.
+    The images are encoded and written by background threads while the next charts are drawn, with the
+    resolution, format and compression of an image profile.
+    With a render cache only the plots whose input rows changed since the last run are recreated.
+    Errors of single participants are collected and reported instead of stopping the whole batch.
+
     Parameters:
-    - data (pd.DataFrame): The input DataFrame containing the data.
+    - data (pd.DataFrame or ParticipantStore): The input DataFrame containing the data, or the data partitioned
+      on disk by participant (see participant_store.partition_data), which is read one participant at a time.
     - topics_columns (list): List of column names related to topics.
     - output_dir (str): Directory where the plots will be saved.
+    - charts (list): Names of the charts to create (keys of CHARTS), defaults to DEFAULT_CHARTS.
+    - workers (int): Number of worker processes, 1 renders everything in the current process.
+    - cache (RenderCache): Optional render cache of the output directory.
+    - timings (list): Optional list, the (unique_id, chart, seconds) render, encode and write times are appended.
+    - profile (str): Name of the image profile (key of image_writer.IMAGE_PROFILES).
+    - image_threads (int): Number of threads per process that encode and write the images.
+
+    Returns:
+    - failures (dict): Dictionary with the SERIALs that failed as keys and the error message as values.
     """
 
     # Ensure the output directory exists
     os.makedirs(output_dir, exist_ok=True)
 
-    plot_pie_charts(data, topics_columns, output_dir)
-    plot_line_graphs(data, output_dir)
-    create_heatmap(data, output_dir)
-    create_diverging_bar_chart(data, topics_columns, output_dir)
-    #plot_forcegraph(data, topics_columns, output_dir)
\ No newline at end of file
+    index = data if isinstance(data, ParticipantStore) else ParticipantIndex(data)
+    charts = charts if charts is not None else DEFAULT_CHARTS
+    extension = image_extension(profile)
+
+    # Decide which charts have to be created for which participant
+    if cache is not None:
+        fingerprints = cache.fingerprints(index, chart_inputs(charts, topics_columns, profile))
+        plan = {}
+        for unique_id in index.serials:
+            stale = [
+                chart for chart in charts
+                if not cache.is_fresh(chart, unique_id, fingerprints[chart][unique_id], chart_file_path(output_dir, chart, unique_id, extension))
+            ]
+            if stale:
+                plan[unique_id] = stale
+    else:
+        plan = {unique_id: charts for unique_id in index.serials}
+
+    failures = render_plan(index, plan, topics_columns, output_dir, workers, timings=timings, profile=profile, image_threads=image_threads)
+
+    if cache is not None:
+        for unique_id, stale in plan.items():
+            # Failed participants are not stored, so that they are retried on the next run
+            if unique_id in failures:
+                cache.invalidate(stale, [unique_id])
+                continue
+            for chart in stale:
+                cache.update(chart, unique_id, fingerprints[chart][unique_id], chart_file_path(output_dir, chart, unique_id, extension))
+
+    report_failures(failures, len(index))
+
+    return failures